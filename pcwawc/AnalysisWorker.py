@@ -0,0 +1,108 @@
+#!/usr/bin/python3
+# part of https://github.com/WolfgangFahl/play-chess-with-a-webcam
+from pcwawc.Video import VideoStream
+from threading import Thread, Condition, current_thread
+import logging
+import time
+
+
+class AnalysisWorker(object):
+    """ analyze the frames of a video stream in a background thread at a configurable rate independent of the clients
+    watching the video and publish the annotated frames"""
+
+    def __init__(self, videoStream, analyze, fps=None, idleTimeout=0.1, name='AnalysisWorker', logger=None):
+        """ construct me for the given video stream and analyze function that returns the annotated frame
+        with the given maximum number of frames per second (None for every captured frame), the time to wait
+        for a new frame before I consider myself idle and logger for errors"""
+        self.videoStream = videoStream
+        self.video = videoStream.video
+        self.analyze = analyze
+        self.fps = fps
+        self.idleTimeout = idleTimeout
+        self.name = name
+        self.logger = logger if logger is not None else logging.getLogger(__name__)
+        # the latest annotated frame with its capture timestamp and index
+        self.frame = None
+        self.timestamp = None
+        self.index = 0
+        self.readIndex = 0
+        self.condition = Condition()
+        self.thread = None
+        self.stopped = False
+
+    def start(self):
+        # start the thread to analyze the frames
+        self.thread = Thread(target=self.update, name=self.name, args=())
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def process(self, frame):
+        """ analyze the given frame and return the annotated frame - the frame itself if the analysis fails"""
+        self.video.frame = frame
+        try:
+            annotated = self.analyze(frame)
+        except BaseException:
+            self.logger.exception("analysis error")
+            annotated = frame
+        self.video.processedFrame = annotated
+        return annotated
+
+    def nextFrame(self):
+        """ get the next captured frame and its timestamp - the current frame again when pausing - None,None when idle"""
+        # a blocking stream shall not lose any frame - otherwise skip to the latest frame
+        if self.videoStream.policy == VideoStream.BLOCK:
+            frame, timestamp = self.videoStream.read(self.idleTimeout)
+            if frame is not None:
+                return frame, timestamp
+        elif self.videoStream.waitForFrame(self.idleTimeout):
+            return self.videoStream.readLatest()
+        # keep analyzing the current frame while pausing e.g. to show newly clicked warp points
+        if self.video.paused() and self.video.frame is not None:
+            return self.video.frame, self.timestamp
+        return None, None
+
+    def update(self):
+        """ analyze and publish frames until the video stream ends or I am stopped"""
+        while not self.stopped:
+            startTime = time.time()
+            frame, timestamp = self.nextFrame()
+            if frame is None:
+                if self.videoStream.stopped:
+                    break
+                continue
+            annotated = self.process(frame)
+            with self.condition:
+                self.frame = annotated
+                self.timestamp = timestamp
+                self.index += 1
+                self.condition.notify_all()
+                # throttle to the configured rate
+                if self.fps is not None:
+                    delay = 1 / self.fps - (time.time() - startTime)
+                    if delay > 0:
+                        self.condition.wait_for(lambda: self.stopped, delay)
+        self.stop()
+
+    def read(self, timeout=None):
+        """ return the next annotated frame and its capture timestamp waiting at most timeout seconds for it
+        - None,None if there is none"""
+        with self.condition:
+            while self.index <= self.readIndex:
+                if self.stopped or not self.condition.wait(timeout):
+                    return None, None
+            self.readIndex = self.index
+            return self.frame, self.timestamp
+
+    def readLatest(self):
+        """ return the latest annotated frame and its capture timestamp without waiting - None,None if there is none yet"""
+        with self.condition:
+            return self.frame, self.timestamp
+
+    def stop(self, timeout=1.0):
+        # indicate that the thread should be stopped, wake up waiting readers and wait for the thread to finish
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+        if self.thread is not None and self.thread is not current_thread():
+            self.thread.join(timeout)
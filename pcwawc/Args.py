@@ -22,4 +22,10 @@ class Args:
         self.parser.add_argument('--fullScreen',
                             action='store_true',
                             help="Display output in fullScreen mode")
+        self.parser.add_argument('--recalibrate',
+                            action='store_true',
+                            help="recalibrate the stable frame threshold of the input device")
+        self.parser.add_argument('--tracking',
+                            action='store_true',
+                            help="track the corner markers between full board detections")
         self.args = self.parser.parse_args(args)
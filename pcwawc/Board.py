@@ -28,6 +28,15 @@ class Board(object):
     # initialize the board with a default dominator next cell to the right
     def __init__(self, dominatorOffset=(0, -1)):
         self.chessboard = chess.Board()
+        # state version - increased on every change of the chessboard
+        self.version = 0
+        # pgn movetext tokens of the moves - extended on move and truncated on takeback
+        self.pgnTokens = []
+        # the chessboard and moves the tokens have been created for
+        self.pgnBoard = self.chessboard
+        self.pgnMoves = []
+        self.pgn = None
+        self.pgnVersion = None
         self.toPlay = Board.C['w']
         self.dominator = dominatorOffset
         self.fieldsByAn = {}
@@ -71,39 +80,97 @@ class Board(object):
     
     def move(self, ucimove):    
         move = Move.from_uci(ucimove)
-        san = self.chessboard.san(move)
-        self.chessboard.push(move)
+        san = self.pushMove(move)
         if Board.debug:
             print ("move %s" % (ucimove))
             print ("%s" % (self.unicode()))
         return san
     
+    @staticmethod
+    def pgnToken(chessboard, san, first):
+        """ get the pgn movetext token for the move with the given san on the given chessboard with the same move numbers as the pgn StringExporter"""
+        if chessboard.turn == chess.WHITE:
+            return "%d. %s" % (chessboard.fullmove_number, san)
+        elif first:
+            return "%d... %s" % (chessboard.fullmove_number, san)
+        return san
+
+    def pushMove(self, move):
+        """ push the given move to my chessboard and my pgn movetext tokens and return its SAN notation"""
+        san = self.chessboard.san(move)
+        self.pgnTokens.append(Board.pgnToken(self.chessboard, san, not self.pgnTokens))
+        self.pgnMoves.append(move)
+        self.chessboard.push(move)
+        self.version += 1
+        return san
+
     def takeback(self):
         self.chessboard.pop()
+        if self.pgnTokens:
+            self.pgnTokens.pop()
+            self.pgnMoves.pop()
+        self.version += 1
+
+    def changed(self):
+        """ my chessboard has been replaced - reset the pgn movetext tokens"""
+        self.pgnTokens = []
+        self.pgnBoard = self.chessboard
+        self.pgnMoves = []
+        self.version += 1
+
+    def refresh(self):
+        """ bring my pgn movetext tokens and state version up to date e.g. after my chessboard has been modified directly
+        and return my state version"""
+        if self.pgnBoard is not self.chessboard or self.pgnMoves != self.chessboard.move_stack:
+            self.updatePgnTokens()
+        return self.version
+
+    def updatePgnTokens(self):
+        """ update the pgn movetext tokens from the move stack of my chessboard e.g. after it has been modified directly"""
+        chessboard = self.chessboard.root()
+        self.pgnTokens = []
+        for move in self.chessboard.move_stack:
+            self.pgnTokens.append(Board.pgnToken(chessboard, chessboard.san(move), not self.pgnTokens))
+            chessboard.push(move)
+        self.pgnBoard = self.chessboard
+        self.pgnMoves = list(self.chessboard.move_stack)
+        self.version += 1
 
     # get my pgn description
     def getPgn(self):
+        """ get my pgn description - cached for my current state version """
+        self.refresh()
+        if self.pgnVersion == self.version:
+            return self.pgn
         try:
-            game = chess.pgn.Game.from_board(self.chessboard)
-            self.pgn = str(game)
+            # the headers only depend on the starting position and the result
+            game = chess.pgn.Game()
+            game.setup(self.chessboard.root())
+            result = self.chessboard.result()
+            game.headers["Result"] = result
+            self.pgn = str(game)[:-len(result)] + " ".join(self.pgnTokens + [result])
+            self.pgnVersion = self.version
         except BaseException as e:
             print ("pgn error: %s", str(e))    
         return self.pgn
 
     # set my board and game from the given pgn
     def setPgn(self, pgn):
-        self.pgn = pgn
+        # the cached pgn is outdated in any case
+        self.pgnVersion = None
         pgnIo = io.StringIO(pgn)
         game = chess.pgn.read_game(pgnIo)
         if game is None:
             # TODO log a warning
             return
         self.chessboard = game.board()
+        self.changed()
         for move in game.mainline_moves():
-            self.chessboard.push(move)
+            self.pushMove(move)
 
     def setFEN(self, fen):
         self.chessboard = chess.Board(fen)
+        self.changed()
 
     # get my fen description
     def fen(self):
@@ -1,7 +1,11 @@
 #!/usr/bin/python
 # part of https://github.com/WolfgangFahl/play-chess-with-a-webcam
 
+from pcwawc.ChessTrapezoid import SquareChange
+from pcwawc.detectstate import DetectState
 from pcwawc.Field import Field, FieldState
+from pcwawc.RunningStats import ColorStats, MovingAverage, RunningStatsArray
+import numpy as np
 import cv2
 
 
@@ -9,14 +13,36 @@ class BoardDetector:
     """ detect a chess board's state from the given image """
     debug = False
     frameDebug = False
+    # tresholds for the sum of the relative luminance changes of all fields - see DetectState
+    validDiffSumTreshold = 1.4
+    invalidDiffSumTreshold = 4.8
+    diffSumDeltaTreshold = 0.2
+    # number of frames of the moving average of the sum of the luminance changes
+    diffSumMovingAverageLength = 5
 
     # construct me from a board and video
     def __init__(self, board, video,speedup=1):
         self.board = board
         self.video = video
         self.speedup=speedup
-        self.hsv = None
         self.previous=None
+        # sample pixel indices of all fields by geometry
+        self.sampleKey = None
+        self.sampleIndices = None
+        # region of interest pixel indices of all fields by geometry and grid
+        self.roiKey = None
+        self.roiIndices = None
+        # detect moves from the luminance changes of the fields
+        self.detectState = DetectState(BoardDetector.validDiffSumTreshold, BoardDetector.invalidDiffSumTreshold, BoardDetector.diffSumDeltaTreshold)
+        self.resetDetection()
+
+    def resetDetection(self):
+        """ start detecting changes from scratch e.g. after the warp points have changed """
+        self.detectState.reset()
+        self.changeStats = RunningStatsArray((Field.rows, Field.cols))
+        self.diffSumAverage = MovingAverage(BoardDetector.diffSumMovingAverageLength)
+        # fields that have been stable long enough to detect a move
+        self.preMove = np.zeros((Field.rows, Field.cols), dtype=bool)
      
     def genFields(self):
         for row in range(Field.rows):
@@ -51,22 +77,112 @@ class BoardDetector:
             fromIndex=toIndex
         return sortedFields
     
+    def fieldGeometry(self,image):
+        """ get the centers, sizes and bounds of all fields as an array of shape (64,6) - missing bounds are those of the given image"""
+        height, width = image.shape[:2]
+        return np.array([(field.pcx,field.pcy,field.width,field.height,
+                          width if field.maxX is None else field.maxX,
+                          height if field.maxY is None else field.maxY) for field in self.genFields()])
+    
+    def fieldROIIndices(self,image,grid,roiLambda):
+        """ get the flat pixel indices of the regions of interest of all fields as an array of shape (64,rois,xsteps*ysteps)
+        - cached until the image size, the geometry of the fields, the grid parameters or the roiLambda change"""
+        height, width = image.shape[:2]
+        geometry=self.fieldGeometry(image)
+        key=(width,height,geometry.tobytes(),grid.key(),roiLambda)
+        if self.roiKey!=key:
+            rxys=grid.relativePixels(roiLambda)
+            pcx,pcy,fieldWidth,fieldHeight,maxX,maxY=[column[:,None,None] for column in geometry.T]
+            # interpolate like FieldROI.interPolate
+            xs=np.minimum((pcx+fieldWidth*(rxys[:,:,0]-0.5)+0.5).astype(np.intp),np.minimum(maxX,width).astype(np.intp)-1)
+            ys=np.minimum((pcy+fieldHeight*(rxys[:,:,1]-0.5)+0.5).astype(np.intp),np.minimum(maxY,height).astype(np.intp)-1)
+            self.roiIndices=ys*width+xs
+            # the regions of interest of the fields only change with the grid
+            for field in self.genFields():
+                field.divideInROIs(grid,roiLambda)
+            self.roiKey=key
+        return self.roiIndices
+    
     def analyzeFields(self,image,grid,roiLambda):    
-        for field in self.genFields():
-            field.divideInROIs(grid,roiLambda)
-            for roi in field.rois:
-                roi.analyze(image)
+        """ analyze the regions of interest of all fields with one gather of their pixels"""
+        indices=self.fieldROIIndices(image,grid,roiLambda)
+        samples=image.reshape(-1,image.shape[2])[indices.reshape(-1,indices.shape[2])]
+        colorStatsList=ColorStats.ofSamples(samples)
+        rois=[roi for field in self.genFields() for roi in field.rois]
+        for roi,colorStats in zip(rois,colorStatsList):
+            roi.colorStats=colorStats
                     
+    def fieldSampleIndices(self, image, distance, step):
+        """ get the row and column indices of the pixels around the centers of all fields as two (64,k) arrays - cached for the geometry of divideInFields"""
+        height, width = image.shape[:2]
+        key = (width, height, distance, step)
+        if self.sampleKey != key:
+            offsets = np.arange(-distance * step, distance * step + 1, step)
+            # same order as Field.analyzeColor - dx in the outer and dy in the inner loop
+            dx, dy = np.meshgrid(offsets, offsets, indexing='ij')
+            fields = list(self.genFields())
+            pcx = np.array([field.pcx for field in fields])
+            pcy = np.array([field.pcy for field in fields])
+            self.sampleIndices = (pcy[:, None] + dy.ravel(), pcx[:, None] + dx.ravel())
+            self.sampleKey = key
+        return self.sampleIndices
+
     def analyzeColors(self, image, distance=3, step=1):
-        self.hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
-        for field in self.genFields():
-            field.analyzeColor(image, self.hsv, distance, step)
+        """ analyze the colors around the centers of all fields at once """
+        ys, xs = self.fieldSampleIndices(image, distance, step)
+        bgr = image[ys, xs]
+        # convert only the sampled pixels
+        hsv = cv2.cvtColor(bgr, cv2.COLOR_BGR2HSV)
+        hsvStatsList = ColorStats.ofSamples(hsv)
+        rgbStatsList = ColorStats.ofSamples(bgr[:, :, ::-1])
+        for index, field in enumerate(self.genFields()):
+            field.setColorStats(distance, step, hsvStatsList[index], rgbStatsList[index])
+        
+    def detectChanges(self):
+        """ detect the changes of the relative luminance of all fields as analyzed by analyzeColors with my detect state
+        - the same way ChessTrapezoid.detectChanges and ChessTSquare.checkMoved do for the squares"""
+        detectState = self.detectState
+        detectState.nextFrame()
+        fields = list(self.genFields())
+        values = np.array([field.luminance.mean() for field in fields]).reshape(Field.rows, Field.cols) / 255
+        means = self.changeStats.mean()
+        variances = self.changeStats.variance()
+        settled = self.changeStats.n >= SquareChange.meanFrameCount
+        diffs = np.where(settled, values - means, 0)
+        valid = settled & (np.abs(diffs) < SquareChange.treshold)
+        # fields that have not settled yet take every value into their statistics
+        self.changeStats.push(values, ~settled)
+        diffSum = float(np.abs(diffs).sum())
+        self.diffSumAverage.push(diffSum)
+        diffSumDelta = self.diffSumAverage.mean() - diffSum
+        detectState.check(int(np.count_nonzero(valid)), diffSum, diffSumDelta, SquareChange.meanFrameCount)
+        if detectState.validBoard:
+            # if we come from a stable invalid period then the changed fields are likely a move
+            if detectState.invalidStable:
+                moved = self.preMove & ~valid
+                for field in fields:
+                    row, col = field.row, field.col
+                    if moved[row, col]:
+                        field.currentChange = SquareChange(values[row, col], self.changeStats.element((row, col)),
+                            means[row, col], variances[row, col], diffs[row, col], False)
+                        if detectState.onPieceMoveDetected is not None:
+                            detectState.onPieceMoveDetected(field)
+                self.changeStats.clear(moved)
+                self.preMove &= ~moved
+            detectState.invalidEnd()
+            self.changeStats.push(values, valid)
+            # we are ready to detect a move if we have been valid for a long enough period of time
+            if detectState.validStable:
+                self.preMove[:] = True
+        elif detectState.invalidStarted:
+            detectState.validEnd()
         
     # analyze the given image
     def analyze(self, image, frameIndex, distance=3, step=1):
         if (frameIndex % self.speedup==0):
             self.divideInFields(image)
             self.analyzeColors(image, distance, step)
+            self.detectChanges()
             sortedFields=self.sortByFieldState()
 
             if BoardDetector.debug:
@@ -3,14 +3,14 @@
 
 # Global imports
 from pcwawc.Video import Video
-from math import sqrt, pi,  degrees
+from math import pi,  degrees
 import cv2
 import numpy as np
 from collections import deque
 import bisect
 
 # Local imports
-from pcwawc.mathUtils import (median, getRotationAndTranslationMatrix, getIndexRange)
+from pcwawc.mathUtils import (median, getRotationAndTranslationMatrix, getIndexRange, distance)
 
 CHESSCAM_PARZEN_THRESHOLD = 5
 CHESSCAM_ORIENTATION_SMOOTHING = 5
@@ -28,6 +28,20 @@ class BoardFinder(object):
     debug = True
     debugShowTime = 1000
     dotHSVRanges = [(70, 120), (85, 255), (0, 255)]
+    # estimate the orientation with a histogram convolution instead of a per slope Parzen window
+    orientationByHistogram = True
+    # bin size of the orientation histogram - the theta resolution of Video.houghTransform
+    orientationResolution = pi / 180
+    # number of times the frame is halved for the hough transform
+    houghPyramidLevels = 0
+    # track the corner markers in search windows around their last coordinates instead of a full detection per frame
+    tracking = False
+    # half size of the search windows in marker sizes
+    trackingWindow = 3
+    # maximum movement of a corner marker in marker sizes before a full re-detection is done
+    trackingTolerance = 1.5
+    # minimum marker size in pixels for the search windows
+    minMarkerSize = 8
 
     # construct me from the given input Image
     def __init__(self, inImage):
@@ -36,6 +50,13 @@ class BoardFinder(object):
         self.height, self.width = self.frame.shape[:2]
         # set initial side
         self.setSide(0)
+        # size of the corner markers in pixels as found by the last full detection
+        self.markerSize = None
+        # True if the coordinates of the last update were tracked
+        self.tracked = False
+        # the reason of the last fall back from tracking to a full detection
+        self.trackingFallback = None
+        self.trackingFallbacks = 0
 
         # Green indicator dot has hue between ~70 and ~120, saturation  between 85 and 255 and Luminosity value between 0 and 255.
         # take a picture or your own dot and calibrate using the commandline option
@@ -79,10 +100,23 @@ class BoardFinder(object):
     def updateImage(self, inFrame):
         """Adds a new image to the boardFinder algorithms.
         This performs an Hough Transform and HSV conversion to the image and
-        computes the orientation and coordinates from these."""
-
+        computes the orientation and coordinates from these.
+        In tracking mode only the surroundings of the corner markers are searched
+        as long as the markers are found there."""
+        self.frame = inFrame
+        if BoardFinder.tracking and self.markerSize is not None:
+            coordinates = self.trackBoardCoordinates()
+            if coordinates is not None:
+                self.tracked = True
+                self.boardCoordinates = coordinates
+                self.smoothCoordinates.appendleft(coordinates)
+                return
+            self.trackingFallbacks += 1
+            if BoardFinder.debug:
+                print ("tracking falls back to a full detection: %s" % self.trackingFallback)
+        self.tracked = False
         if self.frame is not None:
-            self.lines = self.video.houghTransform(self.frame)
+            self.lines = self.video.houghTransform(self.frame, BoardFinder.houghPyramidLevels)
             if BoardFinder.debug:
                 print ("found %d lines" % (self.lines.size))
             self.BoardOrientation = self.DetectBoardOrientation()
@@ -101,7 +135,29 @@ class BoardFinder(object):
 
         # https://answers.opencv.org/question/2966/how-do-the-rho-and-theta-values-work-in-houghlines/
         # get the theta values
-        slopes = sorted([line[0][1] for line in self.lines])
+        thetas = np.asarray(self.lines).reshape(-1, 2)[:, 1]
+        if BoardFinder.orientationByHistogram:
+            angles = self.histogramOrientation(thetas)
+        else:
+            angles = self.parzenOrientation(thetas)
+        if angles is None:
+            return (None, None)
+        MaximumChanceAngle, MaximumChanceAngle2 = angles
+
+        retValue = sorted([MaximumChanceAngle, -abs(MaximumChanceAngle2)],
+                          key=lambda x: abs(x))
+
+        if BoardFinder.debug:
+            print ("Boardorientation %f.2° - %f.2°" % (degrees(retValue[0]), degrees(retValue[1])))
+        # Record return value for smoothing purposes
+        self.smoothOrientation.appendleft(retValue)
+        return retValue
+
+    def parzenOrientation(self, thetas):
+        """get the two dominant angles of the given hough thetas with a Parzen window per distinct slope
+
+        Returns: 2-tuple of the angles or None if none were found"""
+        slopes = sorted(thetas.tolist())
         # Parzen window (KernelDensityEstimator) using a Rect function, comonly named a moving average
         # Perform frequence to time conversion, signal analysis FTW
         # KernelSize is the dynamic range kernel size (bin length)
@@ -115,7 +171,7 @@ class BoardFinder(object):
                 KDE[slope] = endElement - beginElement
         bins = sorted(KDE.items())
         if len(bins) <= 0:
-            return (None, None)
+            return None
 
         # Let's find the maximum number of lines in this range
         angleMostOftenDetected = max(bins, key=lambda x: x[1])
@@ -132,16 +188,50 @@ class BoardFinder(object):
             MaximumChanceAngle2 = median([a[0] for a in bins if a[1] == otherAngle[1] and abs(a[0] - otherAngle[0]) < KernelSize])
         except:
             # TODO: Don't write generic excepts!!!
-            return (None, None)
+            return None
+        return MaximumChanceAngle, MaximumChanceAngle2
 
-        retValue = sorted([MaximumChanceAngle, -abs(MaximumChanceAngle2)],
-                          key=lambda x: abs(x))
+    def histogramOrientation(self, thetas):
+        """get the two dominant angles of the given hough thetas by convolving a fixed resolution histogram
+        with the rectangular kernel of the Parzen window
 
+        Returns: 2-tuple of the angles or None if none were found"""
+        KernelSize = pi / 64.
+        resolution = BoardFinder.orientationResolution
+        if len(thetas) == 0:
+            return None
+        binIndices = np.rint(thetas / resolution).astype(np.int64)
+        # fixed number of bins covering [0,pi] so that the histogram is never shorter than the kernel
+        binCount = max(int(np.ceil(pi / resolution)) + 1, binIndices.max() + 1)
+        hist = np.bincount(binIndices, minlength=binCount)
+        # keep the theta of each bin to return the angles as detected
+        binThetas = np.zeros(binCount, dtype=thetas.dtype)
+        binThetas[binIndices] = thetas
+        kernelRadius = int(KernelSize / resolution)
+        density = np.convolve(hist, np.ones(2 * kernelRadius + 1, dtype=np.int64), mode='same')
+        # only bins with lines and more lines than the threshold in the kernel range
+        candidates = np.flatnonzero((hist > 0) & (density > CHESSCAM_PARZEN_THRESHOLD))
+        if len(candidates) == 0:
+            return None
+        candidateThetas = binThetas[candidates]
+        candidateDensity = density[candidates]
+
+        def dominantAngle(mask):
+            # Theil-Sen estimator for noise robustness - median of the equally dominant angles near the peak
+            peak = np.argmax(np.where(mask, candidateDensity, -1))
+            peakTheta = candidateThetas[peak]
+            peakThetas = candidateThetas[(candidateDensity == candidateDensity[peak]) & (np.abs(candidateThetas - peakTheta) < KernelSize)]
+            return peakTheta, median(peakThetas.tolist())
+
+        angleMostOftenDetected, MaximumChanceAngle = dominantAngle(np.ones(len(candidates), dtype=bool))
         if BoardFinder.debug:
-            print ("Boardorientation %f.2° - %f.2°" % (degrees(retValue[0]), degrees(retValue[1])))
-        # Record return value for smoothing purposes
-        self.smoothOrientation.appendleft(retValue)
-        return retValue
+            print ("the most often detected line angle is %d°" % degrees(angleMostOftenDetected))
+        # the second angle needs to differ from the first one
+        otherAngles = np.abs(candidateThetas - angleMostOftenDetected) > 0.2
+        if not otherAngles.any():
+            return None
+        _, MaximumChanceAngle2 = dominantAngle(otherAngles)
+        return MaximumChanceAngle, MaximumChanceAngle2
 
     def GetChessBoardCoordinates(self, rotation):
         """Gets the four points that defines the rectangle where the chessboard
@@ -165,28 +255,24 @@ class BoardFinder(object):
             self.video.showImage(hsv2, "warp", True, BoardFinder.debugShowTime)
         self.hsv = cv2.cvtColor(hsv2, cv2.COLOR_BGR2HSV)
         # Threshold the HSV value according to the cornerMarker being used
-        ht, st, vt = BoardFinder.dotHSVRanges
-        # ignore the Luminosity range
-        self.debugimg = cv2.inRange(self.hsv,
-                                    np.array([ ht[0], st[0], 0], np.uint8),
-                                    np.array([ ht[1], st[1], 255], np.uint8))
-        contours, hierarchy = cv2.findContours(self.debugimg,
-                                               cv2.RETR_TREE,
-                                               cv2.CHAIN_APPROX_SIMPLE)
-        mini, maxi = (self.width, self.height), (0, 0)
-        ur, ll = (0, 0), (0, 0)
-        for cnt in contours:
-            cnt_len = cv2.arcLength(cnt, True)
-            cnt = cv2.approxPolyDP(cnt, 0.01 * cnt_len, True)
-            for a in cnt:
-                if sqrt(a[0][0] ** 2 + a[0][1] ** 2) < sqrt(mini[0] ** 2 + mini[1] ** 2):
-                    mini = (a[0][0], a[0][1])
-                if sqrt((a[0][0] - self.width) ** 2 + (a[0][1] - self.height) ** 2) < sqrt((maxi[0] - self.width) ** 2 + (maxi[1] - self.height) ** 2):
-                    maxi = (a[0][0], a[0][1])
-                if sqrt((a[0][0] - self.width) ** 2 + a[0][1] ** 2) < sqrt((ur[0] - self.width) ** 2 + ur[1] ** 2):
-                    ur = (a[0][0], a[0][1])
-                if sqrt(a[0][0] ** 2 + (a[0][1] - self.height) ** 2) < sqrt(ll[0] ** 2 + (ll[1] - self.height) ** 2):
-                    ll = (a[0][0], a[0][1])
+        self.debugimg = BoardFinder.markerMask(self.hsv)
+        contourPoints, markerSizes = BoardFinder.markerContours(self.debugimg)
+        # the contour points closest to the image corners
+        corners = []
+        cornerMarkerSizes = []
+        for corner, default in (((0, 0), (self.width, self.height)),
+                                ((self.width, 0), (0, 0)),
+                                ((0, self.height), (0, 0)),
+                                ((self.width, self.height), (0, 0))):
+            index = BoardFinder.nearestIndex(contourPoints, corner, default)
+            if index is None:
+                corners.append(default)
+            else:
+                corners.append((contourPoints[index][0], contourPoints[index][1]))
+                cornerMarkerSizes.append(markerSizes[index])
+        mini, ur, ll, maxi = corners
+        # tracking needs all four markers
+        self.markerSize = max(max(cornerMarkerSizes), BoardFinder.minMarkerSize) if len(cornerMarkerSizes) == 4 else None
 
         if BoardFinder.debug:
             self.video.showImage(self.debugimg, "debug image", True, BoardFinder.debugShowTime)
@@ -221,6 +307,91 @@ class BoardFinder(object):
         self.smoothCoordinates.appendleft(retValue)
         return retValue
 
+    def trackBoardCoordinates(self):
+        """Tracks the four corner markers in search windows around their last smoothed coordinates.
+
+        Returns: the board coordinates like GetChessBoardCoordinates or None if a marker was lost or
+                 moved further than the tracking tolerance - self.trackingFallback has the reason then"""
+        rotation = smoothFunc(list(zip(*self.smoothOrientation))[0])
+        rotationMatrix = getRotationAndTranslationMatrix(-rotation, (0, 0))
+        windowSize = int(BoardFinder.trackingWindow * self.markerSize)
+        tolerance = BoardFinder.trackingTolerance * self.markerSize
+        corners = ((0, 0), (self.width, 0), (0, self.height), (self.width, self.height))
+        coordinates = []
+        for cornerIndex, (lastCoordinate, corner) in enumerate(zip(self.smoothedCoordinates(), corners)):
+            lx, ly = int(lastCoordinate[0]), int(lastCoordinate[1])
+            x0, y0 = max(lx - windowSize, 0), max(ly - windowSize, 0)
+            x1, y1 = min(lx + windowSize + 1, self.width), min(ly + windowSize + 1, self.height)
+            if x0 >= x1 or y0 >= y1:
+                self.trackingFallback = "corner marker %d is outside of the image" % cornerIndex
+                return None
+            window = cv2.blur(self.frame[y0:y1, x0:x1], (4, 4))
+            points, markerSizes = BoardFinder.markerContours(BoardFinder.markerMask(cv2.cvtColor(window, cv2.COLOR_BGR2HSV)))
+            if len(points) == 0:
+                self.trackingFallback = "corner marker %d lost" % cornerIndex
+                return None
+            points = points + (x0, y0)
+            # pick the point nearest to the corner of the de-rotated image like GetChessBoardCoordinates
+            derotated = np.dot(points, rotationMatrix[:2, :2].T) + rotationMatrix[:2, 2]
+            index = np.argmin(((derotated - corner) ** 2).sum(axis=1))
+            x, y = points[index]
+            if distance((x, y), lastCoordinate) > tolerance:
+                self.trackingFallback = "corner marker %d drifted by %.1f pixels" % (cornerIndex, distance((x, y), lastCoordinate))
+                return None
+            coordinates.append((float(x), float(y)))
+        self.trackingFallback = None
+        return tuple(coordinates)
+
+    def smoothedCoordinates(self):
+        """get the board coordinates averaged over the last updates"""
+        rectCoordinates = []
+        for groupedCoordinates in zip(*self.smoothCoordinates):
+            smoothDataTmp = [0, 0]
+            for thisCoordinate in groupedCoordinates:
+                smoothDataTmp[0] += thisCoordinate[0]
+                smoothDataTmp[1] += thisCoordinate[1]
+            rectCoordinates.append(tuple([a / float(len(groupedCoordinates)) for a in smoothDataTmp]))
+        return rectCoordinates
+
+    @staticmethod
+    def markerMask(hsv):
+        """get the mask of the corner marker pixels of the given HSV image"""
+        ht, st, vt = BoardFinder.dotHSVRanges
+        # ignore the Luminosity range
+        return cv2.inRange(hsv,
+                           np.array([ ht[0], st[0], 0], np.uint8),
+                           np.array([ ht[1], st[1], 255], np.uint8))
+
+    @staticmethod
+    def markerContours(mask):
+        """get the points of the approximated contours of the given marker mask as an (n,2) array
+        together with the size of the marker each point belongs to"""
+        contours, hierarchy = cv2.findContours(mask,
+                                               cv2.RETR_TREE,
+                                               cv2.CHAIN_APPROX_SIMPLE)
+        approxContours = []
+        sizes = []
+        for cnt in contours:
+            cnt_len = cv2.arcLength(cnt, True)
+            approxContour = cv2.approxPolyDP(cnt, 0.01 * cnt_len, True).reshape(-1, 2)
+            x, y, w, h = cv2.boundingRect(cnt)
+            approxContours.append(approxContour)
+            sizes.append(np.full(len(approxContour), max(w, h)))
+        if len(approxContours) == 0:
+            return np.empty((0, 2), np.int32), np.empty(0, np.int64)
+        return np.concatenate(approxContours), np.concatenate(sizes)
+
+    @staticmethod
+    def nearestIndex(points, corner, default):
+        """get the index of the first of the given points that is nearest to the given corner
+        or None if no point is nearer than the default"""
+        if len(points) > 0:
+            squaredDistances = (points[:, 0].astype(np.int64) - corner[0]) ** 2 + (points[:, 1].astype(np.int64) - corner[1]) ** 2
+            index = np.argmin(squaredDistances)
+            if squaredDistances[index] < (default[0] - corner[0]) ** 2 + (default[1] - corner[1]) ** 2:
+                return index
+        return None
+
     # calibrate the corner dot indicator from the given image
     @staticmethod
     def calibrateCornerMarker(dotImage):
@@ -250,13 +421,7 @@ class BoardFinder(object):
         if rotations == None:
             rotations = [sum(y) / float(len(y)) for y in zip(*self.smoothOrientation)]
         if rectCoordinates == None:
-            rectCoordinates = []
-            for groupedCoordinates in zip(*self.smoothCoordinates):
-                smoothDataTmp = [0, 0]
-                for thisCoordinate in groupedCoordinates:
-                    smoothDataTmp[0] += thisCoordinate[0]
-                    smoothDataTmp[1] += thisCoordinate[1]
-                rectCoordinates.append(tuple([a / float(len(groupedCoordinates)) for a in smoothDataTmp]))
+            rectCoordinates = self.smoothedCoordinates()
 
         points = tuple(rectCoordinates)
 
@@ -71,6 +71,7 @@ class ChessCam(object):
         # cv.ResizeWindow("chessCamDebug", CHESSCAM_WIDTH, CHESSCAM_HEIGHT)
 
         BoardFinder.debug = self.args.debug
+        BoardFinder.tracking = self.args.tracking
         if self.args.cornermarker is not None:
             video = Video()
             cornerMarkerImage = video.readImage(self.args.cornermarker)
@@ -2,12 +2,14 @@
 # part of https://github.com/WolfgangFahl/play-chess-with-a-webcam
 import numpy as np
 import math
+import sys
 from enum import IntEnum
 import cv2
 import chess
 from pcwawc.Video import Video
-from pcwawc.RunningStats import MinMaxStats, MovingAverage
+from pcwawc.RunningStats import MinMaxStats, MovingAverage, RunningStatsArray
 from timeit import default_timer as timer
+from collections import OrderedDict
 
 class Transformation(IntEnum):
     """ Transformation kind"""
@@ -15,6 +17,12 @@ class Transformation(IntEnum):
     IDEAL=1 # e.g. 640x640
     ORIGINAL=2 # whatever the image size is
     
+class Escalation(IntEnum):
+    """ escalation from the coarse to the full resolution in dual resolution detection """
+    NONE=0 # stay at the coarse resolution
+    SQUARES=1 # analyze the changed squares at full resolution
+    FRAME=2 # analyze the whole frame at full resolution
+    
 class ChessTrapezoid:
     """ Chess board Trapezoid (UK) / Trapezium (US) / Trapez (DE)  as seen via a webcam image """
 
@@ -26,6 +34,26 @@ class ChessTrapezoid:
     # default radius of pieces
     PieceRadiusFactor=3
     DiffSumMovingAverageLength=5
+    # number of rendered ideal boards to keep
+    RenderCacheSize=8
+    # number of image sizes to keep the label and square id images for e.g. the coarse and the full resolution board
+    SizeCacheSize=4
+    # color quantization for the render cache key - 1 means exact drawing colors
+    RenderColorQuantization=1
+    # color range factors to be tried by optimizeColorCheck
+    ColorCheckFactors=[x*0.05 for x in range(20,41)]
+    # use the precomputed remap tables instead of warpPerspective for warpedBoardImage - see test_WarpBenchmark
+    WarpWithRemap=True
+    # sample the board sparsely from the original image instead of warping it
+    SparseSampling=False
+    # number of samples per square side in sparse sampling mode e.g. 16x16=256 pixels per square
+    SamplesPerSquareSide=16
+    # size of the coarse board for dual resolution detection
+    CoarseSize=160
+    # escalation to the full resolution if the coarse pass reports changes
+    EscalationPolicy=Escalation.SQUARES
+    # coarse square change that leads to an escalation - None means SquareChange.treshold
+    EscalationTreshold=None
   
     def __init__(self,trapezPoints,idealSize=640,rotation=0,video=None):
         self.rotation=rotation
@@ -56,10 +84,28 @@ class ChessTrapezoid:
         s=idealSize
         self.pts_IdealSquare = np.asarray([[0.0, 0.0], [s, 0.0], [s, s], [0.0, s]],dtype=np.float32)
         self.inverseTransform=cv2.getPerspectiveTransform(pts_dst,self.pts_IdealSquare)
+        # remap tables by board size - built on first use
+        self.warpMapsBySize={}
+        # how often dual resolution detection took which path
+        self.escalationCounts={escalation:0 for escalation in Escalation}
+        # original image coordinates for sparse sampling - built on first use for the image size
+        self.sampleGrid=None
         self.rotation=0
         # dict for average Colors
         self.averageColors={}
+        self.fen=None
+        self.renderCache=RenderCache(ChessTrapezoid.RenderCacheSize)
+        # FieldState label images for color analysis by image size
+        self.labelImages=RenderCache(ChessTrapezoid.SizeCacheSize)
+        # square index images for color checks by image size
+        self.squareIdImages=RenderCache(ChessTrapezoid.SizeCacheSize)
         self.diffSumAverage=MovingAverage(ChessTrapezoid.DiffSumMovingAverageLength)
+        # change statistics of all squares - each square has a view on its element
+        self.changeStats=RunningStatsArray((ChessTrapezoid.rows,ChessTrapezoid.cols))
+        # corners of all squares as seen in the trapez - computed in one batch
+        rows,cols=ChessTrapezoid.rows,ChessTrapezoid.cols
+        rgrid=np.stack(np.meshgrid(np.arange(cols+1)/cols,np.arange(rows+1)/rows),axis=-1)
+        self.trapezGrid=self.relativeToTrapezXYs(rgrid.reshape(-1,2)).reshape(rows+1,cols+1,2)
         # trapezoid representation of squares
         self.tsquares={}
         for square in chess.SQUARES:
@@ -68,9 +114,12 @@ class ChessTrapezoid:
                 print(vars(tsquare))
             self.tsquares[tsquare.square]=tsquare
             
-    def relativeToIdealXY(self,rx,ry):
-        x=int(rx*self.idealSize)
-        y=int(ry*self.idealSize)
+    def relativeToIdealXY(self,rx,ry,size=None):
+        """ convert a relative 0-1 based coordinate to a coordinate in the ideal board of the given size - default is my idealSize """
+        if size is None:
+            size=self.idealSize
+        x=int(rx*size)
+        y=int(ry*size)
         return x,y        
     
     def relativeToTrapezXY(self,rx,ry):
@@ -85,6 +134,12 @@ class ChessTrapezoid:
         xy=xya[0][0]
         x,y=xy[0],xy[1]
         return x,y
+    
+    def relativeToTrapezXYs(self,rxys):
+        """ convert an array of relative 0-1 based coordinates to coordinates in the trapez """
+        rxys=np.asarray(rxys,dtype=np.float32).reshape(1,-1,2)
+        xys=cv2.perspectiveTransform(rxys,self.transform)
+        return xys[0]
 
     def tSquareAt(self,row,col,rotation=0):
         """ get the trapezoid chessboard square for the given row and column"""
@@ -133,14 +188,15 @@ class ChessTrapezoid:
             cv2.circle(image, center, radius, color=color, thickness=thickness)
     
     def drawRCircle(self,image,rcenter,rradius,color,thickness=-1):
-        """ draw a circle with relative coordinates"""
-        radius=int(rradius*self.idealSize)
+        """ draw a circle with relative coordinates onto the given ideal board image"""
+        size=image.shape[1]
+        radius=int(rradius*size)
         rx,ry=rcenter
-        center=self.relativeToIdealXY(rx, ry)
+        center=self.relativeToIdealXY(rx, ry, size)
         self.drawCircle(image,center,radius,color,thickness)
         
     def drawRCenteredText(self,image,text,rx,ry,color=(255,255,255)):
-        x,y=self.relativeToIdealXY(rx, ry)    
+        x,y=self.relativeToIdealXY(rx, ry, image.shape[1])    
         self.video.drawCenteredText(image, text, x, y,fontBGRColor=color)
 
     def maskImage(self,image,mask):
@@ -151,10 +207,14 @@ class ChessTrapezoid:
     def updatePieces(self,fen):
         """ update the piece positions according to the given FEN"""
         self.board=chess.Board(fen)
+        self.fen=fen
         for tsquare in self.genSquares():
             piece = self.board.piece_at(tsquare.square)
             tsquare.piece=piece
             tsquare.fieldState=tsquare.getFieldState()
+        # rendered boards and field state labels of the previous position are outdated
+        self.renderCache.clear()
+        self.labelImages.clear()
 
     def drawFieldStates(self,image,fieldStates,transformation=Transformation.ORIGINAL,channels=3):
         """ draw the states for fields with the given field states e.g. to set the mask image that will filter the trapezoid view according to piece positions when using maskImage"""
@@ -163,10 +223,75 @@ class ChessTrapezoid:
                 if tsquare.fieldState in fieldStates:
                     tsquare.drawState(image,transformation,channels)
 
+    def warpMaps(self,matrix,size):
+        """ get fixed point remap tables for warping with the given perspective matrix to an image of the given size """
+        # the same fixed point arithmetic as in warpPerspective
+        # see https://github.com/opencv/opencv/blob/4.1.2/modules/imgproc/src/imgwarp.cpp (WarpPerspectiveInvoker)
+        ret,M=cv2.invert(matrix)
+        tabSize=cv2.INTER_TAB_SIZE
+        x=np.arange(size,dtype=np.float64)
+        y=np.arange(size,dtype=np.float64)[:,None]
+        W=M[2,1]*y+M[2,2]+M[2,0]*x
+        W=np.divide(tabSize,W,out=np.zeros_like(W),where=W!=0)
+        intLimits=(np.iinfo(np.int32).min,np.iinfo(np.int32).max)
+        XY=np.empty((size,size,2),dtype=np.float64)
+        np.multiply(M[0,1]*y+M[0,2]+M[0,0]*x,W,out=XY[:,:,0])
+        np.multiply(M[1,1]*y+M[1,2]+M[1,0]*x,W,out=XY[:,:,1])
+        np.clip(XY,*intLimits,out=XY)
+        XY=np.rint(XY,out=XY).astype(np.int32)
+        # CV_16SC2 integer coordinates plus the index into the interpolation table
+        shortLimits=(np.iinfo(np.int16).min,np.iinfo(np.int16).max)
+        map1=np.clip(XY>>cv2.INTER_BITS,*shortLimits).astype(np.int16)
+        XY&=tabSize-1
+        map2=(XY[:,:,1]*tabSize+XY[:,:,0]).astype(np.uint16)
+        return map1,map2
+    
+    def getWarpMaps(self,size):
+        """ get the remap tables for warping to an ideal board of the given size """
+        if size not in self.warpMapsBySize:
+            if size==self.idealSize:
+                matrix=self.inverseTransform
+            else:
+                scale=size/self.idealSize
+                matrix=np.diag([scale,scale,1.0])@self.inverseTransform
+            self.warpMapsBySize[size]=self.warpMaps(matrix,size)
+        return self.warpMapsBySize[size]
+    
+    def sampleIndices(self,w,h):
+        """ get the original image row and column indices of the sparse sampling grid for an image of the given width and height """
+        k=ChessTrapezoid.SamplesPerSquareSide
+        sw,sh=ChessTrapezoid.cols*k,ChessTrapezoid.rows*k
+        # same relative positions as the pixels of a board warped to the sample size
+        rgrid=np.stack(np.meshgrid(np.arange(sw)/sw,np.arange(sh)/sh),axis=-1)
+        xy=np.rint(self.relativeToTrapezXYs(rgrid.reshape(-1,2))).astype(np.intp)
+        xs=np.clip(xy[:,0],0,w-1).reshape(sh,sw)
+        ys=np.clip(xy[:,1],0,h-1).reshape(sh,sw)
+        return ys,xs
+    
+    def sampledBoardImage(self,image):
+        """ get a small ideal board image by sampling the given trapez image directly without warping """
+        h,w=image.shape[:2]
+        if self.sampleGrid is None or self.sampleGrid[0]!=(w,h):
+            self.sampleGrid=((w,h),self.sampleIndices(w,h))
+        ys,xs=self.sampleGrid[1]
+        return image[ys,xs]
+    
     def warpedBoardImage(self,image):
-        warped=cv2.warpPerspective(image,self.inverseTransform,(self.idealSize,self.idealSize))
+        """ get the ideal square board image for the given trapez image """
+        if ChessTrapezoid.SparseSampling:
+            warped=self.sampledBoardImage(image)
+        elif ChessTrapezoid.WarpWithRemap:
+            map1,map2=self.getWarpMaps(self.idealSize)
+            warped=cv2.remap(image,map1,map2,cv2.INTER_LINEAR)
+        else:
+            warped=cv2.warpPerspective(image,self.inverseTransform,(self.idealSize,self.idealSize))
         return warped
     
+    def coarseBoardImage(self,image):
+        """ get the ideal square board image of CoarseSize for the given trapez image """
+        map1,map2=self.getWarpMaps(ChessTrapezoid.CoarseSize)
+        return cv2.remap(image,map1,map2,cv2.INTER_LINEAR)
+    
     def diffBoardImage(self,image,other):
         if image is None :
             raise Exception("image is None for diff")
@@ -188,11 +313,29 @@ class ChessTrapezoid:
             print("diffSum %.0f" % (diffSumValue))
         return diffSumValue
 
+    def renderColors(self):
+        """ get the drawing colors by FieldState for the current average colors - quantized by RenderColorQuantization """
+        q=ChessTrapezoid.RenderColorQuantization
+        colors={}
+        for fieldState,averageColor in self.averageColors.items():
+            # opencv rounds half to even and saturates when drawing - so do we
+            colors[fieldState]=tuple(int(c) for c in np.clip(np.rint(np.asarray(averageColor.color)/q)*q,0,255))
+        return colors
+
     def idealColoredBoard(self,w,h,transformation=Transformation.IDEAL):
-        """ draw an 'ideal' colored board according to a given set of parameters e.g. fieldColor, pieceColor, pieceRadius"""
-        idealImage=self.getEmtpyImage4WidthAndHeight(w,h,3)
-        for tsquare in self.genSquares():
-            tsquare.drawState(idealImage,transformation,3)
+        """ draw an 'ideal' colored board according to a given set of parameters e.g. fieldColor, pieceColor, pieceRadius
+
+        the image is taken from the render cache if the position, the (quantized) average colors, the size and transformation are unchanged.
+        The returned image is shared and therefore read only - copy it before drawing on it."""
+        colors=self.renderColors()
+        key=(self.fen,tuple(colors.get(fieldState) for fieldState in FieldState),w,h,transformation)
+        idealImage=self.renderCache.get(key)
+        if idealImage is None:
+            idealImage=self.getEmtpyImage4WidthAndHeight(w,h,3)
+            for tsquare in self.genSquares():
+                tsquare.drawState(idealImage,transformation,3,colors)
+            idealImage.flags.writeable=False
+            self.renderCache.put(key,idealImage)
         return idealImage
    
     def preMoveBoard(self,w,h):
@@ -217,36 +360,125 @@ class ChessTrapezoid:
             sortedTSquares[tsquare.fieldState].append(tsquare)
         return sortedTSquares
 
+    def getLabelImage(self,image):
+        """ get the FieldState label image for the given warped image - a pixel has bit 1<<fieldState set if it is part of the mask of that fieldState
+        
+        masks of neighbouring squares share their border pixels so a pixel might carry more than one label. The label images are kept by image size until the position changes """
+        h, w = image.shape[:2]
+        labelImage=self.labelImages.get((w,h))
+        if labelImage is None:
+            labelImage=self.getEmtpyImage4WidthAndHeight(w, h, 1)[:,:,0]
+            for fieldState in FieldState:
+                mask=self.getEmtpyImage4WidthAndHeight(w, h, 1)
+                self.drawFieldStates(mask,[fieldState],Transformation.IDEAL,1)
+                labelImage[mask[:,:,0]!=0]|=1<<fieldState
+            self.labelImages.put((w,h),labelImage)
+        return labelImage
+
     def analyzeColors(self,image):
         """ get the average colors per fieldState """
-        warped=self.warpedBoardImage(image)
+        labelImage=self.getLabelImage(image)
+        h, w = image.shape[:2]
+        channels=image.shape[2]
+        labelCount=1<<len(FieldState)
+        values=np.arange(256,dtype=np.float64)
+        sums=np.empty((labelCount,channels))
+        sqsums=np.empty((labelCount,channels))
+        nonzeros=np.empty((labelCount,channels))
+        for channel in range(channels):
+            # a single pass per channel: the 2D histogram of labels and channel values has all the counts needed
+            # https://docs.opencv.org/4.1.2/d6/dc7/group__imgproc__hist.html
+            hist=cv2.calcHist([labelImage,image],[0,1+channel],None,[labelCount,256],[0,labelCount,0,256]).astype(np.float64)
+            sums[:,channel]=hist@values
+            sqsums[:,channel]=hist@(values*values)
+            nonzeros[:,channel]=hist[:,1:].sum(axis=1)
         byFieldState=self.byFieldState()
         for fieldState in byFieldState.keys():
-            mask=self.getEmptyImage(warped)
-            self.drawFieldStates(mask,[fieldState],Transformation.IDEAL,1)
-            masked=self.maskImage(image,mask)
-            countedFields=len(byFieldState[fieldState])
-            averageColor=Color(masked)
+            combined=(np.arange(labelCount) & (1<<fieldState))!=0
+            nonzero=int(nonzeros[combined].sum(axis=0).max())
+            averageColor=Color.fromSums(h*w,nonzero,sums[combined].sum(axis=0),sqsums[combined].sum(axis=0))
             self.averageColors[fieldState]=averageColor
             if ChessTrapezoid.showDebugImage:
+                mask=((labelImage & (1<<fieldState))!=0).astype(np.uint8)
+                masked=self.maskImage(image,mask)
                 self.video.showImage(masked,fieldState.title())
             if ChessTrapezoid.colorDebug:
+                countedFields=len(byFieldState[fieldState])
                 print("%15s (%2d): %s" % (fieldState.title(),countedFields,averageColor))
         return self.averageColors      
     
+    def getSquareIdImage(self,image):
+        """ get an image that has the index row*cols+col of the square for each pixel of the square images - other pixels are 255
+        - kept by image size"""
+        h, w = image.shape[:2]
+        squareIdImage=self.squareIdImages.get((w,h))
+        if squareIdImage is None:
+            squareIdImage=np.full((h,w),255,dtype=np.uint8)
+            for tsquare in self.genSquares():
+                sh,sw,x,y,dh,dw=tsquare.rxy2xy(squareIdImage)
+                squareIdImage[y:y +dh, x:x +dw]=tsquare.row*ChessTrapezoid.cols+tsquare.col
+            self.squareIdImages.put((w,h),squareIdImage)
+        return squareIdImage
+
+    def rangeFactorLUT(self,averageColor,factors):
+        """ get a lookup table with the index of the smallest of the given range factors for which a channel value is in the color range of the given average color
+        
+        the color ranges grow with the factor so a value stays in range for all bigger factors - len(factors) means out of range for all factors"""
+        lut=np.full((3,256),len(factors),dtype=np.uint8)
+        values=np.arange(256)
+        for index in reversed(range(len(factors))):
+            lower,upper=averageColor.colorRange(factors[index])
+            lut[(values>=lower[:,None]) & (values<=upper[:,None])]=index
+        # one lookup table per channel
+        return lut
+
     def optimizeColorCheck(self,image,averageColors,debug=False):
-        optimalSelectivity=-100
-        for factor in [x*0.05 for x in range(20,41)]:
-            """ optimize the factor for the color check"""
-            startc=timer()
-            fieldColorStatsCandidate=self.checkColors(image,averageColors,factor)
-            endc=timer()
-            fieldColorStatsCandidate.analyzeStats(factor,endc-startc)
-            if fieldColorStatsCandidate.minSelectivity>optimalSelectivity:
-                optimalSelectivity=fieldColorStatsCandidate.minSelectivity
-                colorStats=fieldColorStatsCandidate
-                if debug:
-                    print ("selectivity %5.1f white: %5.1f black: %5.1f " % (self.minSelectivity,self.whiteSelectivity,self.blackSelectivity))
+        """ optimize the range factor for the color check 
+        
+        instead of calling checkColors for each of the ColorCheckFactors the smallest in range factor is looked up for each pixel once.
+        The per square histograms of these factors then give the in range percentages for all factors at once"""
+        startc=timer()
+        factors=ChessTrapezoid.ColorCheckFactors
+        squareIdImage=self.getSquareIdImage(image)
+        h, w = image.shape[:2]
+        pixels=(h//ChessTrapezoid.rows)*(w//ChessTrapezoid.cols)
+        squareCount=ChessTrapezoid.rows*ChessTrapezoid.cols
+        percents={}
+        channels=cv2.split(image)
+        for fieldColor,fieldState in [(chess.WHITE,FieldState.WHITE_EMPTY),(chess.BLACK,FieldState.BLACK_EMPTY)]:
+            lut=self.rangeFactorLUT(averageColors[fieldState],factors)
+            channelFactors=[cv2.LUT(channel,lut[index]) for index,channel in enumerate(channels)]
+            # a pixel is in range if all it's channels are
+            factorImage=cv2.max(cv2.max(channelFactors[0],channelFactors[1]),channelFactors[2])
+            hist=cv2.calcHist([squareIdImage,factorImage],[0,1],None,[squareCount,len(factors)],[0,squareCount,0,len(factors)])
+            inRange=np.cumsum(hist.astype(np.int64),axis=1)
+            percents[fieldColor]=inRange/pixels*100
+        byFieldState=self.byFieldState()
+        percentMin={}
+        percentMax={}
+        for fieldState,tsquares in byFieldState.items():
+            if len(tsquares)==0:
+                # same as MinMaxStats without values
+                percentMin[fieldState]=np.full(len(factors),sys.maxsize)
+                percentMax[fieldState]=np.full(len(factors),-sys.maxsize)
+            else:
+                fieldPercents=np.array([percents[tsquare.fieldColor][tsquare.row*ChessTrapezoid.cols+tsquare.col] for tsquare in tsquares])
+                percentMin[fieldState]=fieldPercents.min(axis=0)
+                percentMax[fieldState]=fieldPercents.max(axis=0)
+        # see FieldColorStats.analyzeStats    
+        whiteSelectivity=percentMin[FieldState.WHITE_EMPTY]-np.maximum(percentMax[FieldState.WHITE_BLACK],percentMax[FieldState.WHITE_WHITE])
+        blackSelectivity=percentMin[FieldState.BLACK_EMPTY]-np.maximum(percentMax[FieldState.BLACK_BLACK],percentMax[FieldState.BLACK_WHITE])
+        # the first factor with the best selectivity is the optimum
+        optimalIndex=int(np.argmax(np.minimum(whiteSelectivity,blackSelectivity)))
+        colorStats=FieldColorStats()
+        for fieldState,tsquares in byFieldState.items():
+            for tsquare in tsquares:
+                percent=percents[tsquare.fieldColor][tsquare.row*ChessTrapezoid.cols+tsquare.col,optimalIndex]
+                colorStats.push(fieldState,tsquare.an,float(percent))
+        endc=timer()
+        colorStats.analyzeStats(factors[optimalIndex],endc-startc)
+        if debug:
+            print ("selectivity %5.1f white: %5.1f black: %5.1f " % (colorStats.minSelectivity,colorStats.whiteSelectivity,colorStats.blackSelectivity))
         return colorStats       
         
     def checkColors(self,image,averageColors,rangeFactor=1.0):
@@ -274,18 +506,67 @@ class ChessTrapezoid:
         return colorStats
                 
                 
-    def detectChanges(self,image,diffImage,detectState):
-        """ detect the changes of the given differential image using the given detect state machine"""
+    def squareTiles(self,image):
+        """ get the given image as an 8x8 grid of square tiles with shape (rows,dh,cols,dw,channels) - tiles are placed exactly like ChessTSquare.rxy2xy does"""
+        h, w = image.shape[:2]
+        dh=h//ChessTrapezoid.rows
+        dw=w//ChessTrapezoid.cols
+        if h==dh*ChessTrapezoid.rows and w==dw*ChessTrapezoid.cols:
+            # the usual case e.g. idealSize 640 or 800 - just a reshaped view of the image
+            tiles=image.reshape(ChessTrapezoid.rows,dh,ChessTrapezoid.cols,dw,-1)
+        else:
+            # gather the tiles at the same integer offsets as rxy2xy
+            ys=(np.arange(ChessTrapezoid.rows)*ChessTSquare.rh*h).astype(np.intp)
+            xs=(np.arange(ChessTrapezoid.cols)*ChessTSquare.rw*w).astype(np.intp)
+            rowIndex=ys[:,None]+np.arange(dh)
+            colIndex=xs[:,None]+np.arange(dw)
+            tiles=image[rowIndex[:,:,None,None],colIndex[None,None,:,:]]
+            tiles=tiles.reshape(ChessTrapezoid.rows,dh,ChessTrapezoid.cols,dw,-1)
+        return tiles
+
+    def squareDiffSums(self,diffImage):
+        """ block reduction of the given differential image: get the diff sums of all 64 squares as an 8x8 array indexed by row and col"""
+        tiles=self.squareTiles(diffImage)
+        diffSums=tiles.sum(axis=(1,3,4),dtype=np.int64)
+        return diffSums
+
+    def squareDiffStats(self,diffImage):
+        """ get the diff sums, values (diff sum per image pixel as used by SquareChange) and validity flags of all 64 squares as 8x8 arrays indexed by row and col
+
+        the validity flags are checked against the current change statistics of the squares the same way SquareChange does"""
+        h, w = diffImage.shape[:2]
+        diffSums=self.squareDiffSums(diffImage)
+        # the value is 64 times lower then the per pixel value
+        values=diffSums/(h*w)
+        diffs,valid=self.squareValueStats(values)
+        return diffSums,values,diffs,valid
+    
+    def squareValueStats(self,values):
+        """ get the differences to the mean change and the validity flags for the given 8x8 array of square values """
+        settled=self.changeStats.n>=SquareChange.meanFrameCount
+        diffs=np.where(settled,values-self.changeStats.mean(),0)
+        valid=settled & (np.abs(diffs)<SquareChange.treshold)
+        return diffs,valid
+
+    def detectChanges(self,image,diffImage,detectState,values=None):
+        """ detect the changes of the given differential image using the given detect state machine - the square values might have been precalculated"""
         detectState.nextFrame()
         changes={}
-        validChanges=0
-        diffSum=0
+        if values is None:
+            diffSums,values,diffs,valid=self.squareDiffStats(diffImage)
+        else:
+            diffs,valid=self.squareValueStats(values)
+        validChanges=int(np.count_nonzero(valid))
+        diffSum=float(np.abs(diffs).sum())
+        means=self.changeStats.mean()
+        variances=self.changeStats.variance()
+        # squares that have not settled yet take every value into their statistics
+        self.changeStats.push(values,self.changeStats.n<SquareChange.meanFrameCount)
         for tsquare in self.genSquares():
-            squareChange=tsquare.squareChange(image,diffImage)
+            row,col=tsquare.row,tsquare.col
+            change=SquareChange(values[row,col],tsquare.changeStats,means[row,col],variances[row,col],diffs[row,col],bool(valid[row,col]))
+            squareChange=tsquare.squareChange(image,diffImage,change=change)
             changes[tsquare.an]=squareChange
-            diffSum+=abs(squareChange.diff)
-            if squareChange.valid:
-                validChanges+=1
             #if self.frames==1:
             #    tsquare.preMoveImage=np.copy(tsquare.squareImage) 
         
@@ -303,6 +584,75 @@ class ChessTrapezoid:
         changes["validFrames"]=detectState.validFrames
         changes["invalidFrames"]=detectState.invalidFrames            
         return changes    
+    
+    def detectChangesDualResolution(self,image,detectState):
+        """ detect the changes of the given trapez image on a coarse board of CoarseSize and
+        warp and analyze at the full idealSize only where the coarse pass reports changes according to the EscalationPolicy
+        
+        the changes record which escalation was applied and how many squares were analyzed at full resolution"""
+        coarse=self.coarseBoardImage(image)
+        ch,cw=coarse.shape[:2]
+        self.analyzeColors(coarse)
+        coarseIdeal=self.idealColoredBoard(cw,ch)
+        coarseDiff=self.diffBoardImage(coarse,coarseIdeal)
+        diffSums,values,diffs,valid=self.squareDiffStats(coarseDiff)
+        treshold=ChessTrapezoid.EscalationTreshold
+        if treshold is None:
+            treshold=SquareChange.treshold
+        changed=np.abs(diffs)>=treshold
+        escalation=ChessTrapezoid.EscalationPolicy if changed.any() else Escalation.NONE
+        if escalation==Escalation.FRAME:
+            warped=self.warpedBoardImage(image)
+            h, w = warped.shape[:2]
+            diffImage=self.diffBoardImage(warped,self.idealColoredBoard(w,h))
+            changes=self.detectChanges(warped,diffImage,detectState)
+            fullSquares=ChessTrapezoid.rows*ChessTrapezoid.cols
+        else:
+            if escalation==Escalation.SQUARES:
+                # warp only the changed squares using the corresponding part of the remap tables
+                s=self.idealSize
+                map1,map2=self.getWarpMaps(s)
+                idealImage=self.idealColoredBoard(s,s)
+                for row,col in zip(*np.nonzero(changed)):
+                    tsquare=self.tSquareAt(row,col)
+                    h,w,x,y,dh,dw=tsquare.rxy2xy(idealImage)
+                    squareImage=cv2.remap(image,map1[y:y+dh,x:x+dw],map2[y:y+dh,x:x+dw],cv2.INTER_LINEAR)
+                    squareDiff=self.diffBoardImage(squareImage,idealImage[y:y+dh,x:x+dw])
+                    values[row,col]=np.sum(squareDiff,dtype=np.int64)/(h*w)
+            changes=self.detectChanges(coarse,coarseDiff,detectState,values)
+            fullSquares=int(np.count_nonzero(changed)) if escalation==Escalation.SQUARES else 0
+        self.escalationCounts[escalation]+=1
+        changes["escalation"]=escalation
+        changes["fullResolutionSquares"]=fullSquares
+        return changes
+
+class RenderCache(object):
+    """ least recently used cache of rendered images """
+    def __init__(self,maxSize):
+        self.maxSize=maxSize
+        self.images=OrderedDict()
+        self.hits=0
+        self.misses=0
+
+    def get(self,key):
+        """ get the image for the given key or None if it is not cached """
+        image=self.images.get(key)
+        if image is None:
+            self.misses+=1
+        else:
+            self.hits+=1
+            self.images.move_to_end(key)
+        return image
+
+    def put(self,key,image):
+        """ cache the given image with the given key and evict the least recently used image if necessary"""
+        self.images[key]=image
+        self.images.move_to_end(key)
+        while len(self.images)>self.maxSize:
+            self.images.popitem(last=False)
+
+    def clear(self):
+        self.images.clear()
 
 class FieldState(IntEnum):
     """ the state of a field is a combination of the field color with a piece color + two empty field color options"""
@@ -360,11 +710,16 @@ class Color:
     black=(0,0,0)
     debug=False
     
-    def __init__(self,image):
+    def __init__(self,image=None):
         """ pick the an average color from the given image"""
-        #https://stackoverflow.com/a/43112217/1497139 
-        (means, stds) = cv2.meanStdDev(image)
-        pixels,nonzero=Color.countNonZero(image)
+        if image is not None:
+            #https://stackoverflow.com/a/43112217/1497139 
+            (means, stds) = cv2.meanStdDev(image)
+            pixels,nonzero=Color.countNonZero(image)
+            self.setStats(means, stds, pixels, nonzero)
+            
+    def setStats(self,means,stds,pixels,nonzero):
+        """ set my color and standard deviations from the zero based means and stds"""
         # exotic case of a totally black picture
         if nonzero==0:
             self.color=(0,0,0)
@@ -372,6 +727,17 @@ class Color:
         else:    
             self.color,self.stds=self.fixMeans(means, stds, pixels, nonzero)
             
+    @staticmethod
+    def fromSums(pixels,nonzero,sums,sqsums):
+        """ get the average color of a masked image with the given number of pixels from the channel sums and squared sums
+        of the nonzero pixels - gives the same result as constructing the color from the masked image"""
+        # same calculation as cv2.meanStdDev
+        means=sums/pixels
+        stds=np.sqrt(np.maximum(sqsums/pixels-means*means,0))
+        color=Color()
+        color.setStats(means, stds, pixels, nonzero)
+        return color
+            
     @staticmethod
     def countNonZero(image):        
         #https://stackoverflow.com/a/55163686/1497139
@@ -433,18 +799,24 @@ class SquareChange:
     meanFrameCount=10
     treshold=0.2
     
-    def __init__(self,value,stats):
-        """ construct me from the given value with the given running stats"""
+    def __init__(self,value,stats,mean=None,variance=None,diff=None,valid=None):
+        """ construct me from the given value with the given running stats
+        - mean, variance, diff and validity might have been precalculated for all squares by ChessTrapezoid.squareValueStats"""
         self.value=value
-        self.mean=stats.mean()
-        self.diff=value-self.mean
-        self.variance=stats.variance()
-        if stats.n<SquareChange.meanFrameCount:
-            stats.push(value)
-            self.valid=False
-            self.diff=0
-        else:
-            self.valid=abs(self.diff)<SquareChange.treshold
+        if valid is None:
+            mean=stats.mean()
+            variance=stats.variance()
+            if stats.n<SquareChange.meanFrameCount:
+                stats.push(value)
+                valid=False
+                diff=0
+            else:
+                diff=value-mean
+                valid=abs(diff)<SquareChange.treshold
+        self.mean=mean
+        self.variance=variance
+        self.diff=diff
+        self.valid=valid
                 
     def push(self,stats,value):
         if self.valid:
@@ -461,13 +833,13 @@ class ChessTSquare:
     def __init__(self,trapez,square):
         ''' construct me from the given trapez  and square '''
         self.trapez=trapez
-        self.changeStats=MinMaxStats()
         self.square=square
         self.an=chess.SQUARE_NAMES[square]
         # rank are rows in Algebraic Notation from 1 to 8
         self.row=ChessTrapezoid.rows-1-chess.square_rank(square)
         # files are columns in Algebraic Notation from A to H
         self.col=chess.square_file(square)
+        self.changeStats=trapez.changeStats.element((self.row,self.col))
         # https://gamedev.stackexchange.com/a/44998/133453
         self.fieldColor=chess.WHITE if (self.col+self.row) % 2 == 1 else chess.BLACK
         self.fieldState=None
@@ -480,24 +852,34 @@ class ChessTSquare:
         self.rx,self.ry=self.col*ChessTSquare.rw,self.row*ChessTSquare.rh
         self.rcx=self.rx+ChessTSquare.rw*0.5
         self.rcy=self.ry+ChessTSquare.rh*0.5
-        self.x,self.y=trapez.relativeToTrapezXY(self.rx, self.ry)
-        self.setPolygons(trapez,self.rx,self.ry,self.rx+ChessTSquare.rw,self.ry,self.rx+ChessTSquare.rw,self.ry+ChessTSquare.rh,self.rx,self.ry+ChessTSquare.rh)
+        # my corners in the trapez have been precalculated by the trapez
+        grid=trapez.trapezGrid
+        r,c=self.row,self.col
+        self.x,self.y=grid[r,c]
+        polygon=np.array([grid[r,c],grid[r,c+1],grid[r+1,c+1],grid[r+1,c]])
+        self.setPolygons(trapez,self.rx,self.ry,self.rx+ChessTSquare.rw,self.ry,self.rx+ChessTSquare.rw,self.ry+ChessTSquare.rh,self.rx,self.ry+ChessTSquare.rh,polygon)
 
-    def setPolygons(self,trapez,rtl_x,rtl_y,rtr_x,rtr_y,rbr_x,rbr_y,rbl_x,rbl_y):
+    def setPolygons(self,trapez,rtl_x,rtl_y,rtr_x,rtr_y,rbr_x,rbr_y,rbl_x,rbl_y,polygon=None):
         """ set my relative and warped polygons from the given relative corner coordinates from top left via top right, bottom right to bottom left """
         self.rpolygon=np.array([(rtl_x,rtl_y),(rtr_x,rtr_y),(rbr_x,rbr_y),(rbl_x,rbl_y)])
         self.idealPolygon=(self.rpolygon*trapez.idealSize).astype(np.int32)
-        # function to use to calculate polygon
-        r2t=trapez.relativeToTrapezXY
-        self.polygon=np.array([r2t(rtl_x,rtl_y),r2t(rtr_x,rtr_y),r2t(rbr_x,rbr_y),r2t(rbl_x,rbl_y)])
+        # calculate the polygon in the trapez if it has not been given
+        if polygon is None:
+            polygon=trapez.relativeToTrapezXYs(self.rpolygon)
+        self.polygon=polygon
         self.ipolygon=self.polygon.astype(np.int32)
 
-    def getPolygon(self,transformation):
+    def getPolygon(self,transformation,image=None):
+        """ get my polygon for the given transformation - ideal polygons are scaled to the size of the given image e.g. a sparsely sampled board """
         if transformation==Transformation.ORIGINAL:
             return self.ipolygon
         elif transformation==Transformation.RELATIVE:
             return self.rpolygon
         elif transformation==Transformation.IDEAL:
+            if image is not None:
+                h, w = image.shape[:2]
+                if not w==self.trapez.idealSize or not h==self.trapez.idealSize:
+                    return (self.rpolygon*(w,h)).astype(np.int32)
             return self.idealPolygon
         else:
             raise Exception("invalid transformation %d for getPolygon",transformation)   
@@ -522,31 +904,34 @@ class ChessTSquare:
         # this can't happen
         return None
 
-    def drawState(self,image,transformation,channels):
-        """ draw my state onto the given image with the given transformation and number of channels"""
+    def drawState(self,image,transformation,channels,colors=None):
+        """ draw my state onto the given image with the given transformation and number of channels
+        using the given colors by FieldState - default are the average colors of my trapezoid"""
         # default is drawing a single channel mask
         squareImageColor=64
         pieceImageColor=squareImageColor
         if channels==3:
+            if colors is None:
+                colors={fieldState:averageColor.color for fieldState,averageColor in self.trapez.averageColors.items()}
             if self.fieldColor==chess.WHITE:
-                if FieldState.WHITE_EMPTY in self.trapez.averageColors:
-                    squareImageColor=self.trapez.averageColors[FieldState.WHITE_EMPTY].color
+                if FieldState.WHITE_EMPTY in colors:
+                    squareImageColor=colors[FieldState.WHITE_EMPTY]
                 else:
                     squareImageColor=Color.white    
             else:
-                if FieldState.BLACK_EMPTY in self.trapez.averageColors:
-                    squareImageColor=self.trapez.averageColors[FieldState.BLACK_EMPTY].color
+                if FieldState.BLACK_EMPTY in colors:
+                    squareImageColor=colors[FieldState.BLACK_EMPTY]
                 else:
                     squareImageColor=Color.black
         
         if not (channels==1 and self.piece is not None): 
-            self.trapez.drawPolygon(image,self.getPolygon(transformation),squareImageColor)
+            self.trapez.drawPolygon(image,self.getPolygon(transformation,image),squareImageColor)
         
         
         if self.piece is not None:
             if channels==3:
-                if self.fieldState in self.trapez.averageColors:
-                    pieceImageColor=self.trapez.averageColors[self.fieldState].color
+                if self.fieldState in colors:
+                    pieceImageColor=colors[self.fieldState]
                 else:    
                     pieceImageColor=Color.darkgrey if self.piece.color==chess.BLACK else Color.lightgrey
             rcenter=self.rcenter()        
@@ -585,15 +970,19 @@ class ChessTSquare:
         squareImage=image[y:y +dh, x:x +dw]
         return squareImage        
              
-    def squareChange(self,image,diffImage):
-        """ check the changes analyzing the difference image of this square"""
+    def squareChange(self,image,diffImage,value=None,change=None):
+        """ check the changes analyzing the difference image of this square - the value or the whole change might have been precalculated e.g. by ChessTrapezoid.detectChanges"""
         h,w,x,y,dh,dw=self.rxy2xy(image)
         
         self.squareImage=image[y:y +dh, x:x +dw]
         self.diffImage=diffImage[y:y +dh, x:x +dw]
-        diffSum=np.sum(self.diffImage)
-        # the value is 64 times lower then the per pixel value        
-        self.currentChange=SquareChange(diffSum/(h*w),self.changeStats)
+        if change is None:
+            if value is None:
+                diffSum=np.sum(self.diffImage)
+                # the value is 64 times lower then the per pixel value        
+                value=diffSum/(h*w)
+            change=SquareChange(value,self.changeStats)
+        self.currentChange=change
         return self.currentChange
     
     def checkMoved(self,detectState):
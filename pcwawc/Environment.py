@@ -12,3 +12,4 @@ class Environment:
         self.testMediaPath = Path(self.projectPath, 'testMedia')
         self.testMedia = str(self.testMediaPath.absolute()) + "/"
         self.games = str(self.projectPath) + "/games"
+        self.calibration = str(self.projectPath) + "/calibration"
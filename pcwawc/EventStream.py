@@ -0,0 +1,84 @@
+#!/usr/bin/python3
+# part of https://github.com/WolfgangFahl/play-chess-with-a-webcam
+from threading import Lock
+import json
+import queue
+
+
+class Subscription(object):
+    """ a subscription to an event stream with a bounded queue of formatted events """
+
+    def __init__(self, maxSize):
+        self.queue = queue.Queue(maxSize)
+        self.dropped = False
+
+
+class EventStream(object):
+    """ publish events as Server-Sent Events to subscribers via bounded queues
+    - subscribers that do not keep up are dropped instead of blocking the publisher"""
+
+    def __init__(self, maxSize=64, keepAlive=15.0):
+        """ construct me with the given maximum number of queued events per subscriber and keep alive interval in seconds """
+        self.maxSize = maxSize
+        self.keepAlive = keepAlive
+        self.subscriptions = []
+        self.dropped = 0
+        self.lock = Lock()
+
+    @staticmethod
+    def format(eventType, data):
+        """ format the event with the given type and data as a Server-Sent Event """
+        return "event: %s\ndata: %s\n\n" % (eventType, json.dumps(data))
+
+    def subscribe(self):
+        subscription = Subscription(self.maxSize)
+        with self.lock:
+            self.subscriptions.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            if subscription in self.subscriptions:
+                self.subscriptions.remove(subscription)
+
+    def publish(self, eventType, data):
+        """ publish the event with the given type and data to all subscribers without blocking """
+        message = EventStream.format(eventType, data)
+        with self.lock:
+            for subscription in list(self.subscriptions):
+                try:
+                    subscription.queue.put_nowait(message)
+                except queue.Full:
+                    subscription.dropped = True
+                    self.subscriptions.remove(subscription)
+                    self.dropped += 1
+
+    def events(self, initialEvents=[]):
+        """ generate the formatted events for a new subscriber starting with the given initial events
+        - ends when the subscriber has been dropped so that the client reconnects and gets the current state again"""
+        # subscribe right away so that no event published before the first read is missed
+        return self.stream(self.subscribe(), initialEvents)
+
+    def stream(self, subscription, initialEvents=[]):
+        """ generate the formatted events of the given subscription """
+        try:
+            for message in initialEvents:
+                yield message
+            while not subscription.dropped:
+                try:
+                    message = subscription.queue.get(timeout=self.keepAlive)
+                except queue.Empty:
+                    # comment line to keep the connection open
+                    message = ": keepalive\n\n"
+                if subscription.dropped:
+                    break
+                yield message
+        finally:
+            self.unsubscribe(subscription)
+
+    def watch(self, detectState):
+        """ publish the piece moves and valid/invalid board transitions detected with the given detect state """
+        detectState.onPieceMoveDetected = lambda tSquare: self.publish("pieceMoved", {
+            "square": tSquare.an, "change": float(tSquare.currentChange.value), "frame": detectState.frames})
+        detectState.onValidBoardChanged = lambda detectState: self.publish("detectState", {
+            "valid": bool(detectState.validBoard), "frame": detectState.frames})
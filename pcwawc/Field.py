@@ -6,6 +6,7 @@ import colorsys
 # from colormath.color_diff import delta_e_cie2000
 from pcwawc.RunningStats import ColorStats
 import chess
+import numpy as np
 from enum import IntEnum
 
 class SquareKind(IntEnum):
@@ -72,6 +73,22 @@ class Grid:
     
     def shiftSafety(self,rx,ry):
         return self.safeShift(rx,self.safetyX),self.safeShift(ry,self.safetyY)
+    
+    def key(self):
+        """ the parameters of this grid e.g. for caching """
+        return (self.rois,self.xsteps,self.ysteps,self.safetyX,self.safetyY)
+    
+    def relativePixels(self,relPixelLambda):
+        """ get the safety shifted relative pixel positions of all regions of interest as an array of shape (rois,xsteps*ysteps,2) in the order of FieldROI.pixelList """
+        rxys=np.empty((self.rois,self.xsteps*self.ysteps,2))
+        for roiIndex in range(self.rois):
+            index=0
+            for xstep in range(self.xsteps):
+                for ystep in range(self.ysteps):
+                    rx,ry=relPixelLambda(self,roiIndex,xstep,ystep)
+                    rxys[roiIndex,index]=self.shiftSafety(rx,ry)
+                    index+=1
+        return rxys
   
 
 class FieldROI:
@@ -166,8 +183,6 @@ class Field:
         self.hsvStats = None
         self.rgbStats = None
         self.luminance = None
-        self.rgbColorKey = None
-        self.colorKey = None
     
     def getRect(self):
         x1=int(self.pcx-self.width/2)
@@ -222,8 +237,28 @@ class Field:
                 self.hsvStats.push(ph, ps, pv)
                 self.rgbStats.push(r, g, b)
         self.luminance = self.hsvStats.c3Stats
-        self.rgbColorKey = self.rgbStats.rgbColorKey()
-        self.colorKey = self.hsvStats.colorKey()
+
+    def setColorStats(self, distance, step, hsvStats, rgbStats):
+        """ set my color statistics e.g. as analyzed for all fields at once by BoardDetector.analyzeColors """
+        self.distance = distance
+        self.step = step
+        self.hsvStats = hsvStats
+        self.rgbStats = rgbStats
+        self.luminance = self.hsvStats.c3Stats
+
+    @property
+    def rgbColorKey(self):
+        """ the CIEDE2000 distance of my mean rgb color to black - calculated on demand """
+        if self.rgbStats is None:
+            return None
+        return self.rgbStats.rgbColorKey()
+
+    @property
+    def colorKey(self):
+        """ the eucledian distance of my mean hsv color to black - calculated on demand """
+        if self.hsvStats is None:
+            return None
+        return self.hsvStats.colorKey()
 
     def getColor(self):
         h, s, v = self.hsvStats.mean()
@@ -2,6 +2,7 @@
 # part of https://github.com/WolfgangFahl/play-chess-with-a-webcam
 from pcwawc.Environment import Environment
 from pcwawc.JsonAbleMixin import JsonAbleMixin
+from pcwawc.Video import Video
 from pcwawc.YamlAbleMixin import YamlAbleMixin
 from time import strftime
 import numpy as  np
@@ -35,6 +36,8 @@ class WebCamGame(JsonAbleMixin):
         self.gameid = gameid
         self.game = Game(gameid)
         self.warp = Warp()
+        # index of the last journal entry contained in my save
+        self.journalIndex = 0
         
     def checkEnvironment(self, env):
         self.checkDir(env.games)    
@@ -49,12 +52,18 @@ class WebCamGame(JsonAbleMixin):
             else:
                 print ("Successfully created the directory %s " % path)
  
-    def save(self, path="games"):
+    def saveDir(self, path="games", create=True):
+        """ get the directory to save me to in the given path - creating it if necessary """
         env = Environment()
         savepath = str(env.projectPath) + "/" + path
-        self.checkDir(savepath)
         savedir = savepath + "/" + self.gameid
-        self.checkDir(savedir)
+        if create:
+            self.checkDir(savepath)
+            self.checkDir(savedir)
+        return savedir
+
+    def save(self, path="games"):
+        savedir = self.saveDir(path)
         jsonFile = savedir + "/" + self.gameid + "-webcamgame"
         self.writeJson(jsonFile)
         gameJsonFile = savedir + "/" + self.gameid
@@ -88,13 +97,15 @@ class Warp(YamlAbleMixin, JsonAbleMixin):
     def __init__(self, pointList=[], rotation=0, bgrColor=(0, 255, 0)):
         self.rotation = rotation
         self.bgrColor = bgrColor
-        self.pointList = pointList
+        # copy the points - the default list must not be shared between warps
+        self.pointList = list(pointList)
         self.updatePoints()
 
     def rotate(self, angle):
         self.rotation = self.rotation + angle
         if self.rotation >= 360:
             self.rotation = self.rotation % 360
+        self.transform = None
 
     def updatePoints(self):
         pointLen = len(self.pointList)
@@ -103,6 +114,23 @@ class Warp(YamlAbleMixin, JsonAbleMixin):
         else:
             self.points = np.array(self.pointList)
         self.warping = pointLen == 4
+        self.transform = None
+
+    def transformation(self, squared=True):
+        """ get the matrix and target size of the combined warp, resize and rotation of my points
+        - cached until the points or the rotation change"""
+        key = (self.rotation, squared)
+        transform = getattr(self, 'transform', None)
+        if transform is None or transform[0] != key:
+            matrix, size = Video.warpMatrix(self.points, self.rotation, squared)
+            self.transform = (key, matrix, size)
+        return self.transform[1:]
+
+    def __getstate__(self):
+        """ do not persist the cached transformation """
+        state = self.__dict__.copy()
+        state.pop('transform', None)
+        return state
 
     def addPoint(self, px, py):
         """ add a point with the given px,py coordinate
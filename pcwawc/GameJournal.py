@@ -0,0 +1,160 @@
+#!/usr/bin/python3
+# part of https://github.com/WolfgangFahl/play-chess-with-a-webcam
+from threading import Lock
+import copy
+import json
+import os
+
+
+class GameJournal(object):
+    """ append only journal of the moves, FEN/PGN snapshots and warp changes of a web cam game as JSON lines
+    - the game is recovered by replaying the journal on top of the last compacted save of the game"""
+    # number of journal entries after which the journal is compacted
+    compactAfter = 100
+
+    def __init__(self, webCamGame, board, path="games", gameSaver=None):
+        """ construct me for the given web cam game and board saved to the given path compacting with the given game saver """
+        self.webCamGame = webCamGame
+        self.gameid = webCamGame.gameid
+        self.board = board
+        self.path = path
+        self.gameSaver = gameSaver
+        # index of the last journal entry and the number of entries since the last compaction
+        self.index = getattr(webCamGame, 'journalIndex', 0)
+        self.entries = 0
+        self.lock = Lock()
+        self.file = None
+
+    def fileName(self, create=False):
+        """ get the file name of my journal """
+        return self.webCamGame.saveDir(self.path, create) + "/" + self.gameid + "-journal.jsonl"
+
+    def exists(self):
+        return os.path.isfile(self.fileName())
+
+    def create(self):
+        """ start an empty journal for a new game - a stale journal of an earlier game with the same id is discarded"""
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+            self.file = open(self.fileName(create=True), "w")
+            self.index = 0
+            self.entries = 0
+
+    def apply(self, entry):
+        """ apply the given journal entry to my game and board """
+        game = self.webCamGame.game
+        entryType = entry["type"]
+        result = None
+        if entryType == "move":
+            result = self.board.move(entry["move"])
+            game.moveIndex = game.moveIndex + 1
+            game.fen = self.board.fen()
+        elif entryType == "takeback":
+            self.board.takeback()
+            if game.moveIndex > 0:
+                game.moveIndex = game.moveIndex - 1
+            game.fen = self.board.fen()
+        elif entryType == "fen":
+            self.board.setFEN(entry["fen"])
+            game.fen = entry["fen"]
+        elif entryType == "pgn":
+            self.board.setPgn(entry["pgn"])
+            game.pgn = entry["pgn"]
+            game.fen = self.board.fen()
+        elif entryType == "warp":
+            warp = self.webCamGame.warp
+            warp.pointList = [list(point) for point in entry["pointList"]]
+            warp.rotation = entry["rotation"]
+            warp.updatePoints()
+        else:
+            raise Exception("unknown journal entry type %s" % (entryType))
+        return result
+
+    def append(self, entry):
+        """ append the given entry to my journal - to be called with my lock held"""
+        self.index = self.index + 1
+        entry["index"] = self.index
+        if self.file is None:
+            self.file = open(self.fileName(create=True), "a")
+        self.file.write(json.dumps(entry) + "\n")
+        self.file.flush()
+        self.entries = self.entries + 1
+        if self.gameSaver is not None:
+            # save a game that has never been saved right away so that it can be found by its id
+            # saves from before the journal have no journal index
+            neverSaved = getattr(self.webCamGame, 'journalIndex', 0) == 0 and self.entries == 1
+            if neverSaved or self.entries >= GameJournal.compactAfter:
+                self.gameSaver.save(self, self.path)
+
+    def record(self, entry):
+        """ apply the given entry to my game and board and append it to my journal """
+        with self.lock:
+            result = self.apply(entry)
+            self.append(entry)
+        return result
+
+    def move(self, ucimove):
+        """ perform the given move and return its SAN notation """
+        return self.record({"type": "move", "move": ucimove})
+
+    def takeback(self):
+        self.record({"type": "takeback"})
+
+    def setFEN(self, fen):
+        self.record({"type": "fen", "fen": fen})
+
+    def setPgn(self, pgn):
+        self.record({"type": "pgn", "pgn": pgn})
+
+    def warp(self, warp):
+        """ journal the points and rotation of the given warp """
+        self.record({"type": "warp", "pointList": [list(point) for point in warp.pointList], "rotation": warp.rotation})
+
+    def entriesAfter(self, index):
+        """ get the journal entries after the given index """
+        fileName = self.fileName()
+        if not os.path.isfile(fileName):
+            return []
+        with open(fileName) as journalFile:
+            entries = [json.loads(line) for line in journalFile if line.strip()]
+        return [entry for entry in entries if entry["index"] > index]
+
+    def replay(self):
+        """ recover my game by replaying the journal entries after the last compaction and return their number """
+        game = self.webCamGame.game
+        with self.lock:
+            self.board.setPgn(game.pgn)
+            if game.fen is not None and self.board.fen() != game.fen:
+                self.board.setFEN(game.fen)
+            entries = self.entriesAfter(self.index)
+            for entry in entries:
+                self.apply(entry)
+                self.index = entry["index"]
+            self.entries = len(entries)
+            if entries:
+                game.pgn = self.board.getPgn()
+        return len(entries)
+
+    def save(self, path=None):
+        """ compact my journal into the PGN, FEN and JSON files of my game """
+        if path is None:
+            path = self.path
+        with self.lock:
+            self.webCamGame.game.pgn = self.board.getPgn()
+            self.webCamGame.journalIndex = self.index
+            snapshot = copy.deepcopy(self.webCamGame)
+        savedir = snapshot.save(path)
+        with self.lock:
+            # keep the entries that have been journaled while saving
+            entries = self.entriesAfter(snapshot.journalIndex)
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+            fileName = self.fileName(create=True)
+            with open(fileName + ".tmp", "w") as journalFile:
+                for entry in entries:
+                    journalFile.write(json.dumps(entry) + "\n")
+            os.replace(fileName + ".tmp", fileName)
+            self.entries = len(entries)
+        return savedir
@@ -0,0 +1,65 @@
+#!/usr/bin/python3
+# part of https://github.com/WolfgangFahl/play-chess-with-a-webcam
+from threading import Thread, Condition, current_thread
+import logging
+
+
+class GameSaver(object):
+    """ save web cam games or compact game journals in a background thread so that saving never blocks the request handling
+    - all changes within the given delay after the first change are coalesced into a single save"""
+
+    def __init__(self, delay=0.5, name='GameSaver', logger=None):
+        """ construct me with the given debounce delay in seconds and logger for errors"""
+        self.delay = delay
+        self.name = name
+        self.logger = logger if logger is not None else logging.getLogger(__name__)
+        # the games to be saved by game id and path
+        self.dirty = {}
+        self.saves = 0
+        self.condition = Condition()
+        self.thread = None
+        self.stopped = False
+
+    def start(self):
+        # start the thread to save the games
+        self.thread = Thread(target=self.update, name=self.name, args=())
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def save(self, webCamGame, path="games"):
+        """ mark the given web cam game or game journal to be saved to the given path """
+        with self.condition:
+            self.dirty[(webCamGame.gameid, path)] = webCamGame
+            self.condition.notify_all()
+
+    def flush(self):
+        """ save all games that have been marked to be saved """
+        with self.condition:
+            dirty = self.dirty
+            self.dirty = {}
+        for (gameid, path), webCamGame in dirty.items():
+            try:
+                webCamGame.save(path)
+                self.saves += 1
+            except BaseException:
+                self.logger.exception("saving game %s failed" % (gameid))
+
+    def update(self):
+        """ save the games marked to be saved after my delay until I am stopped"""
+        while not self.stopped:
+            with self.condition:
+                while not self.dirty and not self.stopped:
+                    self.condition.wait()
+                # give further changes the chance to be coalesced
+                self.condition.wait_for(lambda: self.stopped, self.delay)
+            self.flush()
+
+    def stop(self, timeout=5.0):
+        # indicate that the thread should be stopped and save the pending games
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+        if self.thread is not None and self.thread is not current_thread():
+            self.thread.join(timeout)
+        self.flush()
@@ -3,9 +3,9 @@
 
 # Global imports
 from pcwawc.Args import Args
+from pcwawc.Environment import Environment
+from pcwawc.StableFrameDetector import StableFrameDetector, StableFrameCalibration
 from pcwawc.Video import Video
-import cv2
-import time
 
 # CHESSCAM_WIDTH = 640
 # CHESSCAM_HEIGHT = 480
@@ -18,6 +18,8 @@ smoothFunc = lambda x: sum(x) / float(len(x))
 
 class InputManager(object):
     """ manage the video input and supply frames """
+    # number of frames of a still scene to calibrate the stable frame threshold with
+    calibrationFrames = 30
 
     def __init__(self, argv):
         self.args = Args(argv).args
@@ -31,30 +33,29 @@ class InputManager(object):
         if not self.video.cap:
             raise Exception("Could not initialize capturing...")
 
-        diffs = []
-
-        # Initialize capture threshold
-        for i in range(30):
-            ret, capture1, quit = self.video.readFrame()
-            ret, capture2, quit = self.video.readFrame()
-            diff = sum(cv2.integral(cv2.absdiff(capture1, capture2))[-1][-1])
-            diffs.append(diff)
-
-        self.threshold = sum(diffs) / len(diffs)
-        self.threshold *= 1.05
+        # Initialize capture threshold - the calibration is kept per input device
+        self.stableFrameDetector = StableFrameDetector()
+        calibrationPath = Environment().calibration
+        calibration = None if self.args.recalibrate else StableFrameCalibration.load(calibrationPath, self.args.input)
+        if calibration is None:
+            frames = []
+            for i in range(InputManager.calibrationFrames):
+                ret, frame, quit = self.video.readFrame()
+                if ret:
+                    frames.append(frame)
+            calibration = StableFrameCalibration(self.args.input, self.stableFrameDetector.calibrate(frames))
+            calibration.save(calibrationPath)
+        self.threshold = calibration.threshold
+        self.stableFrameDetector.threshold = self.threshold
 
     def getFrame(self):
-        diff = float("inf")
-        while(diff > self.threshold):
-            ret1, capture1, quit = self.video.readFrame(True)
-            if ret1:
-                ret2, capture2, quit = self.video.readFrame(True)
-            if ret2:
-                capture3 = capture2.copy()
-            if ret1 and ret2:
-                diff = sum(cv2.integral(cv2.absdiff(capture1, capture2))[-1][-1])
-            time.sleep(0.5)
-        return capture3
+        """ get the next stable frame - None if there are no more frames"""
+        while True:
+            ret, frame, quit = self.video.readFrame(True)
+            if not ret:
+                return None
+            if self.stableFrameDetector.push(frame):
+                return frame.copy()
 
 
 if __name__ == "__main__":
@@ -20,6 +20,10 @@ class MovementDetector(object):
     """This class used to detect if a move has occured in the board.
     It also needs to be tolerant to sudden lighting changes"""
     debug = False
+    # minimum sum of the absolute differences of a cell to count as moved
+    movementThreshold = 35000
+    # how many times the cells need to cover their bounding box for a single integral image to be cheaper than summing each cell
+    integralCoverage = 8
 
     def __init__(self, colorImage):
         """To be built correctly, this class need the image of the starting position"""
@@ -33,6 +37,8 @@ class MovementDetector(object):
 
         self.images = [initialImage, initialImage]
         self.board = initialBoard
+        # the difference sums of the cells of the last detection by cell key
+        self.cellSums = {}
         self.video = Video()
 
     def detectMove(self, colorImage):
@@ -65,12 +71,11 @@ class MovementDetector(object):
         if MovementDetector.debug:
             self.video.showImage(diff, "chessCamDebug")
 
-        for key in list(currentBoard.keys()):
-            coords = currentBoard[key].GetCoords()
-            region = Video.getSubRect(diff, coords)
-
-            variance = sum(cv2.integral(np.asarray(region))[-1][-1])
-            if variance > 35000:
+        self.cellSums = self.getCellSums(currentBoard, diff)
+        if MovementDetector.debug:
+            print ("cell difference sums: %s" % (self.cellSums))
+        for key, variance in self.cellSums.items():
+            if variance > MovementDetector.movementThreshold:
                 movements.append(key)
 
         if len(movements) < 2:  # at least two cells must be moved
@@ -80,5 +85,33 @@ class MovementDetector(object):
         return movements
 
 
+    @staticmethod
+    def getCellSums(board, diff):
+        """get the sums of the given difference image over all channels for the cells of the given board
+        - cells are summed one by one with cv2.sumElems
+        - heavily overlapping cells are read from a single integral image of their bounding box with four corner lookups per cell
+
+        Returns: dict of sums by cell key"""
+        keys = list(board.keys())
+        if len(keys) == 0:
+            return {}
+        H, W = diff.shape[:2]
+        x, y, w, h = np.array([board[key].GetCoords() for key in keys]).T
+        # clip like the slicing of Video.getSubRect
+        x0, y0 = np.clip(x, 0, W), np.clip(y, 0, H)
+        x1, y1 = np.clip(x + w, x0, W), np.clip(y + h, y0, H)
+        left, top = x0.min(), y0.min()
+        right, bottom = x1.max(), y1.max()
+        cellArea = int(((x1 - x0) * (y1 - y0)).sum())
+        if cellArea < MovementDetector.integralCoverage * (right - left) * (bottom - top):
+            # the integral would cost more than summing the cells
+            sums = [int(sum(cv2.sumElems(diff[cy0:cy1, cx0:cx1]))) for cx0, cy0, cx1, cy1 in zip(x0, y0, x1, y1)]
+            return dict(zip(keys, sums))
+        integral = cv2.integral(diff[top:bottom, left:right])
+        x0, x1, y0, y1 = x0 - left, x1 - left, y0 - top, y1 - top
+        sums = integral[y1, x1].astype(np.int64) - integral[y0, x1] - integral[y1, x0] + integral[y0, x0]
+        return dict(zip(keys, sums.reshape(len(keys), -1).sum(axis=1).tolist()))
+
+
 if __name__ == "__main__":
     sys.stderr.write("This module is not designed to be run standalone.")
@@ -2,6 +2,7 @@
 # part of https://github.com/WolfgangFahl/play-chess-with-a-webcam
 import math
 import sys
+import numpy as np
 from collections import deque
 
 class MovingAverage:
@@ -39,6 +40,12 @@ class MinMaxMixin(object):
         if value<self.min:
             self.min=value   
             
+    def pushMinMaxArray(self,values):
+        """ update minimum and maximum from the given array of values """
+        if values.size>0:
+            self.pushMinMax(values.min().item())
+            self.pushMinMax(values.max().item())
+            
     def __str__(self):        
         return self.formatMinMax()        
             
@@ -76,6 +83,36 @@ class RunningStats:
             self.old_m = self.new_m
             self.old_s = self.new_s
 
+    def push_array(self, values):
+        """ push all values of the given array at once - the statistics of the array are combined with mine """
+        x = np.asarray(values, dtype=np.float64).ravel()
+        if x.size == 0:
+            return
+        m = float(x.mean())
+        d = x - m
+        s = float(np.dot(d, d))
+        self.combine(x.size, m, s)
+
+    def merge(self, other):
+        """ merge the statistics of the given other RunningStats e.g. calculated in another thread or process into mine """
+        if other.n > 0:
+            self.combine(other.n, other.old_m, other.old_s)
+
+    def combine(self, n, m, s):
+        """ combine my statistics with the count n, mean m and sum of squared differences s of other values using Chan's parallel algorithm
+        see https://en.wikipedia.org/wiki/Algorithms_for_calculating_variance#Parallel_algorithm """
+        if self.n == 0:
+            self.new_m = m
+            self.new_s = s
+        else:
+            total = self.n + n
+            delta = m - self.old_m
+            self.new_m = self.old_m + delta * n / total
+            self.new_s = self.old_s + s + delta * delta * self.n * n / total
+        self.n += n
+        self.old_m = self.new_m
+        self.old_s = self.new_s
+
     def mean(self):
         return self.new_m if self.n else 0.0
 
@@ -104,12 +141,93 @@ class MinMaxStats(RunningStats,MinMaxMixin):
         super().push(value)
         super().pushMinMax(value)
         
+    def push_array(self,values):
+        values=np.asarray(values)
+        super().push_array(values)
+        super().pushMinMaxArray(values)
+        
+    def merge(self,other):
+        super().merge(other)
+        if other.n>0:
+            super().pushMinMax(other.min)
+            super().pushMinMax(other.max)
+        
     def formatMinMax(self,formatR="%d: %.1f ± %.1f",formatM=" %.1f - %.1f"):
         text=super().format(formatR)
         if self.n>0:
             text+=super().formatMinMax(formatM)
         return text    
         
+class RunningStatsArray:
+    """ running statistics of an array of values that are updated together e.g. the changes of the 8x8 squares of a chess board """
+
+    def __init__(self, shape):
+        self.n = np.zeros(shape, dtype=np.int64)
+        self.m = np.zeros(shape)
+        self.s = np.zeros(shape)
+
+    def clear(self, index=Ellipsis):
+        self.n[index] = 0
+        self.m[index] = 0
+        self.s[index] = 0
+
+    def push(self, values, mask=None):
+        """ push the given array of values using Welford's algorithm elementwise - only where the given mask is set """
+        values = np.asarray(values, dtype=np.float64)
+        if mask is None:
+            mask = np.ones(self.n.shape, dtype=bool)
+        n = self.n + mask
+        delta = np.where(mask, values - self.m, 0)
+        m = self.m + delta / np.maximum(n, 1)
+        self.s = self.s + delta * (values - m)
+        self.m = m
+        self.n = n
+
+    def mean(self):
+        return np.where(self.n > 0, self.m, 0.0)
+
+    def variance(self):
+        return np.where(self.n > 1, self.s / np.maximum(self.n - 1, 1), 0.0)
+
+    def element(self, index):
+        """ get the running statistics of the element with the given index """
+        return RunningStatsElement(self, index)
+
+
+class RunningStatsElement:
+    """ the running statistics of a single element of a RunningStatsArray """
+
+    def __init__(self, statsArray, index):
+        self.statsArray = statsArray
+        self.index = index
+
+    @property
+    def n(self):
+        return int(self.statsArray.n[self.index])
+
+    def clear(self):
+        self.statsArray.clear(self.index)
+
+    def push(self, value):
+        stats, i = self.statsArray, self.index
+        x = float(value)
+        stats.n[i] += 1
+        delta = x - stats.m[i]
+        stats.m[i] += delta / stats.n[i]
+        stats.s[i] += delta * (x - stats.m[i])
+
+    def mean(self):
+        return float(self.statsArray.m[self.index]) if self.n else 0.0
+
+    def variance(self):
+        n = self.n
+        return float(self.statsArray.s[self.index]) / (n - 1) if n > 1 else 0.0
+
+    def standard_deviation(self):
+        return math.sqrt(self.variance())
+
+    def __str__(self):
+        return "%d: %.1f ± %.1f" % (self.n, self.mean(), self.standard_deviation())
     
 class ColorStats():
     """ calculate the RunningStats for 3 color channels like RGB or HSV simultaneously"""
@@ -129,6 +247,34 @@ class ColorStats():
         self.c2Stats.push(c2)
         self.c3Stats.push(c3)
 
+    def push_array(self, colors):
+        """ push the given array of colors e.g. pixels with shape (n,3) or (h,w,3) """
+        colors = np.asarray(colors).reshape(-1, 3)
+        self.c1Stats.push_array(colors[:, 0])
+        self.c2Stats.push_array(colors[:, 1])
+        self.c3Stats.push_array(colors[:, 2])
+
+    def merge(self, other):
+        """ merge the statistics of the given other ColorStats into mine """
+        self.c1Stats.merge(other.c1Stats)
+        self.c2Stats.merge(other.c2Stats)
+        self.c3Stats.merge(other.c3Stats)
+
+    @staticmethod
+    def ofSamples(samples):
+        """ get a list of ColorStats for the given (n,k,3) array of k color samples for each of n regions e.g. fields """
+        x = np.asarray(samples, dtype=np.float64)
+        k = x.shape[1]
+        means = x.mean(axis=1)
+        sqsums = np.square(x - means[:, None, :]).sum(axis=1)
+        colorStatsList = []
+        for index in range(len(x)):
+            colorStats = ColorStats()
+            for channel, stats in enumerate((colorStats.c1Stats, colorStats.c2Stats, colorStats.c3Stats)):
+                stats.combine(k, float(means[index, channel]), float(sqsums[index, channel]))
+            colorStatsList.append(colorStats)
+        return colorStatsList
+
     def mean(self):
         return (self.c1Stats.mean(), self.c2Stats.mean(), self.c3Stats.mean())
 
@@ -0,0 +1,100 @@
+#!/usr/bin/python3
+# part of https://github.com/WolfgangFahl/play-chess-with-a-webcam
+from pcwawc.YamlAbleMixin import YamlAbleMixin
+from collections import deque
+import cv2
+import numpy as np
+import os
+import re
+
+
+class StableFrameCalibration(YamlAbleMixin):
+    """ the calibrated difference threshold for stable frames of an input device """
+
+    def __init__(self, device, threshold):
+        self.device = str(device)
+        self.threshold = threshold
+
+    @staticmethod
+    def fileName(path, device):
+        """ get the file name (without postfix) of the calibration of the given device in the given path """
+        return path + "/stableframe-" + re.sub(r'[^A-Za-z0-9]+', '_', str(device)).strip('_')
+
+    @staticmethod
+    def load(path, device):
+        """ load the calibration of the given device from the given path - None if there is no valid one yet"""
+        calibration = StableFrameCalibration.readYaml(StableFrameCalibration.fileName(path, device))
+        if calibration is not None and calibration.device != str(device):
+            return None
+        # a broken calibration needs to be redone
+        if calibration is not None and not np.isfinite(calibration.threshold):
+            return None
+        return calibration
+
+    def save(self, path):
+        if not np.isfinite(self.threshold):
+            raise Exception("invalid stable frame threshold %s for device %s" % (self.threshold, self.device))
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        self.writeYaml(StableFrameCalibration.fileName(path, self.device))
+
+
+class StableFrameDetector(object):
+    """ detect stable frames e.g. without hands moving over the board by comparing each frame with a short ring of previous frames
+    at a heavily downscaled grayscale resolution"""
+    debug = False
+
+    def __init__(self, threshold=None, stableFrames=3, ringSize=4, size=(64, 48)):
+        """ construct me with the given mean absolute difference threshold per pixel,
+        the number of consecutive frames that need to be below the threshold,
+        the number of previous frames to compare with and the size of the downscaled frames"""
+        self.threshold = threshold
+        self.stableFrames = stableFrames
+        self.size = size
+        self.ring = deque([], ringSize)
+        self.stableCount = 0
+        self.difference = None
+
+    def smallGray(self, frame):
+        """ get the downscaled grayscale version of the given frame """
+        if frame.ndim == 3:
+            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        # keep the fraction of the averaged gray levels
+        return cv2.resize(frame.astype(np.float32), self.size, interpolation=cv2.INTER_AREA)
+
+    def frameDifference(self, small):
+        """ get the maximum mean absolute difference per pixel of the given downscaled frame to the frames in the ring
+        - None if the ring is empty"""
+        if len(self.ring) == 0:
+            return None
+        return max(float(cv2.norm(small, previous, cv2.NORM_L1)) / small.size for previous in self.ring)
+
+    def push(self, frame):
+        """ add the given frame and return True if it is stable that is the last stableFrames frames were below the threshold"""
+        small = self.smallGray(frame)
+        self.difference = self.frameDifference(small)
+        self.ring.append(small)
+        if self.difference is not None and self.threshold is not None and self.difference <= self.threshold:
+            self.stableCount += 1
+        else:
+            self.stableCount = 0
+        if StableFrameDetector.debug:
+            print ("frame difference %s threshold %s stable count %d" % (self.difference, self.threshold, self.stableCount))
+        return self.stableCount >= self.stableFrames
+
+    def calibrate(self, frames, sigmas=3):
+        """ calibrate the threshold from the given frames of a still scene as the mean plus sigmas standard deviations
+        of the differences caused by the camera noise """
+        differences = []
+        self.ring.clear()
+        for frame in frames:
+            small = self.smallGray(frame)
+            difference = self.frameDifference(small)
+            if difference is not None:
+                differences.append(difference)
+            self.ring.append(small)
+        if len(differences) == 0:
+            raise Exception("need at least two frames to calibrate but got %d" % (len(frames)))
+        self.threshold = float(np.mean(differences) + sigmas * np.std(differences))
+        self.stableCount = 0
+        return self.threshold
@@ -5,7 +5,7 @@ import sys
 import numpy as np
 from pcwawc.Cell import Cell
 from pcwawc.Board import Board
-from pcwawc.mathUtils import intersectHoughLines, distance
+from pcwawc.mathUtils import intersectHoughLinesArray, uniquePoints
 from pcwawc.Video import Video
 
 class CannotBuildStateException(Exception):
@@ -19,8 +19,12 @@ class CannotBuildStateException(Exception):
 
 class StateDetector(object):
     debug = True
-    maxLines = 1000
+    # optional limit for the number of hough lines e.g. 1000 - None for no limit
+    maxLines = None
     minCellSize = 20
+    # number of times the image is halved for the hough transform and whether to refine the lines at full resolution
+    houghPyramidLevels = 0
+    houghRefine = False
 
     def detectState(self, colorImage):
         """Returns a board (key = address, value = cell) according to the given colorImage.
@@ -40,39 +44,25 @@ class StateDetector(object):
 
     def _findIntersects(self):
         """ Performs an Hough Transform to the actual self.image. """
-        self.lines = self.video.houghTransformP(self.image)
+        self.lines = self.video.houghTransformP(self.image, StateDetector.houghPyramidLevels, StateDetector.houghRefine)
         H, W = self.image.shape[:2]
 
         # Gets the Hough line intersections
         intersects = []
         distanceBetweenIntersectionsThreshold = 60
-        # this algorithm has quadratic effort
-        lineCount = len(self.lines)
+        lineCount = 0 if self.lines is None else len(self.lines)
         if StateDetector.debug:
             print ("found %d lines to intersect" % (lineCount))
-        if lineCount > StateDetector.maxLines:
+        if StateDetector.maxLines is not None and lineCount > StateDetector.maxLines:
             msg = 'Found %d lines which is more than StateDetector.maxLines=%d' % (lineCount, StateDetector.maxLines)
             if StateDetector.debug:
                 print (msg)
             raise CannotBuildStateException(msg)
-        if self.lines is not None:
-            for lineIndex, line in enumerate(self.lines):
-                for crosslineIndex, crossline in enumerate(self.lines):
-                    if lineIndex != crosslineIndex:
-                        thisIntersect = intersectHoughLines(line, crossline)
-
-                        if thisIntersect and \
-                        all([a > 0 for a in thisIntersect]) and \
-                        all([thisIntersect[0] < W, thisIntersect[1] < H]):
-                            intersectSecondary = intersectHoughLines(line, crossline)
-                            found = False
-                            for intersectPrimary in intersects:
-                                if found:
-                                    continue
-                                if distance(intersectPrimary, intersectSecondary) < distanceBetweenIntersectionsThreshold:
-                                    found = True
-                            if found == False:
-                                intersects.append(intersectSecondary)
+        if lineCount > 1:
+            # all pairwise intersections at once - only those inside the image are of interest
+            points = intersectHoughLinesArray(self.lines)
+            inside = (points[:, 0] > 0) & (points[:, 1] > 0) & (points[:, 0] < W) & (points[:, 1] < H)
+            intersects = uniquePoints(points[inside], distanceBetweenIntersectionsThreshold)
         intersects.sort()
         return intersects
 
@@ -7,9 +7,10 @@ from time import strftime
 from pcwawc.FPSCheck import FPSCheck
 from imutils import perspective
 import argparse
-from threading import Thread
+from threading import Thread, Condition
 import os
 import sys
+import time
 
 class Video:
     """ Video handling e.g. recording/writing """
@@ -250,28 +251,134 @@ class Video:
     # was: http://www.robindavid.fr/opencv-tutorial/chapter5-line-edge-and-contours-detection.html
     # is: https://opencv-python-tutroals.readthedocs.io/en/latest/py_tutorials/py_imgproc/py_houghlines/py_houghlines.html
     # https://docs.opencv.org/3.4/d9/db0/tutorial_hough_lines.html
-    def houghTransform(self, image):
+    def houghTransform(self, image, pyramidLevels=0, refine=False):
         """Performs an Hough Transform to given image.
 
+        pyramidLevels: number of times the image is halved before the transform - rho is scaled back
+        refine: refine the lines in narrow bands of the full resolution edges
+
         Returns: lines"""
         gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        edges = cv2.Canny(gray, 50, 150, apertureSize=3)
-        lines = cv2.HoughLines(edges, 1, np.pi / 180, 200)
+        edges, scale = self.pyramidEdges(gray, pyramidLevels)
+        lines = cv2.HoughLines(edges, 1, np.pi / 180, self.houghThreshold(200, scale))
+        if lines is not None and scale > 1:
+            lines[..., 0] *= scale
+            if refine:
+                lines = self.refineHoughLines(self.canny(gray), lines, scale)
         return lines
 
-    def houghTransformP(self, image):
+    def houghTransformP(self, image, pyramidLevels=0, refine=False):
         """Performs a probabilistic Hough Transform to given image.
 
+        pyramidLevels: number of times the image is halved before the transform - the end points are scaled back
+        refine: refine the line segments in narrow bands of the full resolution edges
+
         Returns: lines"""
         gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        edges = cv2.Canny(gray, 50, 150, apertureSize=3)
-        h, w = image.shape[:2]
+        edges, scale = self.pyramidEdges(gray, pyramidLevels)
+        h, w = edges.shape[:2]
         minLineLength = h / 16
         maxLineGap = h / 24
         lines = cv2.HoughLinesP(edges, 1, np.pi / 180,
-                                100, minLineLength, maxLineGap)
+                                self.houghThreshold(100, scale), minLineLength, maxLineGap)
+        if lines is not None and scale > 1:
+            lines *= scale
+            if refine:
+                lines = self.refineHoughLinesP(self.canny(gray), lines, scale)
         return lines
 
+    def canny(self, gray):
+        """get the edges of the given grayscale image as used for the hough transforms"""
+        return cv2.Canny(gray, 50, 150, apertureSize=3)
+
+    def houghThreshold(self, threshold, scale):
+        """get the accumulator threshold for an image downscaled by the given scale
+        - the board lines loose votes with the square root of the scale only since their edge pixels
+        spread over less rho bins at the coarser resolution - this keeps the number of lines comparable"""
+        return int(round(threshold / math.sqrt(scale)))
+
+    def pyramidEdges(self, gray, pyramidLevels):
+        """get the edges of the given grayscale image halved pyramidLevels times
+        together with the scale to get back to the full resolution"""
+        for level in range(pyramidLevels):
+            gray = cv2.pyrDown(gray)
+        return self.canny(gray), 2 ** pyramidLevels
+
+    def voteHoughLine(self, xs, ys, rho, theta, steps=1):
+        """vote for the best line near rho, theta with the given edge pixels
+
+        Returns: rho, theta of the line with the most votes within steps of the hough resolution"""
+        # stay on the theta grid of the hough transform
+        thetaIndices = int(round(theta / (np.pi / 180))) + np.arange(-steps, steps + 1)
+        thetas = thetaIndices * np.pi / 180
+        rhos = np.rint(np.outer(np.cos(thetas), xs) + np.outer(np.sin(thetas), ys)).astype(np.int64)
+        rhoMin = rhos.min()
+        binCount = rhos.max() - rhoMin + 1
+        votes = np.bincount((rhos - rhoMin + np.arange(len(thetas))[:, None] * binCount).ravel(),
+                            minlength=len(thetas) * binCount)
+        thetaIndex, rhoIndex = divmod(np.argmax(votes), binCount)
+        rho, thetaIndex = float(rhoMin + rhoIndex), int(thetaIndices[thetaIndex])
+        # keep theta in the [0,pi) range of cv2.HoughLines
+        if thetaIndex < 0 or thetaIndex >= 180:
+            rho, thetaIndex = -rho, thetaIndex % 180
+        theta = thetaIndex * np.pi / 180
+        return rho, theta
+
+    def bandPixels(self, edges, rho, theta, bandWidth, extent=None):
+        """get the coordinates of the edge pixels within bandWidth of the line rho, theta
+        by walking along the line - optionally only within the given (min,max) range of the walking coordinate
+
+        Returns: xs, ys"""
+        h, w = edges.shape[:2]
+        c, s = math.cos(theta), math.sin(theta)
+        # walk along x for the more horizontal lines and along y for the more vertical ones
+        horizontal = abs(s) >= abs(c)
+        walkSize, crossSize = (w, h) if horizontal else (h, w)
+        walkCos, crossCos = (c, s) if horizontal else (s, c)
+        walkFrom, walkTo = 0, walkSize
+        if extent is not None:
+            walkFrom, walkTo = max(int(extent[0] - bandWidth), 0), min(int(extent[1] + bandWidth) + 1, walkSize)
+        walk = np.arange(walkFrom, walkTo)
+        reach = int(math.ceil(bandWidth / abs(crossCos)))
+        cross = np.rint((rho - walk * walkCos) / crossCos).astype(np.int64)[:, None] + np.arange(-reach, reach + 1)
+        walk = np.broadcast_to(walk[:, None], cross.shape)
+        inside = (cross >= 0) & (cross < crossSize)
+        walk, cross = walk[inside], cross[inside]
+        xs, ys = (walk, cross) if horizontal else (cross, walk)
+        inBand = (edges[ys, xs] > 0) & (np.abs(xs * c + ys * s - rho) <= bandWidth)
+        return xs[inBand], ys[inBand]
+
+    def refineHoughLines(self, edges, lines, bandWidth):
+        """refine the given lines of cv2.HoughLines with the edge pixels in a band of the given width around each line"""
+        refined = lines.copy()
+        for line in refined.reshape(-1, 2):
+            rho, theta = line
+            xs, ys = self.bandPixels(edges, rho, theta, bandWidth)
+            if len(xs) > 0:
+                line[:] = self.voteHoughLine(xs, ys, rho, theta)
+        return refined
+
+    def refineHoughLinesP(self, edges, lines, bandWidth):
+        """refine the given line segments of cv2.HoughLinesP with the edge pixels in a band of the given width around each segment
+        by projecting the end points on the refined line"""
+        refined = lines.copy()
+        for line in refined.reshape(-1, 4):
+            x1, y1, x2, y2 = line.astype(np.float64)
+            if x1 == x2 and y1 == y2:
+                continue
+            # the normal form of the segment
+            theta = math.atan2(x2 - x1, y1 - y2) % np.pi
+            rho = x1 * math.cos(theta) + y1 * math.sin(theta)
+            extent = (min(x1, x2), max(x1, x2)) if abs(math.sin(theta)) >= abs(math.cos(theta)) else (min(y1, y2), max(y1, y2))
+            xs, ys = self.bandPixels(edges, rho, theta, bandWidth, extent)
+            if len(xs) > 0:
+                rho, theta = self.voteHoughLine(xs, ys, rho, theta)
+                nx, ny = math.cos(theta), math.sin(theta)
+                for x, y, index in ((x1, y1, 0), (x2, y2, 2)):
+                    offset = x * nx + y * ny - rho
+                    line[index:index + 2] = (int(round(x - offset * nx)), int(round(y - offset * ny)))
+        return refined
+
     def drawTrapezoid(self, image, points, color):
         # loop over the points and draw them on the image
         prev = None
@@ -317,14 +424,38 @@ class Video:
         # return the rotated image
         return rotated
 
-    def warp(self, image, pts, squared=True):
-        """apply the four point tranform to obtain a birds eye view of the given image """
-        warped = perspective.four_point_transform(image, pts)
+    @staticmethod
+    def warpMatrix(pts, rotation=0, squared=True):
+        """ get the 3x3 matrix and target size of the four point transform of the given points combined with
+        resizing to a square and the rotation by the given angle so that an image needs to be resampled only once"""
+        rect = perspective.order_points(np.array(pts))
+        (tl, tr, br, bl) = rect
+        # same target size as imutils four_point_transform
+        width = max(int(np.linalg.norm(br - bl)), int(np.linalg.norm(tr - tl)))
+        height = max(int(np.linalg.norm(tr - br)), int(np.linalg.norm(tl - bl)))
+        dst = np.array([[0, 0], [width - 1, 0], [width - 1, height - 1], [0, height - 1]], dtype="float32")
+        matrix = cv2.getPerspectiveTransform(rect, dst)
         if squared:
-            height, width = warped.shape[:2]
             side = min(width, height)
-            warped = cv2.resize(warped, (side, side))
-        return warped
+            # map the pixel centers the same way as cv2.resize does
+            sx, sy = side / width, side / height
+            scale = np.array([[sx, 0, 0.5 * sx - 0.5], [0, sy, 0.5 * sy - 0.5], [0, 0, 1]])
+            matrix = scale @ matrix
+            width, height = side, side
+        if rotation > 0:
+            # same rotation as the rotate function
+            rotate = np.vstack([cv2.getRotationMatrix2D((width // 2, height // 2), rotation, 1.0), [0, 0, 1]])
+            matrix = rotate @ matrix
+        return matrix, (width, height)
+
+    def transform(self, image, matrix, size):
+        """ apply the given 3x3 matrix to the given image resulting in an image of the given size """
+        return cv2.warpPerspective(image, matrix, size)
+
+    def warp(self, image, pts, squared=True):
+        """apply the four point tranform to obtain a birds eye view of the given image """
+        matrix, size = Video.warpMatrix(pts, squared=squared)
+        return self.transform(image, matrix, size)
 
     @staticmethod
     def getSubRect(image, rect):
@@ -370,49 +501,130 @@ class Video:
 
 # see https://www.pyimagesearch.com/2017/02/06/faster-video-file-fps-with-cv2-videocapture-and-opencv/
 class VideoStream(object):
-    """run videograbbing in separate stream"""
-
-    def __init__(self, video, show=False, postProcess=None, name='VideoStream'):
+    """ run video grabbing in a separate thread that owns the capture of the given video and decodes into a
+    preallocated ring of frame buffers so that decoding overlaps with the processing of the previous frames"""
+    # policies for a full ring - drop the oldest unread frame or block the capture until a frame is read
+    DROP_OLDEST = "dropOldest"
+    BLOCK = "block"
+
+    def __init__(self, video, ringSize=4, policy=DROP_OLDEST, name='VideoStream'):
+        """ construct me for the given video with the given number of frame buffers and full ring policy """
+        if ringSize < 2:
+            raise Exception("ringSize %d is too small - need at least two frame buffers" % (ringSize))
+        if policy not in [VideoStream.DROP_OLDEST, VideoStream.BLOCK]:
+            raise Exception("unknown policy %s" % (policy))
         self.video = video
-        self.show = show
-        self.quit = False
-        self.frame = None
-        # initialize the thread name
+        self.ringSize = ringSize
+        self.policy = policy
         self.name = name
-        self.postProcess = postProcess
-
+        # the frame buffers are allocated when the first frame has been captured
+        self.buffers = None
+        self.timestamps = [None] * ringSize
+        # number of frames captured so far and index of the next unread frame
+        self.written = 0
+        self.readIndex = 0
+        self.dropped = 0
+        self.condition = Condition()
+        self.thread = None
         # initialize the variable used to indicate if the thread should
         # be stopped
         self.stopped = False
 
     def start(self):
         # start the thread to read frames from the video stream
-        t = Thread(target=self.update, name=self.name, args=())
-        t.daemon = True
-        t.start()
+        self.thread = Thread(target=self.update, name=self.name, args=())
+        self.thread.daemon = True
+        self.thread.start()
         return self
 
-    def update(self):
-        # keep looping infinitely until the thread is stopped
-        while True:
-            # if the thread indicator variable is set, stop the thread
+    def nextSlot(self):
+        """ wait for a free slot in the ring according to my policy and return its index - None if I am stopped"""
+        with self.condition:
+            while not self.stopped and self.written - self.readIndex >= self.ringSize:
+                if self.policy == VideoStream.DROP_OLDEST:
+                    self.readIndex += 1
+                    self.dropped += 1
+                else:
+                    self.condition.wait()
             if self.stopped:
-                return
+                return None
+            # the slot is neither unread nor the latest frame so readers won't touch it while it is being written
+            return self.written % self.ringSize
 
-            ret, frame, quitWanted = video.readFrame(self.show, self.postProcess)
-            if quitWanted:
-                return
-            
-            if ret:
-                self.frame = frame
+    def update(self):
+        """ capture frames into the ring until I am stopped or the video ends """
+        video = self.video
+        while not self.stopped:
+            # when pausing the latest frame stays available
+            if video.paused():
+                time.sleep(0.01)
+                continue
+            slot = self.nextSlot()
+            if slot is None:
+                break
+            if self.buffers is None:
+                ret, frame = video.cap.read()
+                if ret:
+                    self.buffers = [np.empty_like(frame) for i in range(self.ringSize)]
+                    self.buffers[slot][...] = frame
+            else:
+                ret, frame = video.cap.read(self.buffers[slot])
+                # the capture might have changed the frame size
+                if ret and frame is not self.buffers[slot]:
+                    self.buffers[slot] = frame
+            if not ret:
+                break
+            video.frames = video.frames + 1
+            if video.frames >= video.maxFrames and video.autoPause:
+                video.pause(True)
+            video.fpsCheck.update()
+            with self.condition:
+                self.timestamps[slot] = time.time()
+                self.written += 1
+                self.condition.notify_all()
+        self.stop()
+
+    def readSlot(self, index):
+        """ return a copy of the frame with the given index and its capture timestamp - to be called with the condition held"""
+        slot = index % self.ringSize
+        return self.buffers[slot].copy(), self.timestamps[slot]
+
+    def read(self, timeout=None):
+        """ return the oldest unread frame and its capture timestamp waiting at most timeout seconds for it
+        - None,None if there is none"""
+        with self.condition:
+            while self.readIndex >= self.written:
+                if self.stopped or not self.condition.wait(timeout):
+                    return None, None
+            frame, timestamp = self.readSlot(self.readIndex)
+            self.readIndex += 1
+            self.condition.notify_all()
+            return frame, timestamp
+
+    def waitForFrame(self, timeout=None):
+        """ wait at most timeout seconds for an unread frame and return True if there is one """
+        with self.condition:
+            while self.readIndex >= self.written:
+                if self.stopped or not self.condition.wait(timeout):
+                    return False
+            return True
 
-    def read(self):
-        # return the frame most recently read
-        return self.frame
+    def readLatest(self):
+        """ return the most recently captured frame and its capture timestamp without waiting skipping all unread frames
+        - None,None if no frame has been captured yet"""
+        with self.condition:
+            if self.written == 0:
+                return None, None
+            frame, timestamp = self.readSlot(self.written - 1)
+            self.readIndex = self.written
+            self.condition.notify_all()
+            return frame, timestamp
 
     def stop(self):
-        # indicate that the thread should be stopped
-        self.stopped = True
+        # indicate that the thread should be stopped and wake up waiting readers and the capture
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,92 @@
+#!/usr/bin/python3
+# part of https://github.com/WolfgangFahl/play-chess-with-a-webcam
+from threading import Thread, Condition
+import logging
+
+
+class VideoHub(object):
+    """ process and encode each frame of a frame source once and broadcast the resulting multipart JPEG part
+    to all subscribed clients - slow clients skip to the newest frame"""
+
+    def __init__(self, source, postProcess=None, imgformat=".jpg", timeout=0.1, name='VideoHub', logger=None):
+        """ construct me for the given frame source e.g. a video stream or analysis worker
+        with the given post processing of the frames and logger for errors"""
+        self.source = source
+        self.video = source.video
+        self.postProcess = postProcess
+        self.imgformat = imgformat
+        self.timeout = timeout
+        self.name = name
+        self.logger = logger if logger is not None else logging.getLogger(__name__)
+        # the latest multipart part and its index
+        self.part = None
+        self.index = 0
+        self.subscribers = 0
+        self.condition = Condition()
+        self.thread = None
+        self.stopped = False
+
+    def start(self):
+        # start the thread to process and encode the frames
+        self.thread = Thread(target=self.update, name=self.name, args=())
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def processFrame(self, frame):
+        """ post process the given frame """
+        if self.postProcess is None:
+            return frame
+        try:
+            return self.postProcess(frame)
+        except BaseException:
+            self.logger.exception("processing error")
+            return frame
+
+    def update(self):
+        """ process, encode and publish frames while there are subscribers until the frame source ends or I am stopped"""
+        while not self.stopped:
+            with self.condition:
+                # idle while nobody is watching
+                while self.subscribers == 0 and not self.stopped:
+                    self.condition.wait()
+            frame, timestamp = self.source.read(timeout=self.timeout)
+            if frame is None:
+                if self.source.stopped:
+                    break
+                continue
+            flag, encodedImage = self.video.imencode(self.processFrame(frame), self.imgformat)
+            # ensure we got a valid image
+            if not flag:
+                continue
+            part = b'--frame\r\n' b'Content-Type: image/jpeg\r\n\r\n' + encodedImage.tobytes() + b'\r\n'
+            with self.condition:
+                self.part = part
+                self.index += 1
+                self.condition.notify_all()
+        self.stop()
+
+    def parts(self):
+        """ generate the multipart parts for a client starting with the latest one """
+        with self.condition:
+            self.subscribers += 1
+            lastIndex = self.index - 1 if self.part is not None else self.index
+            self.condition.notify_all()
+        try:
+            while True:
+                with self.condition:
+                    while self.index <= lastIndex and not self.stopped:
+                        self.condition.wait()
+                    if self.index <= lastIndex:
+                        return
+                    part, lastIndex = self.part, self.index
+                yield part
+        finally:
+            with self.condition:
+                self.subscribers -= 1
+
+    def stop(self):
+        # indicate that the thread should be stopped and wake up waiting clients
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
@@ -3,14 +3,23 @@
 from pcwawc.Board import Board
 from pcwawc.BoardDetector import BoardDetector
 from pcwawc.Environment import Environment
-from pcwawc.Video import Video
+from pcwawc.Video import Video, VideoStream
+from pcwawc.VideoHub import VideoHub
+from pcwawc.AnalysisWorker import AnalysisWorker
+from pcwawc.GameSaver import GameSaver
+from pcwawc.GameJournal import GameJournal
+from pcwawc.EventStream import EventStream
 from pcwawc.Game import WebCamGame, Warp
-from flask import render_template, send_from_directory, Response, jsonify
+from flask import render_template, send_from_directory, Response, jsonify, request
 from datetime import datetime
+from threading import Lock
+import os
 
 class WebApp:
     """ actual Play Chess with a WebCam Application - Flask calls are routed here """
     debug = False
+    # capture and analyze the video in separate threads
+    threadedCapture = True
 
     # construct me with the given settings
     def __init__(self, args, logger=None):
@@ -20,27 +29,75 @@ class WebApp:
         self.setDebug(args.debug)
         self.video = Video()
         self.videoStream = None
+        self.videoHub = None
+        self.analysisWorker = None
+        self.videoLock = Lock()
         self.board = Board()
+        # push moves and positions to the clients
+        self.events = EventStream()
         self.boardDetector = BoardDetector(self.board, self.video,args.speedup)
+        # push the moves detected by the board detector to the clients
+        self.events.watch(self.boardDetector.detectState)
+        self.warpKey = None
         self.env = Environment()
+        # save the games in the background and when being closed
+        self.gameSaver = GameSaver(logger=logger).start()
         # not recording
         self.videopath=None
         self.videoout=None
-        if args.game is None:
-            self.webCamGame = self.createNewCame()
-        else:
-            gamepath = args.game
-            if not gamepath.startswith("/"):
-                gamepath = self.env.games + "/" + gamepath
-            self.webCamGame = WebCamGame.readJson(gamepath)
+        self.webCamGame = None
+        if args.game is not None:
+            self.webCamGame = self.loadGame(args.game)
             if self.webCamGame is None:
-                self.log("could not read %s " % (gamepath))
-                self.webCamGame = self.createNewCame() 
+                self.log("could not read %s " % (args.game))
+        newGame = self.webCamGame is None
+        if newGame:
+            self.webCamGame = self.createNewCame()
         self.webCamGame.checkEnvironment(self.env)        
         self.game = self.webCamGame.game    
-        self.log("Warp: %s" % (args.warpPointList))
-        self.warp = Warp(args.warpPointList)
-        self.warp.rotation = args.rotation
+        self.journal = GameJournal(self.webCamGame, self.board, gameSaver=self.gameSaver)
+        if newGame:
+            # never continue the journal of an earlier game that got the same id
+            self.journal.create()
+        else:
+            # recover the game from its journal
+            replayed = self.journal.replay()
+            self.log("replayed %d journal entries of game %s" % (replayed, self.webCamGame.gameid))
+        if args.game is not None and not args.warpPointList:
+            self.warp = self.webCamGame.warp
+        else:
+            self.log("Warp: %s" % (args.warpPointList))
+            self.warp = Warp(args.warpPointList)
+            self.warp.rotation = args.rotation
+        self.webCamGame.warp = self.warp
+
+    def close(self):
+        """ stop analyzing the video, compact the journal and save the pending games """
+        self.stopAnalysis()
+        if self.journal.entries > 0:
+            self.gameSaver.save(self.journal, self.journal.path)
+        self.gameSaver.stop()
+
+    def loadGame(self, game):
+        """ load the web cam game with the given path or id - a game that has not been saved yet e.g. due to a crash
+        is recovered from its journal alone - None if there is neither a save nor a journal"""
+        gamepath = game
+        if not gamepath.startswith("/"):
+            gamepath = self.env.games + "/" + gamepath
+        # a game id refers to the save in the directory of the game
+        if os.path.isdir(gamepath):
+            gamepath = gamepath.rstrip("/")
+            gamepath = gamepath + "/" + os.path.basename(gamepath) + "-webcamgame"
+        webCamGame = WebCamGame.readJson(gamepath)
+        if webCamGame is None:
+            gameid = os.path.basename(gamepath)
+            for postfix in [".json", "-webcamgame"]:
+                if gameid.endswith(postfix):
+                    gameid = gameid[:-len(postfix)]
+            webCamGame = WebCamGame(gameid)
+            if not GameJournal(webCamGame, self.board).exists():
+                webCamGame = None
+        return webCamGame
 
     def createNewCame(self):
         return WebCamGame("game" + self.video.fileTimeStamp())
@@ -52,12 +109,11 @@ class WebApp:
     # return the index.html template content with the given message
     def index(self, msg):
         self.log(msg)
-        self.webCamGame.warp = self.warp
-        self.webCamGame.save()
         gameid = self.webCamGame.gameid
         return render_template('index.html', message=msg, timeStamp=self.video.timeStamp(), gameid=gameid)
 
     def home(self):
+        self.stopAnalysis()
         self.video = Video()
         return self.index("Home")
 
@@ -78,11 +134,10 @@ class WebApp:
     def chessTakeback(self):
         try:
             msg = "take back"
-            self.board.takeback()
-            if self.game.moveIndex > 0:
-                self.game.moveIndex = self.game.moveIndex - 1
-            else:
+            if self.game.moveIndex == 0:
                 msg = "can not take back any more moves"    
+            self.journal.takeback()
+            self.publishState("takeback")
             if WebApp.debug:
                 self.game.showDebug()
             return self.index(msg)
@@ -93,6 +148,7 @@ class WebApp:
         # @TODO implement locking of a saved game to make it immutable
         gameid = self.webCamGame.gameid
         self.game.locked = True
+        self.gameSaver.save(self.journal, self.journal.path)
         msg = "chess game <a href='/chess/games/%s'>%s</a> saved(locked)" % (gameid, gameid)
         return self.index(msg)
     
@@ -112,10 +168,8 @@ class WebApp:
         try:
             if "-" in move:
                 move = move.replace('-', '')
-            self.board.move(move)
-            self.game.moveIndex = self.game.moveIndex + 1
-            self.game.fen = self.board.fen()
-            self.game.pgn = self.board.getPgn()
+            san = self.journal.move(move)
+            self.publishState("move", move=move, san=san)
             msg = "move %s -> fen= %s" % (move, self.game.fen)
             if WebApp.debug:
                 self.game.showDebug()
@@ -127,23 +181,46 @@ class WebApp:
         return datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S.%f')
                         
     def chessGameState(self, gameid):
-        fen = self.board.fen()
-        pgn = self.board.getPgn()
-        return jsonify(fen=fen, pgn=pgn, gameid=gameid, debug=WebApp.debug, timestamp=self.timeStamp())
+        """ get the state of the game - not modified if the client already has the current state version """
+        # the version needs to be up to date e.g. after direct changes of the chessboard
+        etag = "%s-%d-%s" % (gameid, self.board.refresh(), WebApp.debug)
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            response = jsonify(**self.gameState(gameid))
+        response.set_etag(etag)
+        # make sure the client revalidates its state on each poll
+        response.headers["Cache-Control"] = "no-cache"
+        return response
     
+    def gameState(self, gameid, **data):
+        """ get the state of the game with the given id and additional data """
+        return dict(fen=self.board.fen(), pgn=self.board.getPgn(), gameid=gameid, version=self.board.version, debug=WebApp.debug, timestamp=self.timeStamp(), **data)
+
+    def publishState(self, eventType, **data):
+        """ publish the current game state with the given event type and additional data to the event subscribers"""
+        self.events.publish(eventType, self.gameState(self.webCamGame.gameid, **data))
+
+    def chessEvents(self):
+        """ stream the game events as Server-Sent Events starting with the current state """
+        initialEvents = [EventStream.format("fen", self.gameState(self.webCamGame.gameid))]
+        return Response(self.events.events(initialEvents), mimetype="text/event-stream",
+                        headers={"Cache-Control": "no-cache"})
+
     def chessFEN(self, fen):
         msg = fen
         try:
-            self.board.setFEN(fen)
+            self.journal.setFEN(fen)
+            self.publishState("fen")
             msg = "game update from fen %s" % (fen)
-            self.game.fen = fen
             return self.index(msg)
         except BaseException as e:
             return self.indexException(e)
 
     def chessPgn(self, pgn):
         try:
-            self.board.setPgn(pgn)
+            self.journal.setPgn(pgn)
+            self.publishState("fen")
             msg = "game updated from pgn"
             return self.index(msg)
         except BaseException as e:
@@ -158,6 +235,7 @@ class WebApp:
             b, g, r = self.video.frame[py, px]
             colorInfo="r:%x g:%x b:%x" % (r,g,b)
         self.warp.addPoint(px, py)
+        self.journal.warp(self.warp)
         msg = "clicked warppoint %d pixel %d,%d %s mouseclick %d,%d in image %d x %d" % (len(self.warp.pointList), px, py, colorInfo, x, y, w, h)
         return self.index(msg)
 
@@ -169,7 +247,11 @@ class WebApp:
             filename = 'chessboard_%s.jpg' % (self.video.fileTimeStamp())
             # make sure the path exists
             self.webCamGame.checkDir(path)
-            self.video.still2File(path + filename, postProcess=self.warpAndRotate, close=False)
+            # the capture thread owns the capture - use the frame it delivered last
+            if self.analysisWorker is not None and self.video.processedFrame is not None:
+                self.video.writeImage(self.video.processedFrame, path + filename)
+            else:
+                self.video.still2File(path + filename, postProcess=self.warpAndRotate, close=False)
             msg = "still image <a href='/photo/%s'>%s</a> taken from input %s" % (filename, filename, self.args.input)
             return self.index(msg)
         except BaseException as e:
@@ -194,6 +276,7 @@ class WebApp:
     def videoRotate90(self):
         try:
             self.warp.rotate(90)
+            self.journal.warp(self.warp)
             msg = "rotation: %d°" % (self.warp.rotation)
             return self.index(msg)
         except BaseException as e:
@@ -212,25 +295,40 @@ class WebApp:
             self.video.capture(self.args.input)
         # return the response generated along with the specific media
         # type (mime type)
-        return Response(self.genVideo(self.video),
+        if WebApp.threadedCapture:
+            generator = self.genVideoStreamed(self.video)
+        else:
+            generator = self.genVideo(self.video)
+        return Response(generator,
                         mimetype='multipart/x-mixed-replace; boundary=frame')
 
-    # streamed video generator
-    # @TODO fix this non working code
-    # def genVideoStreamed(self, video):
-    #    if self.videoStream is None:
-    #        self.videoStream = VideoStream(self.video, show=True, postProcess=self.video.addTimeStamp)
-    #        self.videoStream.start()
-    #    while True:
-    #        frame = self.videoStream.read()
-    #        if frame is not None:
-    #            flag, encodedImage = self.video.imencode(frame)
-    #            # ensure we got a valid image
-    #            if not flag:
-    #                continue
-    #            # yield the output frame in the byte format
-    #            yield(b'--frame\r\n' b'Content-Type: image/jpeg\r\n\r\n' +
-    #                  bytearray(encodedImage) + b'\r\n')
+    def startAnalysis(self):
+        """ start capturing and analyzing the video in the background independent of the clients watching it
+        and return the video hub for the clients"""
+        with self.videoLock:
+            if self.analysisWorker is None:
+                if self.video.frames == 0:
+                    self.video.capture(self.args.input)
+                self.videoStream = VideoStream(self.video).start()
+                self.analysisWorker = AnalysisWorker(self.videoStream, self.warpAndRotate, fps=self.args.fps, logger=self.logger).start()
+                self.videoHub = VideoHub(self.analysisWorker, logger=self.logger).start()
+            return self.videoHub
+
+    def stopAnalysis(self):
+        """ stop capturing and analyzing the video """
+        with self.videoLock:
+            if self.analysisWorker is not None:
+                self.videoHub.stop()
+                self.analysisWorker.stop()
+                self.videoStream.stop()
+                self.videoHub = None
+                self.analysisWorker = None
+                self.videoStream = None
+
+    # streamed video generator - frames are captured by a separate thread, analyzed by the analysis worker and
+    # encoded once for all clients by the video hub
+    def genVideoStreamed(self, video):
+        return self.startAnalysis().parts()
 
     def warpAndRotate(self, image):
         """ warp and rotate the image as necessary - add timestamp if in debug mode """
@@ -241,11 +339,18 @@ class WebApp:
                 self.video.drawTrapezoid(image, self.warp.points, self.warp.bgrColor)
                 warped = image
             else:
-                warped = self.video.warp(image, self.warp.points)
-        if self.warp.rotation > 0:
+                # warp, resize and rotate in one pass
+                matrix, size = self.warp.transformation()
+                warped = self.video.transform(image, matrix, size)
+        if self.warp.rotation > 0 and not self.warp.warping:
             warped = self.video.rotate(warped, self.warp.rotation)
         # analyze the board if warping is active
         if self.warp.warping:
+            # changes seen with different warp points or rotation are not comparable
+            warpKey = (str(self.warp.pointList), self.warp.rotation)
+            if self.warpKey != warpKey:
+                self.boardDetector.resetDetection()
+                self.warpKey = warpKey
             warped = self.boardDetector.analyze(warped, self.video.frames, self.args.distance, self.args.step)
         if WebApp.debug:
             warped = self.video.addTimeStamp(warped)
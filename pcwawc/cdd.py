@@ -44,16 +44,7 @@ class CDDA:
         self.video.drawRectangle(image, (x1 - ot, y1 - ot), (x2 + ot, y2 + ot), thickness=ot, color=Field.green)
         
             
-    def showROI(self,roi,image):         
-        for pixel in roi.pixelList():
-            x,y=pixel
-            h, w = image.shape[:2]
-            if (x>=0 and x<w) and (y>=0 and y<h):
-                image[y,x]=Field.green
-                
     def showField(self,field,image):
-        for roi in field.rois:
-            self.showROI(roi,image)
         title=field.an
         piece = field.getPiece()
         if piece is not None:
@@ -62,14 +53,17 @@ class CDDA:
         self.video.drawCenteredText(image,title,field.pcx,field.pcy,fontBGRColor=Field.white)    
     
     def showFields(self,image):
+        # mark the pixels of the regions of interest of all fields at once
+        indices=self.boardDetector.fieldROIIndices(image,self.grid,self.roiLambda)
+        image.reshape(-1,image.shape[2])[indices.ravel()]=Field.green
         for field in self.boardDetector.genFields():
             self.showField(field,image)            
           
     def show(self):    
         cdImage=self.image.copy()
         start=timer()
-        grid=Grid(self.rois,self.xsteps,self.ysteps,safetyX=self.safetyX,safetyY=self.safetyY)
-        self.boardDetector.analyzeFields(self.image,grid,self.roiLambda)
+        self.grid=Grid(self.rois,self.xsteps,self.ysteps,safetyX=self.safetyX,safetyY=self.safetyY)
+        self.boardDetector.analyzeFields(self.image,self.grid,self.roiLambda)
         end=timer()    
         print ("analysis took %.3fs" % (end-start))
         self.showFields(cdImage)
@@ -27,91 +27,77 @@
 import numpy as np
 
 
-# Converts RGB pixel array to XYZ format.
-# Implementation derived from http://www.easyrgb.com/en/math.php
-def rgb2xyz(rgb):
+# sRGB linearization (in percent) of all 256 8-bit channel values
+def _linearize(c):
+    c = c / 255.
+    return np.where(c > 0.04045, ((c + 0.055) / 1.055) ** 2.4, c / 12.92) * 100
 
-    def format(c):
-        c = c / 255.
-        if c > 0.04045: c = ((c + 0.055) / 1.055) ** 2.4
-        else: c = c / 12.92
-        return c * 100
 
-    rgb = list(map(format, rgb))
-    xyz = [None, None, None]
-    xyz[0] = rgb[0] * 0.4124 + rgb[1] * 0.3576 + rgb[2] * 0.1805
-    xyz[1] = rgb[0] * 0.2126 + rgb[1] * 0.7152 + rgb[2] * 0.0722
-    xyz[2] = rgb[0] * 0.0193 + rgb[1] * 0.1192 + rgb[2] * 0.9505
-    return xyz
+SRGB_LINEAR = _linearize(np.arange(256, dtype=np.float64))
 
+# sRGB to XYZ matrix - rows give the X, Y and Z weights of R, G and B
+RGB2XYZ = np.array([[0.4124, 0.3576, 0.1805],
+                    [0.2126, 0.7152, 0.0722],
+                    [0.0193, 0.1192, 0.9505]])
 
-# Converts XYZ pixel array to LAB format.
+# D65 reference white
+XYZ_WHITE = np.array([95.047, 100.00, 108.883])
+
+
+# Converts an (N,3) RGB array to XYZ format.
+# 8-bit values are linearized with the SRGB_LINEAR table.
 # Implementation derived from http://www.easyrgb.com/en/math.php
-def xyz2lab(xyz):
+def rgb2xyzArray(rgb):
+    rgb = np.asarray(rgb)
+    if np.issubdtype(rgb.dtype, np.integer) and rgb.min(initial=0) >= 0 and rgb.max(initial=0) <= 255:
+        linear = SRGB_LINEAR[rgb]
+    else:
+        linear = _linearize(rgb.astype(np.float64))
+    return linear @ RGB2XYZ.T
+
 
-    def format(c):
-        if c > 0.008856: c = c ** (1. / 3.)
-        else: c = (7.787 * c) + (16. / 116.)
-        return c
-
-    xyz[0] = xyz[0] / 95.047
-    xyz[1] = xyz[1] / 100.00
-    xyz[2] = xyz[2] / 108.883
-    xyz = list(map(format, xyz))
-    lab = [None, None, None]
-    lab[0] = (116. * xyz[1]) - 16.
-    lab[1] = 500. * (xyz[0] - xyz[1])
-    lab[2] = 200. * (xyz[1] - xyz[2])
+# Converts an (N,3) XYZ array to LAB format.
+# Implementation derived from http://www.easyrgb.com/en/math.php
+def xyz2labArray(xyz):
+    c = np.asarray(xyz, dtype=np.float64) / XYZ_WHITE
+    c = np.where(c > 0.008856, c ** (1. / 3.), (7.787 * c) + (16. / 116.))
+    x, y, z = c.T
+    lab = np.empty(c.shape)
+    lab.T[0] = (116. * y) - 16.
+    lab.T[1] = 500. * (x - y)
+    lab.T[2] = 200. * (y - z)
     return lab
 
 
-# Converts RGB pixel array into LAB format.
-def rgb2lab(rgb):
-    return xyz2lab(rgb2xyz(rgb))
+# Converts an (N,3) RGB array into LAB format.
+def rgb2labArray(rgb):
+    return xyz2labArray(rgb2xyzArray(rgb))
 
 
-def ciede2000FromRGB(rgb1, rgb2):
-    lab1 = rgb2lab(rgb1)
-    lab2 = rgb2lab(rgb2)
-    return ciede2000(lab1, lab2)
+# Returns the CIEDE2000 differences of (N,3) RGB arrays - a single color broadcasts e.g. as a reference color
+def ciede2000FromRGBArray(rgb1, rgb2):
+    return ciede2000Array(rgb2labArray(rgb1), rgb2labArray(rgb2))
 
 
-# Returns CIEDE2000 comparison results of two LAB formatted colors.
-# Translated from CIEDE2000 implementation in https://github.com/markusn/color-diff
-def ciede2000(lab1, lab2):
+def _degrees(n): return n * (180. / np.pi)
+
+
+def _radians(n): return n * (np.pi / 180.)
+
+
+# hue angle in degrees 0-360 - 0 for achromatic colors
+def _hpf(x, y):
+    tmphp = _degrees(np.arctan2(x, y))
+    return np.where((x == 0) & (y == 0), 0., np.where(tmphp >= 0, tmphp, tmphp + 360.))
+
 
-    def degrees(n): return n * (180. / np.pi)
-
-    def radians(n): return n * (np.pi / 180.)
-
-    def hpf(x, y):
-        if x == 0 and y == 0: return 0
-        else:
-            tmphp = degrees(np.arctan2(x, y))
-            if tmphp >= 0: return tmphp
-            else: return tmphp + 360.
-        return None
-
-    def dhpf(c1, c2, h1p, h2p):
-        if c1 * c2 == 0: return 0
-        elif np.abs(h2p - h1p) <= 180: return h2p - h1p
-        elif h2p - h1p > 180: return (h2p - h1p) - 360.
-        elif h2p - h1p < 180: return (h2p - h1p) + 360.
-        else: return None
-
-    def ahpf(c1, c2, h1p, h2p):
-        if c1 * c2 == 0: return h1p + h2p
-        elif np.abs(h1p - h2p) <= 180: return (h1p + h2p) / 2.
-        elif np.abs(h1p - h2p) > 180 and h1p + h2p < 360: return (h1p + h2p + 360.) / 2.
-        elif np.abs(h1p - h2p) > 180 and h1p + h2p >= 360: return (h1p + h2p - 360.) / 2.
-        return None
-
-    L1 = lab1[0]
-    A1 = lab1[1]
-    B1 = lab1[2]
-    L2 = lab2[0]
-    A2 = lab2[1]
-    B2 = lab2[2]
+# Returns CIEDE2000 comparison results of (N,3) LAB arrays - a single color broadcasts e.g. as a reference color
+# Translated from CIEDE2000 implementation in https://github.com/markusn/color-diff
+def ciede2000Array(lab1, lab2):
+    lab1 = np.asarray(lab1, dtype=np.float64)
+    lab2 = np.asarray(lab2, dtype=np.float64)
+    L1, A1, B1 = lab1.T
+    L2, A2, B2 = lab2.T
     kL = 1
     kC = 1
     kH = 1
@@ -123,20 +109,49 @@ def ciede2000(lab1, lab2):
     a2P = (1. + G) * A2
     c1P = np.sqrt((a1P ** 2.) + (B1 ** 2.))
     c2P = np.sqrt((a2P ** 2.) + (B2 ** 2.))
-    h1P = hpf(B1, a1P)
-    h2P = hpf(B2, a2P)
+    h1P = _hpf(B1, a1P)
+    h2P = _hpf(B2, a2P)
     dLP = L2 - L1
     dCP = c2P - c1P
-    dhP = dhpf(C1, C2, h1P, h2P)
-    dHP = 2. * np.sqrt(c1P * c2P) * np.sin(radians(dhP) / 2.)
+    # hue difference
+    C1C2Zero = C1 * C2 == 0
+    dh = h2P - h1P
+    dhP = np.where(C1C2Zero, 0., np.where(np.abs(dh) <= 180, dh, np.where(dh > 180, dh - 360., dh + 360.)))
+    dHP = 2. * np.sqrt(c1P * c2P) * np.sin(_radians(dhP) / 2.)
     aL = (L1 + L2) / 2.
     aCP = (c1P + c2P) / 2.
-    aHP = ahpf(C1, C2, h1P, h2P)
-    T = 1. - 0.17 * np.cos(radians(aHP - 39)) + 0.24 * np.cos(radians(2. * aHP)) + 0.32 * np.cos(radians(3. * aHP + 6.)) - 0.2 * np.cos(radians(4. * aHP - 63.))
+    # mean hue
+    hSum = h1P + h2P
+    aHP = np.where(C1C2Zero, hSum, np.where(np.abs(dh) <= 180, hSum / 2., np.where(hSum < 360, (hSum + 360.) / 2., (hSum - 360.) / 2.)))
+    T = 1. - 0.17 * np.cos(_radians(aHP - 30)) + 0.24 * np.cos(_radians(2. * aHP)) + 0.32 * np.cos(_radians(3. * aHP + 6.)) - 0.2 * np.cos(_radians(4. * aHP - 63.))
     dRO = 30. * np.exp(-1. * (((aHP - 275.) / 25.) ** 2.))
     rC = np.sqrt((aCP ** 7.) / ((aCP ** 7.) + (25. ** 7.)))
     sL = 1. + ((0.015 * ((aL - 50.) ** 2.)) / np.sqrt(20. + ((aL - 50.) ** 2.)))
     sC = 1. + 0.045 * aCP
     sH = 1. + 0.015 * aCP * T
-    rT = -2. * rC * np.sin(radians(2. * dRO))
+    rT = -2. * rC * np.sin(_radians(2. * dRO))
     return np.sqrt(((dLP / (sL * kL)) ** 2.) + ((dCP / (sC * kC)) ** 2.) + ((dHP / (sH * kH)) ** 2.) + rT * (dCP / (sC * kC)) * (dHP / (sH * kH)))
+
+
+# Converts RGB pixel array to XYZ format.
+def rgb2xyz(rgb):
+    return rgb2xyzArray(np.asarray(rgb)).tolist()
+
+
+# Converts XYZ pixel array to LAB format.
+def xyz2lab(xyz):
+    return xyz2labArray(np.asarray(xyz)).tolist()
+
+
+# Converts RGB pixel array into LAB format.
+def rgb2lab(rgb):
+    return rgb2labArray(np.asarray(rgb)).tolist()
+
+
+def ciede2000FromRGB(rgb1, rgb2):
+    return ciede2000FromRGBArray(np.asarray(rgb1), np.asarray(rgb2))
+
+
+# Returns CIEDE2000 comparison results of two LAB formatted colors.
+def ciede2000(lab1, lab2):
+    return ciede2000Array(np.asarray(lab1), np.asarray(lab2))
@@ -17,7 +17,7 @@ class DetectState(object):
     keeps track of the detections state
     '''
 
-    def __init__(self,validDiffSumTreshold,invalidDiffSumTreshold,diffSumDeltaTreshold,onPieceMoveDetected=None,onMoveDetected=None):
+    def __init__(self,validDiffSumTreshold,invalidDiffSumTreshold,diffSumDeltaTreshold,onPieceMoveDetected=None,onMoveDetected=None,onValidBoardChanged=None):
         """ construct me """
         self.frames=0
         self.validFrames=0
@@ -27,17 +27,29 @@ class DetectState(object):
         self.diffSumDeltaTreshold=diffSumDeltaTreshold
         self.onPieceMoveDetected=onPieceMoveDetected
         self.onMoveDetecte=onMoveDetected
+        self.onValidBoardChanged=onValidBoardChanged
+        self.reset()
+        
+    def reset(self):
+        """ start detecting from scratch keeping my tresholds and callbacks """
+        self.frames=0
+        self.validFrames=0
+        self.invalidFrames=0
+        self.validBoard=None
         
     def check(self,validChanges,diffSum,diffSumDelta,meanFrameCount):
         """ check the detection state given the current diffSum and diffSumDelta"""
         self.invalidStarted=self.invalidFrames>3
         self.invalidStable=self.invalidFrames>=meanFrameCount,
         self.validStable=self.validFrames>=meanFrameCount     
+        wasValid=self.validBoard
         # trigger statistics push if valid
         if self.invalidStable:
             self.validBoard=diffSum<self.invalidDiffSumTreshold and abs(diffSumDelta)<self.diffSumDeltaTreshold and validChanges>=62
         else:
             self.validBoard=diffSum<self.validDiffSumTreshold
+        if self.validBoard!=wasValid and self.onValidBoardChanged is not None:
+            self.onValidBoardChanged(self)
         if self.validBoard:
             self.validFrames+=1
         else:
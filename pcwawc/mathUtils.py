@@ -25,10 +25,10 @@ def intersect(A, B, C, D):
     Pxn = (A[0] * B[1] - A[1] * B[0]) * (C[0] - D[0]) - (A[0] - B[0]) * (C[0] * D[1] - C[1] * D[0])
     Pyn = (A[0] * B[1] - A[1] * B[0]) * (C[1] - D[1]) - (A[1] - B[1]) * (C[0] * D[1] - C[1] * D[0])
     Pdenom = float((A[0] - B[0]) * (C[1] - D[1]) - (A[1] - B[1]) * (C[0] - D[0]))
-    np.seterr(all='raise')
     try:
-        Px = Pxn / Pdenom
-        Py = Pyn / Pdenom
+        with np.errstate(all='raise'):
+            Px = Pxn / Pdenom
+            Py = Pyn / Pdenom
     except FloatingPointError:
         return None
     except ZeroDivisionError:
@@ -38,6 +38,76 @@ def intersect(A, B, C, D):
     return (int(Px), int(Py))
 
 
+def intersectHoughLinesArray(lines):
+    """ Finds the intersections of all pairs of the given lines at once.
+
+    @parameter lines: line segments x1,y1,x2,y2 as returned by cv2.HoughLinesP e.g. of shape (n,1,4) or (n,4)
+
+    @returns: integer array of shape (m,2) with the intersection points of the line pairs i<j
+    in the order of the pairs truncated like intersect - parallel line pairs are left out"""
+    segments = np.asarray(lines, dtype=np.float64).reshape(-1, 4)
+    lineIndices, crosslineIndices = np.triu_indices(len(segments), k=1)
+    A, B = segments[lineIndices, 0:2].T, segments[lineIndices, 2:4].T
+    C, D = segments[crosslineIndices, 0:2].T, segments[crosslineIndices, 2:4].T
+    lineCross = A[0] * B[1] - A[1] * B[0]
+    crosslineCross = C[0] * D[1] - C[1] * D[0]
+    Pxn = lineCross * (C[0] - D[0]) - (A[0] - B[0]) * crosslineCross
+    Pyn = lineCross * (C[1] - D[1]) - (A[1] - B[1]) * crosslineCross
+    Pdenom = (A[0] - B[0]) * (C[1] - D[1]) - (A[1] - B[1]) * (C[0] - D[0])
+    crossing = Pdenom != 0
+    Pdenom = Pdenom[crossing]
+    points = np.stack((Pxn[crossing] / Pdenom, Pyn[crossing] / Pdenom), axis=1)
+    return points.astype(np.int64)
+
+
+def uniquePoints(points, threshold, subdivisions=4):
+    """ Filters the given points keeping a point only if it is at least threshold away from all points kept before.
+
+    A spatial grid hash with cells whose diagonal is the threshold holds the kept points and limits
+    the distance checks to the neighbouring cells. Subdivided cells that turn out to be completely
+    within the threshold of a kept point are remembered to reject further points in them at once.
+
+    @parameter points: integer array of shape (n,2)
+    @parameter threshold: minimum distance between the kept points
+    @parameter subdivisions: number of subdivisions of the cells per side for the covered cells
+
+    @returns: list of (x, y) tuples of the kept points in their original order"""
+    cellSize = threshold / math.sqrt(2)
+    fineSize = cellSize / subdivisions
+    fineXs = np.floor(points[:, 0] / fineSize).astype(np.int64).tolist()
+    fineYs = np.floor(points[:, 1] / fineSize).astype(np.int64).tolist()
+    squaredThreshold = threshold * threshold
+    cells = {}
+    covered = set()
+    kept = []
+    for x, y, fx, fy in zip(points[:, 0].tolist(), points[:, 1].tolist(), fineXs, fineYs):
+        if (fx, fy) in covered:
+            continue
+        cx, cy = fx // subdivisions, fy // subdivisions
+        nearest = None
+        for nx in range(cx - 2, cx + 3):
+            for ny in range(cy - 2, cy + 3):
+                for kx, ky in cells.get((nx, ny), ()):
+                    if (kx - x) ** 2 + (ky - y) ** 2 < squaredThreshold:
+                        nearest = (kx, ky)
+                        break
+                if nearest:
+                    break
+            if nearest:
+                break
+        if nearest is None:
+            cells.setdefault((cx, cy), []).append((x, y))
+            kept.append((x, y))
+            nearest = (x, y)
+        # the farthest corner of the subdivided cell decides whether all of it is covered
+        kx, ky = nearest
+        dx = max(abs(fx * fineSize - kx), abs((fx + 1) * fineSize - kx))
+        dy = max(abs(fy * fineSize - ky), abs((fy + 1) * fineSize - ky))
+        if dx * dx + dy * dy < squaredThreshold:
+            covered.add((fx, fy))
+    return kept
+
+
 def distance(A, B):
     """ Finds the distance between two points
 
@@ -7,6 +7,7 @@ from flask_autoindex import AutoIndex
 from flask_restful import Api
 import argparse
 import ast
+import atexit
 import logging
 import platform
 import os.path
@@ -94,6 +95,11 @@ def chessGameState(gameid):
     return webApp.chessGameState(gameid)
 
 
+@app.route("/chess/events", methods=['GET'])
+def chessEvents():
+    return webApp.chessEvents()
+
+
 @app.route("/chess/gamecolors", methods=['GET'])
 def chessGameColors():
     return webApp.chessGameColors()
@@ -192,6 +198,11 @@ class WebChessCamArgs:
                                  type=int,
                                  default=3,
                                  help="detection pixel steps - distance*step is the grid size being analyzed")
+
+        self.parser.add_argument('--fps',
+                                 type=float,
+                                 default=None,
+                                 help="maximum number of frames per second to analyze - default: every captured frame")
         
 
         self.parser.add_argument('--warp',
@@ -205,4 +216,9 @@ class WebChessCamArgs:
 if __name__ == '__main__':
     args = WebChessCamArgs(sys.argv[1:]).args
     webApp = WebApp(args, app.logger)
+    # save the game when the server is shut down
+    atexit.register(webApp.close)
+    # detect moves even if nobody is watching the video
+    if WebApp.threadedCapture:
+        webApp.startAnalysis()
     app.run(port='%d' % (args.port), host=args.host)
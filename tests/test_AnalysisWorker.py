@@ -0,0 +1,86 @@
+#!/usr/bin/python3
+# part of https://github.com/WolfgangFahl/play-chess-with-a-webcam
+from pcwawc.Video import Video, VideoStream
+from pcwawc.AnalysisWorker import AnalysisWorker
+import logging.handlers
+import numpy as np
+import time
+
+
+def analyzeVideo(fps=None, policy=VideoStream.BLOCK):
+    """ analyze the example video without any viewer and return the worker and the analyzed frames """
+    video = Video()
+    video.open('testMedia/emptyBoard001.avi')
+    analyzed = []
+
+    def analyze(frame):
+        analyzed.append(frame)
+        return frame
+
+    worker = AnalysisWorker(VideoStream(video, policy=policy).start(), analyze, fps=fps).start()
+    worker.thread.join(timeout=30)
+    return worker, analyzed
+
+
+def test_AnalysisWorker():
+    worker, analyzed = analyzeVideo()
+    assert not worker.thread.is_alive()
+    # without a rate limit all frames of the blocking stream are analyzed
+    assert len(analyzed) == 52
+    assert worker.index == 52
+    frame, timestamp = worker.readLatest()
+    assert frame is analyzed[-1]
+
+
+def test_AnalysisWorkerRate():
+    start = time.time()
+    worker, analyzed = analyzeVideo(fps=100, policy=VideoStream.DROP_OLDEST)
+    elapsed = time.time() - start
+    print ("analyzed %d frames in %.2f s" % (len(analyzed), elapsed))
+    assert len(analyzed) <= elapsed * 100 + 1
+
+
+def test_AnalysisWorkerStop():
+    video = Video()
+    video.open('testMedia/emptyBoard001.avi')
+    video.pause(True)
+    analyzed = []
+
+    def analyze(frame):
+        analyzed.append(frame)
+        return frame
+
+    # the paused video delivers no frames so the worker is idle
+    worker = AnalysisWorker(VideoStream(video).start(), analyze, idleTimeout=0.05).start()
+    time.sleep(0.3)
+    assert worker.thread.is_alive()
+    assert len(analyzed) == 0
+    assert worker.read(timeout=0.1) == (None, None)
+    worker.stop()
+    assert not worker.thread.is_alive()
+    worker.videoStream.stop()
+
+
+def test_AnalysisWorkerError():
+    """ a failing analysis is logged and the frame is published unannotated """
+    video = Video()
+    video.open('testMedia/emptyBoard001.avi')
+    handler = logging.handlers.BufferingHandler(10)
+    logger = logging.getLogger("test_AnalysisWorker")
+    logger.addHandler(handler)
+
+    def analyze(frame):
+        raise Exception("analysis failed")
+
+    worker = AnalysisWorker(VideoStream(video), analyze, logger=logger)
+    frame = np.zeros((10, 10, 3), np.uint8)
+    assert worker.process(frame) is frame
+    assert len(handler.buffer) == 1
+    assert str(handler.buffer[0].exc_info[1]) == "analysis failed"
+    logger.removeHandler(handler)
+
+
+test_AnalysisWorker()
+test_AnalysisWorkerRate()
+test_AnalysisWorkerStop()
+test_AnalysisWorkerError()
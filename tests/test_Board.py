@@ -4,6 +4,7 @@ from pcwawc.Board import Board
 from pcwawc.Board import RejectedMove
 from pcwawc.Field import FieldState
 import chess
+import chess.pgn
 
 
 # check the sequence of  moves end positon against the expected FEN notation string
@@ -137,8 +138,49 @@ def test_PieceAt():
                     assert ord(piece.symbol()) > ord('a') and ord(piece.symbol()) < ord('z')
 
 
+# test the incremental pgn against the pgn of the full move stack
+def test_PgnCache():
+    board = Board()
+    version = board.version
+    for move in ["e2e4", "e7e5", "f1c4", "b8c6", "d1h5", "a7a6"]:
+        board.move(move)
+        assert board.getPgn() == str(chess.pgn.Game.from_board(board.chessboard))
+    assert board.version == version + 6
+    board.takeback()
+    version = board.version
+    # polls without changes get the cached pgn
+    pgn = board.getPgn()
+    assert board.getPgn() is pgn
+    assert board.version == version
+    for move in ["g8f6", "h5f7"]:
+        board.move(move)
+    pgn = board.getPgn()
+    assert pgn.endswith("4. Qxf7# 1-0")
+    assert pgn == str(chess.pgn.Game.from_board(board.chessboard))
+    # setup position with black to move
+    board.setFEN("8/8/8/8/8/8/8/4K2k b - - 0 1")
+    board.move("h1h2")
+    assert board.getPgn().endswith("1... Kh2 1/2-1/2")
+    assert board.getPgn() == str(chess.pgn.Game.from_board(board.chessboard))
+    board.setPgn(pgn)
+    assert board.getPgn() == pgn
+    # an unreadable pgn leaves the board and its pgn unchanged
+    board.setPgn("")
+    assert board.getPgn() == pgn
+    # direct changes of the chessboard - also keeping the number of moves
+    version = board.refresh()
+    board.chessboard.pop()
+    board.chessboard.push_san("Qf3")
+    assert board.refresh() > version
+    assert board.getPgn().endswith("4. Qf3 *")
+    assert board.getPgn() == str(chess.pgn.Game.from_board(board.chessboard))
+    board.chessboard = chess.Board()
+    assert board.getPgn() == str(chess.pgn.Game.from_board(board.chessboard))
+
+
 test_PieceAt()
 test_Pieces()
 test_cellNames()
 test_BoardEasy()
 test_BoardPgn()
+test_PgnCache()
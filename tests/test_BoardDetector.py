@@ -7,10 +7,11 @@ from pcwawc.Environment4Test import Environment4Test
 from pcwawc.Video import Video
 from pcwawc.WebApp import WebApp
 from pcwawc.webchesscam import WebChessCamArgs
-from pcwawc.Field import FieldState
+from pcwawc.Field import FieldState, FieldROI, Grid
 from pcwawc.RunningStats import ColorStats
 from timeit import default_timer as timer
 import cv2
+import pytest
 
 testEnv = Environment4Test()
 frameDebug = True
@@ -48,40 +49,43 @@ def test_BoardFieldColorDetector():
 def test_FieldDetector():
     video = Video()
     webApp = WebApp(WebChessCamArgs(["--debug","--speedup=4"]).args)
-    frames = None
-    for boardIndex in range(2):
-        BoardDetector.debug = True
-        # setup webApp params to reuse warp method
-        webApp.video = video
-        if boardIndex == 1:
-            video.open(testEnv.testMedia + 'emptyBoard001.avi')
-            webApp.board.chessboard.clear_board()
-            frames = 16
-        if boardIndex == 0:
-            video.open(testEnv.testMedia + 'scholarsmate.avi')
-            frames = 20
-            # @TODO speed up and test all frames again
-            # frames=334
-        webApp.warp.rotation = 270
-        webApp.warp.pointList = []
-        webApp.warp.addPoint(140, 5)
-        webApp.warp.addPoint(506, 10)
-        webApp.warp.addPoint(507, 377)
-        webApp.warp.addPoint(137, 374)
+    try:
+        frames = None
+        for boardIndex in range(2):
+            BoardDetector.debug = True
+            # setup webApp params to reuse warp method
+            webApp.video = video
+            if boardIndex == 1:
+                video.open(testEnv.testMedia + 'emptyBoard001.avi')
+                webApp.board.chessboard.clear_board()
+                frames = 16
+            if boardIndex == 0:
+                video.open(testEnv.testMedia + 'scholarsmate.avi')
+                frames = 20
+                # @TODO speed up and test all frames again
+                # frames=334
+            webApp.warp.rotation = 270
+            webApp.warp.pointList = []
+            webApp.warp.addPoint(140, 5)
+            webApp.warp.addPoint(506, 10)
+            webApp.warp.addPoint(507, 377)
+            webApp.warp.addPoint(137, 374)
 
-        for frame in range(0, frames):
-            ret, bgr, quitWanted = video.readFrame(show=False)
-            assert ret
-            assert bgr is not None
-            # bgr = cv2.cvtColor(jpgImage, cv2.COLOR_RGB2BGR)
-            height, width = bgr.shape[:2]
-            # print ("%d: %d x %d" % (frame,width,height))
-            start = timer()
-            bgr = webApp.warpAndRotate(bgr)
-            image = cv2.resize(bgr, (int(width * 1.5), int(height * 1.5)))
-            video.showImage(image, "BoardDetector", keyWait=200)
-            end = timer()
-    video.close()
+            for frame in range(0, frames):
+                ret, bgr, quitWanted = video.readFrame(show=False)
+                assert ret
+                assert bgr is not None
+                # bgr = cv2.cvtColor(jpgImage, cv2.COLOR_RGB2BGR)
+                height, width = bgr.shape[:2]
+                # print ("%d: %d x %d" % (frame,width,height))
+                start = timer()
+                bgr = webApp.warpAndRotate(bgr)
+                image = cv2.resize(bgr, (int(width * 1.5), int(height * 1.5)))
+                video.showImage(image, "BoardDetector", keyWait=200)
+                end = timer()
+        video.close()
+    finally:
+        webApp.close()
 
 
 def test_ColorDistance():
@@ -91,6 +95,77 @@ def test_ColorDistance():
     colorKey = cStats.colorKey()
     assert 49152 == colorKey
     
+def test_AnalyzeColors():
+    """ the colors of all fields sampled at once should match the per field analysis """
+    video = Video()
+    board = Board()
+    image = video.readImage(testEnv.testMedia + "chessBoard011.jpg")
+    boardDetector = BoardDetector(board, video)
+    boardDetector.divideInFields(image)
+    hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
+    for distance,step in [(1,1),(3,1),(5,3)]:
+        start=timer()
+        boardDetector.analyzeColors(image, distance, step)
+        end=timer()
+        print("%.4fs for analyzing the colors with distance %d and step %d" % (end-start,distance,step))
+        for field in boardDetector.genFields():
+            hsvStats,rgbStats=field.hsvStats,field.rgbStats
+            rgbColorKey=field.rgbColorKey
+            field.analyzeColor(image, hsv, distance, step)
+            assert field.luminance.n==(2*distance+1)**2
+            assert hsvStats.mean()==pytest.approx(field.hsvStats.mean())
+            assert hsvStats.variance()==pytest.approx(field.hsvStats.variance())
+            assert rgbStats.mean()==pytest.approx(field.rgbStats.mean())
+            assert rgbStats.variance()==pytest.approx(field.rgbStats.variance())
+            assert rgbColorKey==pytest.approx(field.rgbColorKey)
+    
+def test_AnalyzeFields():
+    """ the regions of interest of all fields gathered at once should match the per roi analysis """
+    video = Video()
+    board = Board()
+    image = video.readImage(testEnv.testMedia + "chessBoard011.jpg")
+    boardDetector = BoardDetector(board, video)
+    boardDetector.divideInFields(image)
+    roiLambdas=[
+        lambda grid,roiIndex,xstep,ystep:(grid.dofs(roiIndex)+grid.d()*grid.xstep(xstep),grid.ystep(ystep)),
+        lambda grid,roiIndex,xstep,ystep:(grid.xstep(xstep),grid.ystep(ystep))
+    ]
+    for roiLambda in roiLambdas:
+        grid=Grid(7,3,10,safetyX=10,safetyY=10)
+        start=timer()
+        boardDetector.analyzeFields(image,grid,roiLambda)
+        end=timer()
+        print("%.4fs for analyzing the regions of interest" % (end-start))
+        checkFieldROIs(boardDetector,image,grid,roiLambda)
+    # fields of different sizes and bounds
+    grid=Grid(7,3,10,safetyX=10,safetyY=10)
+    for index,field in enumerate(boardDetector.genFields()):
+        if index%3==0:
+            field.pcx+=7
+            field.width*=1.2
+            field.maxX=int(field.pcx+field.width/4)
+        if index%5==0:
+            field.height*=0.8
+            field.maxY=int(field.pcy+field.height/3)
+    boardDetector.analyzeFields(image,grid,roiLambdas[0])
+    checkFieldROIs(boardDetector,image,grid,roiLambdas[0])
+            
+def checkFieldROIs(boardDetector,image,grid,roiLambda):
+    """ check the regions of interest gathered for all fields at once against the per roi analysis """
+    indices=boardDetector.fieldROIIndices(image,Grid(7,3,10,safetyX=10,safetyY=10),roiLambda)
+    assert indices.shape==(64,7,30)
+    width=image.shape[1]
+    for fieldIndex,field in enumerate(boardDetector.genFields()):
+        for roi in field.rois:
+            expected=list(roi.pixelList())
+            assert [(i%width,i//width) for i in indices[fieldIndex,roi.roiIndex]]==expected
+            colorStats=roi.colorStats
+            roi=FieldROI(field,grid,roi.roiIndex,roiLambda)
+            roi.analyze(image)
+            assert colorStats.c1Stats.n==roi.colorStats.c1Stats.n
+            assert colorStats.mean()==pytest.approx(roi.colorStats.mean())
+            assert colorStats.variance()==pytest.approx(roi.colorStats.variance())
+    
 def checkFieldStates(boardDetector,board):
     sortedFields=boardDetector.sortByFieldState();
     counts = board.fieldStateCounts()
@@ -109,22 +184,27 @@ def test_FieldStates():
 def test_MaskFieldStates():
     video=Video()
     webApp = WebApp(WebChessCamArgs([]).args)
-    boardDetector=webApp.boardDetector
-    for imageInfo in testEnv.imageInfos:
-        bgr=testEnv.loadFromImageInfo(webApp,imageInfo)
-        rgba=cv2.cvtColor(bgr,cv2.COLOR_RGB2RGBA)
-        waitTime=1000
-        board=webApp.board
-        sortedFields=checkFieldStates(boardDetector, board)
-        whiteFields=sortedFields[FieldState.WHITE_EMPTY]
-        print ("%d white fields for %s"  % (len(whiteFields),board.fen()))
-        for field in whiteFields:
-            print("%s: %3d,%3d" % (field.an,field.pcx,field.pcy))
-        video.showImage(rgba, imageInfo['title'],keyWait=waitTime)
-        video.close()
+    try:
+        boardDetector=webApp.boardDetector
+        for imageInfo in testEnv.imageInfos:
+            bgr=testEnv.loadFromImageInfo(webApp,imageInfo)
+            rgba=cv2.cvtColor(bgr,cv2.COLOR_RGB2RGBA)
+            waitTime=1000
+            board=webApp.board
+            sortedFields=checkFieldStates(boardDetector, board)
+            whiteFields=sortedFields[FieldState.WHITE_EMPTY]
+            print ("%d white fields for %s"  % (len(whiteFields),board.fen()))
+            for field in whiteFields:
+                print("%s: %3d,%3d" % (field.an,field.pcx,field.pcy))
+            video.showImage(rgba, imageInfo['title'],keyWait=waitTime)
+            video.close()
+    finally:
+        webApp.close()
         
 
 test_ColorDistance()
+test_AnalyzeColors()
+test_AnalyzeFields()
 test_FieldStates()
 test_MaskFieldStates()
 test_BoardFieldColorDetector()
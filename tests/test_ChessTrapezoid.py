@@ -2,7 +2,7 @@
 # part of https://github.com/WolfgangFahl/play-chess-with-a-webcam
 from pcwawc.Environment4Test import Environment4Test
 from pcwawc.Video import Video
-from pcwawc.ChessTrapezoid import ChessTrapezoid,ChessTSquare, FieldState, Color, SquareChange
+from pcwawc.ChessTrapezoid import ChessTrapezoid,ChessTSquare, FieldState, Color, SquareChange, Transformation, Escalation
 from timeit import default_timer as timer
 import matplotlib.pyplot as plt
 from matplotlib.patches import Polygon
@@ -14,6 +14,7 @@ import pytest
 import chess
 import getpass
 from pcwawc.detectstate import DetectState, DetectColorState
+from pcwawc.RunningStats import MinMaxStats
 
 testEnv = Environment4Test()
 speedup=5 # times 
@@ -124,6 +125,205 @@ def test_Stats():
     assert avgcolor.color==(110.00,55.00,210.00 )
     assert avgcolor.stds==(5.00,10.00,10.00)      
     
+def test_SquareDiffSums():
+    """ check the block reduction of diff images against the per square sums """
+    for size in [640,803]:
+        trapez=ChessTrapezoid([(0,0),(100,0),(100,100),(0,100)],idealSize=size)
+        diffImage=np.random.randint(0,256,(size,size,3),dtype=np.uint8)
+        diffSums=trapez.squareDiffSums(diffImage)
+        assert diffSums.shape==(8,8)
+        for tsquare in trapez.genSquares():
+            h,w,x,y,dh,dw=tsquare.rxy2xy(diffImage)
+            assert diffSums[tsquare.row,tsquare.col]==np.sum(diffImage[y:y +dh, x:x +dw])
+
+def test_RenderCache():
+    """ check that ideal boards are rendered once per position and color model """
+    trapez=ChessTrapezoid([(0,0),(100,0),(100,100),(0,100)],idealSize=320)
+    trapez.updatePieces(chess.STARTING_BOARD_FEN)
+    image=np.random.randint(0,256,(320,320,3),dtype=np.uint8)
+    trapez.analyzeColors(image)
+    idealImage=trapez.idealColoredBoard(320,320)
+    assert not idealImage.flags.writeable
+    assert trapez.idealColoredBoard(320,320) is idealImage
+    assert trapez.renderCache.hits==1
+    refImage=trapez.getEmtpyImage4WidthAndHeight(320,320,3)
+    for tsquare in trapez.genSquares():
+        tsquare.drawState(refImage,Transformation.IDEAL,3)
+    assert np.array_equal(refImage,idealImage)
+    trapez.updatePieces(chess.STARTING_BOARD_FEN)
+    assert trapez.idealColoredBoard(320,320) is not idealImage
+
+def test_SizeCaches():
+    """ check that the label and square id images are kept for alternating image sizes """
+    trapez=ChessTrapezoid([(0,0),(100,0),(100,100),(0,100)],idealSize=320)
+    trapez.updatePieces(chess.STARTING_BOARD_FEN)
+    images=[np.zeros((size,size,3),dtype=np.uint8) for size in [ChessTrapezoid.CoarseSize,320]]
+    labelImages=[trapez.getLabelImage(image) for image in images]
+    squareIdImages=[trapez.getSquareIdImage(image) for image in images]
+    for frame in range(3):
+        for index,image in enumerate(images):
+            assert trapez.getLabelImage(image) is labelImages[index]
+            assert trapez.getSquareIdImage(image) is squareIdImages[index]
+    assert trapez.labelImages.misses==2
+    assert trapez.squareIdImages.misses==2
+    # the labels depend on the position - the square ids do not
+    trapez.updatePieces("8/8/8/8/8/8/8/8")
+    assert trapez.getLabelImage(images[1]) is not labelImages[1]
+    assert trapez.getSquareIdImage(images[1]) is squareIdImages[1]
+
+def test_AnalyzeColors():
+    """ check the label image based color analysis against masking the image per field state """
+    trapez=ChessTrapezoid([(0,0),(100,0),(100,100),(0,100)],idealSize=400)
+    trapez.updatePieces(chess.STARTING_BOARD_FEN)
+    image=np.random.randint(0,256,(400,400,3),dtype=np.uint8)
+    averageColors=trapez.analyzeColors(image)
+    for fieldState in FieldState:
+        mask=trapez.getEmptyImage(image)
+        trapez.drawFieldStates(mask,[fieldState],Transformation.IDEAL,1)
+        expected=Color(trapez.maskImage(image,mask))
+        assert averageColors[fieldState].color==pytest.approx(expected.color,1E-9)
+        assert averageColors[fieldState].stds==pytest.approx(expected.stds,1E-9)
+
+def test_OptimizeColorCheck():
+    """ check the histogram based color check optimization against checking the colors factor by factor """
+    trapez=ChessTrapezoid([(0,0),(100,0),(100,100),(0,100)],idealSize=400)
+    trapez.updatePieces(chess.STARTING_BOARD_FEN)
+    image=np.random.randint(0,256,(400,400,3),dtype=np.uint8)
+    averageColors=trapez.analyzeColors(image)
+    fieldColorStats=trapez.optimizeColorCheck(image,averageColors)
+    optimalSelectivity=-100
+    for factor in ChessTrapezoid.ColorCheckFactors:
+        candidate=trapez.checkColors(image,averageColors,factor)
+        candidate.analyzeStats(factor,0)
+        if candidate.minSelectivity>optimalSelectivity:
+            optimalSelectivity=candidate.minSelectivity
+            expected=candidate
+    assert fieldColorStats.factor==expected.factor
+    assert fieldColorStats.colorPercent==expected.colorPercent
+    assert fieldColorStats.minSelectivity==expected.minSelectivity
+
+def warpTestFrames(maxFrames):
+    """ get the name, the first maxFrames frames and a trapezoid of each of the test videos """
+    testVideos={'scholarsmate.avi':[(140,5),(506,10),(507,377),(137,374)],'emptyBoard001.avi':None}
+    for videoName,points in testVideos.items():
+        video=Video()
+        video.open(testEnv.testMedia+videoName)
+        frames=[]
+        for frame in range(maxFrames):
+            ret, bgr, quitWanted = video.readFrame(show=False)
+            if not ret:
+                break
+            frames.append(bgr.copy())
+        assert len(frames)>0
+        if points is None:
+            h,w = frames[0].shape[:2]
+            points=[(0,0),(w,0),(w,h),(0,h)]
+        yield videoName,frames,ChessTrapezoid(points,idealSize=800)
+
+def test_WarpRemap():
+    """ check that the precomputed remap tables warp the board like warpPerspective """
+    for videoName,frames,trapez in warpTestFrames(10):
+        warpedImages={}
+        for warpWithRemap in [False,True]:
+            ChessTrapezoid.WarpWithRemap=warpWithRemap
+            warpedImages[warpWithRemap]=[trapez.warpedBoardImage(bgr) for bgr in frames]
+        ChessTrapezoid.WarpWithRemap=True
+        for warpedP,warpedR in zip(warpedImages[False],warpedImages[True]):
+            assert warpedP.shape==warpedR.shape
+            # identical to the fixed point warpPerspective of OpenCV 4 - newer versions may differ slightly
+            assert np.abs(warpedP.astype(np.int16)-warpedR).max()<=4
+
+@pytest.mark.skipif("PCWAWC_BENCHMARK" not in os.environ,reason="benchmark - set PCWAWC_BENCHMARK to run it")
+def test_WarpBenchmark():
+    """ compare the time per frame of warpPerspective and the precomputed remap tables for warping the board """
+    for videoName,frames,trapez in warpTestFrames(50):
+        timings={}
+        for warpWithRemap in [False,True]:
+            ChessTrapezoid.WarpWithRemap=warpWithRemap
+            # the remap tables are built on first use
+            trapez.warpedBoardImage(frames[0])
+            start=timer()
+            for bgr in frames:
+                trapez.warpedBoardImage(bgr)
+            timings[warpWithRemap]=(timer()-start)/len(frames)
+        ChessTrapezoid.WarpWithRemap=True
+        print("%s: %d frames warpPerspective %.2f ms remap %.2f ms" % (videoName,len(frames),timings[False]*1000,timings[True]*1000))
+
+def test_SampledBoardImage():
+    """ test sparse sampling of the board without warping """
+    image=np.random.randint(0,256,(256,256,3),dtype=np.uint8)
+    trapez=ChessTrapezoid([(0,0),(256,0),(256,256),(0,256)],idealSize=800)
+    ChessTrapezoid.SparseSampling=True
+    sampled=trapez.warpedBoardImage(image)
+    ChessTrapezoid.SparseSampling=False
+    samples=ChessTrapezoid.SamplesPerSquareSide*8
+    assert sampled.shape==(samples,samples,3)
+    # the trapez covers the full image so every second pixel is sampled
+    assert np.array_equal(sampled,image[::2,::2])
+    # the squares are drawn at the size of the sampled board
+    trapez.updatePieces(chess.STARTING_BOARD_FEN)
+    labelImage=trapez.getLabelImage(sampled)
+    assert (trapez.squareTiles(labelImage).max(axis=(1,3,4))>0).all()
+    # a different image size needs a new sampling grid
+    sampled=trapez.sampledBoardImage(image[:128])
+    assert sampled.shape==(samples,samples,3)
+    assert sampled.max()<=image[:128].max()
+
+def test_DualResolution():
+    """ test dual resolution detection on the empty board video """
+    for policy,treshold in [(Escalation.SQUARES,None),(Escalation.FRAME,0)]:
+        ChessTrapezoid.EscalationPolicy=policy
+        ChessTrapezoid.EscalationTreshold=treshold
+        video=Video()
+        video.open(testEnv.testMedia+'emptyBoard001.avi')
+        trapez=ChessTrapezoid([(0,0),(640,0),(640,480),(0,480)],idealSize=800)
+        trapez.updatePieces("8/8/8/8/8/8/8/8")
+        detectState=DetectState(validDiffSumTreshold=1.4,invalidDiffSumTreshold=4.8,diffSumDeltaTreshold=0.2)
+        frames=0
+        while True:
+            ret, bgr, quitWanted = video.readFrame(show=False)
+            if not ret:
+                break
+            frames+=1
+            changes=trapez.detectChangesDualResolution(bgr,detectState)
+            if changes["escalation"]==Escalation.NONE:
+                assert changes["fullResolutionSquares"]==0
+            elif changes["escalation"]==Escalation.FRAME:
+                assert changes["fullResolutionSquares"]==64
+        counts=trapez.escalationCounts
+        print("%s: %d frames %s" % (policy.name,frames,counts))
+        assert sum(counts.values())==frames
+        assert changes["validBoard"]
+        if treshold is None:
+            # the empty board hardly changes
+            assert counts[Escalation.NONE]>frames/2
+        else:
+            # a zero treshold escalates every frame
+            assert counts[Escalation.FRAME]==frames
+    ChessTrapezoid.EscalationPolicy=Escalation.SQUARES
+    ChessTrapezoid.EscalationTreshold=None
+
+def test_SquareChanges():
+    """ check the changes detected for all squares at once against the changes of each square on its own """
+    trapez=ChessTrapezoid([(0,0),(100,0),(100,100),(0,100)],idealSize=320)
+    detectState=DetectState(validDiffSumTreshold=1.4,invalidDiffSumTreshold=4.8,diffSumDeltaTreshold=0.2)
+    image=np.zeros((320,320,3),dtype=np.uint8)
+    statsBySquare={tsquare.an:MinMaxStats() for tsquare in trapez.genSquares()}
+    for frame in range(SquareChange.meanFrameCount+5):
+        diffImage=np.random.randint(0,3,(320,320,3),dtype=np.uint8)
+        diffSums,values,diffs,valid=trapez.squareDiffStats(diffImage)
+        expected={tsquare.an:SquareChange(values[tsquare.row,tsquare.col],statsBySquare[tsquare.an]) for tsquare in trapez.genSquares()}
+        changes=trapez.detectChanges(image,diffImage,detectState)
+        for tsquare in trapez.genSquares():
+            change,expectedChange=changes[tsquare.an],expected[tsquare.an]
+            assert change.valid==expectedChange.valid
+            assert change.diff==pytest.approx(expectedChange.diff)
+            assert change.mean==pytest.approx(expectedChange.mean)
+            assert change.variance==pytest.approx(expectedChange.variance)
+            if change.valid and detectState.validBoard:
+                statsBySquare[tsquare.an].push(change.value)
+            assert tsquare.changeStats.n==statsBySquare[tsquare.an].n
+
 def test_ColorDistribution():
     imgPath="/tmp/"
     for imageInfo in testEnv.imageInfos:
@@ -410,5 +610,15 @@ def plotColorHistory(colorHistory):
 #test_RelativeToTrapezXY()  
 #test_SortedTSquares()
 #test_Stats() 
+#test_SquareDiffSums()
+#test_SquareChanges()
+#test_RenderCache()
+#test_SizeCaches()
+#test_AnalyzeColors()
+#test_OptimizeColorCheck()
+#test_WarpRemap()
+#test_WarpBenchmark()
+#test_SampledBoardImage()
+#test_DualResolution()
 #test_ColorDistribution()
 test_ChessTrapezoid()
\ No newline at end of file
@@ -0,0 +1,110 @@
+#!/usr/bin/python3
+# part of https://github.com/WolfgangFahl/play-chess-with-a-webcam
+from pcwawc.EventStream import EventStream
+from pcwawc.detectstate import DetectState
+from pcwawc.WebApp import WebApp
+from pcwawc.webchesscam import WebChessCamArgs
+import numpy as np
+import json
+
+
+def parse(message):
+    """ parse the given Server-Sent Event into its type and data """
+    lines = message.strip().split("\n")
+    return lines[0][len("event: "):], json.loads(lines[1][len("data: "):])
+
+
+# test publishing events to subscribers
+def test_EventStream():
+    eventStream = EventStream(maxSize=4, keepAlive=0.05)
+    events = eventStream.events([EventStream.format("fen", {"fen": "start"})])
+    assert parse(next(events)) == ("fen", {"fen": "start"})
+    # the subscription exists as soon as the events are requested
+    assert len(eventStream.subscriptions) == 1
+    eventStream.publish("move", {"move": "e2e4"})
+    assert parse(next(events)) == ("move", {"move": "e2e4"})
+    # an idle stream is kept alive with comments
+    assert next(events) == ": keepalive\n\n"
+    events.close()
+    assert len(eventStream.subscriptions) == 0
+
+
+# test that a slow subscriber is dropped instead of blocking the publisher
+def test_SlowSubscriber():
+    eventStream = EventStream(maxSize=4, keepAlive=0.05)
+    slow = eventStream.subscribe()
+    fast = eventStream.subscribe()
+    received = []
+    for index in range(10):
+        eventStream.publish("move", {"index": index})
+        received.append(parse(fast.queue.get_nowait()))
+    assert [data["index"] for eventType, data in received] == list(range(10))
+    assert slow.dropped
+    assert not fast.dropped
+    assert eventStream.dropped == 1
+    assert eventStream.subscriptions == [fast]
+
+
+# test that the events of a dropped subscriber end so that the client reconnects
+def test_DroppedEvents():
+    eventStream = EventStream(maxSize=2, keepAlive=0.05)
+    events = eventStream.events()
+    eventStream.publish("move", {"index": 0})
+    assert parse(next(events)) == ("move", {"index": 0})
+    for index in range(1, 4):
+        eventStream.publish("move", {"index": index})
+    assert list(events) == []
+    assert len(eventStream.subscriptions) == 0
+
+
+# test publishing the valid/invalid transitions of the detect state
+def test_DetectStateEvents():
+    eventStream = EventStream(maxSize=16, keepAlive=0.05)
+    detectState = DetectState(validDiffSumTreshold=1.4, invalidDiffSumTreshold=4.8, diffSumDeltaTreshold=0.2)
+    eventStream.watch(detectState)
+    subscription = eventStream.subscribe()
+    for diffSum in [1.0, 1.1, 5.0, 5.1, 1.0]:
+        detectState.nextFrame()
+        detectState.check(64, diffSum, 0.1, 10)
+    events = []
+    while not subscription.queue.empty():
+        events.append(parse(subscription.queue.get()))
+    assert [data["valid"] for eventType, data in events] == [True, False, True]
+    assert [data["frame"] for eventType, data in events] == [1, 3, 5]
+
+
+# test that the moves detected by the board detector while analyzing the warped video reach the clients of the event stream
+def test_MoveDetectionEvents():
+    webApp = WebApp(WebChessCamArgs(["--warp", "[[0,0],[320,0],[320,320],[0,320]]"]).args)
+    try:
+        webApp.events.keepAlive = 0.01
+        events = webApp.events.events()
+        board = np.full((320, 320, 3), 128, np.uint8)
+        # the pawn on e2 moves while a hand covers the board
+        moved = board.copy()
+        moved[240:280, 160:200] += 80
+        noise = np.random.default_rng(1)
+        frames = [board] * 15 + [noise.integers(0, 256, board.shape, dtype=np.uint8) for index in range(12)] + [moved] * 20
+        for frame in frames:
+            webApp.warpAndRotate(frame.copy())
+        received = []
+        for message in events:
+            if message.startswith(":"):
+                break
+            received.append(parse(message))
+        events.close()
+        assert [data["valid"] for eventType, data in received if eventType == "detectState"][:4] == [False, True, False, True]
+        assert "e2" in [data["square"] for eventType, data in received if eventType == "pieceMoved"]
+        # changing the warp starts the detection from scratch
+        webApp.warp.rotate(90)
+        webApp.warpAndRotate(board.copy())
+        assert webApp.boardDetector.detectState.frames == 1
+    finally:
+        webApp.close()
+
+
+test_EventStream()
+test_SlowSubscriber()
+test_DroppedEvents()
+test_DetectStateEvents()
+test_MoveDetectionEvents()
@@ -40,24 +40,54 @@ def test_WebCamGames():
         
 def test_WebApp():
     webApp = WebApp(WebChessCamArgs(["--debug"]).args)
-    WebApp.index = Mock(return_value="")
-    game = webApp.game
-    fen = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq -'
-    webApp.chessFEN(fen)
-    assert game.fen == fen
-    assert game.moveIndex == 0
-    webApp.chessMove("e2e4")
-    assert game.moveIndex == 1
-    webApp.chessMove("e7e5")
-    assert game.moveIndex == 2
-    webApp.chessMove("d2d3")
-    assert game.moveIndex == 3
-    webApp.chessTakeback()
-    assert game.moveIndex == 2
-    webApp.chessSave()
+    try:
+        WebApp.index = Mock(return_value="")
+        game = webApp.game
+        fen = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq -'
+        webApp.chessFEN(fen)
+        assert game.fen == fen
+        assert game.moveIndex == 0
+        webApp.chessMove("e2e4")
+        assert game.moveIndex == 1
+        webApp.chessMove("e7e5")
+        assert game.moveIndex == 2
+        webApp.chessMove("d2d3")
+        assert game.moveIndex == 3
+        webApp.chessTakeback()
+        assert game.moveIndex == 2
+        webApp.chessSave()
+    finally:
+        webApp.close()
   
 
+def test_GameStateETag():
+    from pcwawc import webchesscam
+    webchesscam.webApp = WebApp(WebChessCamArgs([]).args)
+    try:
+        client = webchesscam.app.test_client()
+        response = client.get("/chess/game001/state")
+        assert response.status_code == 200
+        etag = response.headers["ETag"]
+        # the state did not change
+        response = client.get("/chess/game001/state", headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        webchesscam.webApp.board.move("e2e4")
+        response = client.get("/chess/game001/state", headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.headers["ETag"] != etag
+        assert response.json["pgn"].endswith("1. e4 *")
+        # direct changes of the chessboard are noticed on the first poll
+        etag = response.headers["ETag"]
+        webchesscam.webApp.board.chessboard.push_san("e5")
+        response = client.get("/chess/game001/state", headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.json["pgn"].endswith("1. e4 e5 *")
+    finally:
+        webchesscam.webApp.close()
+
+
 test_Game001()
 test_WebCamGame()
 test_WebCamGames()
 test_WebApp()
+test_GameStateETag()
@@ -0,0 +1,153 @@
+#!/usr/bin/python3
+# part of https://github.com/WolfgangFahl/play-chess-with-a-webcam
+from pcwawc.Board import Board
+from pcwawc.Environment import Environment
+from pcwawc.Game import WebCamGame
+from pcwawc.GameJournal import GameJournal
+from pcwawc.GameSaver import GameSaver
+from pcwawc.WebApp import WebApp
+from pcwawc.webchesscam import WebChessCamArgs
+import os
+import shutil
+
+
+def newJournal(gameid, gameSaver=None):
+    """ get a journal for a new game with the given id without any previous journal entries """
+    webCamGame = WebCamGame(gameid)
+    journal = GameJournal(webCamGame, Board(), "testGames", gameSaver)
+    journal.create()
+    return journal
+
+
+def recover(gameid):
+    """ recover the game with the given id from its save and journal """
+    webCamGame = WebCamGame.readJson(WebCamGame(gameid).saveDir("testGames") + "/" + gameid + "-webcamgame")
+    if webCamGame is None:
+        webCamGame = WebCamGame(gameid)
+    journal = GameJournal(webCamGame, Board(), "testGames")
+    replayed = journal.replay()
+    return journal, replayed
+
+
+def journalLines(journal):
+    with open(journal.fileName()) as journalFile:
+        return len(journalFile.readlines())
+
+
+def test_GameJournal():
+    journal = newJournal("journal001")
+    for move in ["e2e4", "e7e5", "g1f3", "b8c6"]:
+        journal.move(move)
+    journal.takeback()
+    journal.webCamGame.warp.addPoint(10, 20)
+    journal.warp(journal.webCamGame.warp)
+    assert journalLines(journal) == 6
+    # compaction writes the save and empties the journal
+    journal.save()
+    assert journalLines(journal) == 0
+    for move in ["b8c6", "f1b5"]:
+        journal.move(move)
+    assert journalLines(journal) == 2
+    recovered, replayed = recover("journal001")
+    assert replayed == 2
+    assert recovered.board.fen() == journal.board.fen()
+    assert recovered.webCamGame.game.fen == journal.webCamGame.game.fen
+    assert recovered.webCamGame.game.moveIndex == 5
+    assert recovered.webCamGame.warp.pointList == [[10, 20]]
+    assert "3. Bb5" in recovered.board.getPgn()
+
+
+def test_GameJournalCompaction():
+    GameJournal.compactAfter = 4
+    gameSaver = GameSaver(delay=0.05).start()
+    journal = newJournal("journal002", gameSaver)
+    journal.setFEN("8/8/8/8/8/8/8/4K2k")
+    for move in ["e1e2", "h1h2", "e2e3", "h2h3", "e3e4"]:
+        journal.move(move)
+    gameSaver.stop()
+    GameJournal.compactAfter = 100
+    # the journal has been compacted in the background
+    assert gameSaver.saves >= 1
+    assert journalLines(journal) < 6
+    recovered, replayed = recover("journal002")
+    assert recovered.board.fen() == "8/8/8/8/4K3/7k/8/8"
+    assert recovered.webCamGame.game.moveIndex == 5
+
+
+def test_NewGameJournal():
+    """ a new game with the id of an earlier game does not continue its journal """
+    journal = newJournal("journal003")
+    for move in ["e2e4", "e7e5"]:
+        journal.move(move)
+    journal = newJournal("journal003")
+    journal.move("d2d4")
+    assert journalLines(journal) == 1
+    assert journal.index == 1
+    recovered, replayed = recover("journal003")
+    assert replayed == 1
+    assert recovered.board.fen() == journal.board.fen()
+
+
+def test_GameJournalFirstSave():
+    """ a game that has never been saved is saved with its first journal entry """
+    gameSaver = GameSaver(delay=0.05).start()
+    journal = newJournal("journal004", gameSaver)
+    savedir = journal.webCamGame.saveDir("testGames")
+    jsonFile = savedir + "/journal004-webcamgame.json"
+    if os.path.isfile(jsonFile):
+        os.remove(jsonFile)
+    journal.move("e2e4")
+    journal.move("e7e5")
+    gameSaver.stop()
+    savedGame = WebCamGame.readJson(jsonFile)
+    assert savedGame is not None
+    assert savedGame.journalIndex >= 1
+    recovered, replayed = recover("journal004")
+    assert recovered.board.fen() == journal.board.fen()
+
+
+def test_PreJournalSave():
+    """ a game saved before there was a journal can be continued """
+    webCamGame = WebCamGame.readJson(Environment().testMedia + "chessBoard001-webcamgame")
+    assert not hasattr(webCamGame, "journalIndex")
+    gameSaver = GameSaver(delay=0.05).start()
+    journal = GameJournal(webCamGame, Board(), "testGames", gameSaver)
+    journal.replay()
+    journal.create()
+    journal.setFEN("8/8/8/8/8/8/8/4K2k w - - 0 1")
+    journal.move("e1e2")
+    gameSaver.stop()
+    # the first entry leads to a save of the game
+    assert gameSaver.saves >= 1
+    recovered, replayed = recover("chessBoard001")
+    assert recovered.index == 2
+    assert recovered.board.fen() == "8/8/8/8/8/8/4K3/7k"
+
+
+def test_WebAppRecovery():
+    """ a game that crashed before its first save is recovered from its journal alone """
+    gameid = "journal005"
+    webCamGame = WebCamGame(gameid)
+    savedir = webCamGame.saveDir()
+    shutil.rmtree(savedir)
+    journal = GameJournal(webCamGame, Board())
+    for move in ["e2e4", "e7e5", "g1f3"]:
+        journal.move(move)
+    assert not os.path.isfile(savedir + "/" + gameid + "-webcamgame.json")
+    for game in [gameid, gameid + "/" + gameid + "-webcamgame"]:
+        webApp = WebApp(WebChessCamArgs(["--game", game]).args)
+        try:
+            assert webApp.webCamGame.gameid == gameid
+            assert webApp.board.fen() == journal.board.fen()
+            assert webApp.game.moveIndex == 3
+        finally:
+            webApp.close()
+    shutil.rmtree(savedir)
+
+
+test_GameJournal()
+test_GameJournalCompaction()
+test_NewGameJournal()
+test_GameJournalFirstSave()
+test_PreJournalSave()
+test_WebAppRecovery()
@@ -0,0 +1,61 @@
+#!/usr/bin/python3
+# part of https://github.com/WolfgangFahl/play-chess-with-a-webcam
+from pcwawc.Game import WebCamGame
+from pcwawc.GameSaver import GameSaver
+from timeit import default_timer as timer
+import logging.handlers
+import time
+
+
+def test_GameSaver():
+    saver = GameSaver(delay=0.2).start()
+    webCamGame = WebCamGame("gameSaver001")
+    jsonFile = webCamGame.saveDir("testGames") + "/gameSaver001-webcamgame"
+    start = timer()
+    # rapid warp point clicks
+    for click in range(10):
+        webCamGame.warp.addPoint(click, click)
+        saver.save(webCamGame, "testGames")
+    elapsed = timer() - start
+    print ("marking 10 changes took %.4f s" % (elapsed))
+    assert saver.saves == 0
+    time.sleep(0.5)
+    # the changes have been coalesced into a single save
+    assert saver.saves == 1
+    savedGame = WebCamGame.readJson(jsonFile)
+    assert savedGame.warp.pointList == webCamGame.warp.pointList
+    # stopping saves the pending changes
+    webCamGame.game.fen = "8/8/8/8/8/8/8/8 w - -"
+    saver.save(webCamGame, "testGames")
+    saver.stop()
+    assert not saver.thread.is_alive()
+    assert saver.saves == 2
+    savedGame = WebCamGame.readJson(jsonFile)
+    assert savedGame.game.fen == webCamGame.game.fen
+
+
+class FailingGame(object):
+    """ a game that can not be saved """
+    gameid = "failingGame001"
+
+    def save(self, path):
+        raise Exception("disk full")
+
+
+def test_GameSaverError():
+    """ a failing save is logged and does not stop the saver """
+    handler = logging.handlers.BufferingHandler(10)
+    logger = logging.getLogger("test_GameSaver")
+    logger.addHandler(handler)
+    saver = GameSaver(logger=logger)
+    saver.save(FailingGame(), "testGames")
+    saver.flush()
+    assert saver.saves == 0
+    assert len(handler.buffer) == 1
+    assert "failingGame001" in handler.buffer[0].getMessage()
+    assert str(handler.buffer[0].exc_info[1]) == "disk full"
+    logger.removeHandler(handler)
+
+
+test_GameSaver()
+test_GameSaverError()
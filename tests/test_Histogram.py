@@ -9,13 +9,16 @@ testEnv = Environment4Test()
 
 def test_Histogram():
     webApp = WebApp(WebChessCamArgs([]).args)
+    try:
 
-    histogram=PlotLib("Chessboard Colors",PlotLib.A4(turned=True))
-    for imageInfo in testEnv.imageInfos:
-        bgr=testEnv.loadFromImageInfo(webApp,imageInfo)
-        rgb=cv2.cvtColor(bgr,cv2.COLOR_BGR2RGB)
-        histogram.addPlot(rgb,imageInfo['title'])
-    histogram.createHistogramPDF('/tmp/chessboardColors',plotType=PlotType.HISTOGRAMM,infos={'Title': 'Chessboard Histogram'})
+        histogram=PlotLib("Chessboard Colors",PlotLib.A4(turned=True))
+        for imageInfo in testEnv.imageInfos:
+            bgr=testEnv.loadFromImageInfo(webApp,imageInfo)
+            rgb=cv2.cvtColor(bgr,cv2.COLOR_BGR2RGB)
+            histogram.addPlot(rgb,imageInfo['title'])
+        histogram.createHistogramPDF('/tmp/chessboardColors',plotType=PlotType.HISTOGRAMM,infos={'Title': 'Chessboard Histogram'})
+    finally:
+        webApp.close()
 
 def test_A4():
     a4=PlotLib.A4()
@@ -0,0 +1,32 @@
+#!/usr/bin/python3
+# part of https://github.com/WolfgangFahl/play-chess-with-a-webcam
+from pcwawc.MovementDetector import MovementDetector
+from pcwawc.Cell import Cell
+from pcwawc.Video import Video
+from timeit import default_timer as timer
+import numpy as np
+import cv2
+
+
+def test_CellSums():
+    np.random.seed(1)
+    diff = np.random.randint(0, 256, size=(960, 1280, 3)).astype(np.uint8)
+    # cells as used by the StateDetector, full squares and overlapping cells - summed per cell and via the integral image
+    for width, height, integralCoverage in [(52, 46, 8), (130, 115, 8), (150, 130, 8), (52, 46, 0), (150, 130, 0)]:
+        MovementDetector.integralCoverage = integralCoverage
+        board = {}
+        for row in range(8):
+            for col in range(8):
+                board["%s%d" % ("abcdefgh"[col], row + 1)] = Cell((100 + col * 130, 20 + row * 115, width, height))
+        # a cell reaching out of the image
+        board["h8"] = Cell((1250, 930, width, height))
+        start = timer()
+        cellSums = MovementDetector.getCellSums(board, diff)
+        print ("%.4fs for %d cell sums of %dx%d with integral coverage %d" % (timer() - start, len(cellSums), width, height, integralCoverage))
+        for key, cell in board.items():
+            region = Video.getSubRect(diff, cell.GetCoords())
+            assert cellSums[key] == sum(cv2.integral(np.asarray(region))[-1][-1])
+    MovementDetector.integralCoverage = 8
+
+
+test_CellSums()
@@ -1,6 +1,7 @@
 #!/usr/bin/python3
 # part of https://github.com/WolfgangFahl/play-chess-with-a-webcam
-from pcwawc.RunningStats import RunningStats, ColorStats, MovingAverage
+from pcwawc.RunningStats import RunningStats, ColorStats, MovingAverage, MinMaxStats, RunningStatsArray
+import numpy as np
 import pytest
 
 def test_RunningStats():
@@ -48,7 +49,84 @@ def test_MovingAverage():
         print ("%d: %f %f" % (index,value,ma.mean()))
         assert means[index]==ma.mean()
         index+=1
+
+def test_PushArrayAndMerge():
+    values=np.random.uniform(0,255,1000)
+    for statsClass in [RunningStats,MinMaxStats]:
+        pushed=statsClass()
+        for value in values:
+            pushed.push(value)
+        batch=statsClass()
+        batch.push_array(values)
+        # merge statistics of parts e.g. calculated in different threads
+        merged=statsClass()
+        for part in np.array_split(values,7):
+            partStats=statsClass()
+            partStats.push_array(part)
+            merged.merge(partStats)
+        merged.merge(statsClass())
+        for stats in [batch,merged]:
+            assert stats.n==pushed.n
+            assert stats.mean()==pytest.approx(pushed.mean(),rel=1E-12)
+            assert stats.variance()==pytest.approx(pushed.variance(),rel=1E-9)
+            if statsClass==MinMaxStats:
+                assert stats.min==pushed.min
+                assert stats.max==pushed.max
+    pixels=np.random.randint(0,256,(20,30,3))
+    colorStats=ColorStats()
+    for pixel in pixels.reshape(-1,3):
+        colorStats.push(*pixel)
+    batchColorStats=ColorStats()
+    batchColorStats.push_array(pixels[:10])
+    otherColorStats=ColorStats()
+    otherColorStats.push_array(pixels[10:])
+    batchColorStats.merge(otherColorStats)
+    assert batchColorStats.mean()==pytest.approx(colorStats.mean(),rel=1E-12)
+    assert batchColorStats.variance()==pytest.approx(colorStats.variance(),rel=1E-9)
+    # merging into cleared statistics
+    rs=RunningStats()
+    rs.push_array([1,2,3,4])
+    rs.clear()
+    rs.push(5.0)
+    other=RunningStats()
+    other.push_array([7.0,9.0])
+    rs.merge(other)
+    assert rs.n==3
+    assert rs.mean()==7.0
+    assert rs.variance()==4.0
+    
+def test_RunningStatsArray():
+    """ check the elementwise statistics of an array against RunningStats for each element """
+    statsArray=RunningStatsArray((3,4))
+    statsList=[[RunningStats() for col in range(4)] for row in range(3)]
+    for frame in range(20):
+        values=np.random.uniform(0,10,(3,4))
+        mask=np.random.uniform(0,1,(3,4))<0.7
+        if frame==10:
+            # clear a single element via its view
+            statsArray.element((1,2)).clear()
+            statsList[1][2].clear()
+        if frame%3==0:
+            # push to a single element via its view
+            statsArray.element((0,0)).push(values[0,0])
+            statsList[0][0].push(values[0,0])
+        statsArray.push(values,mask)
+        for row,col in zip(*np.nonzero(mask)):
+            statsList[row][col].push(values[row,col])
+    means=statsArray.mean()
+    variances=statsArray.variance()
+    for row in range(3):
+        for col in range(4):
+            stats=statsList[row][col]
+            element=statsArray.element((row,col))
+            assert element.n==stats.n
+            assert means[row,col]==pytest.approx(stats.mean(),rel=1E-12)
+            assert element.mean()==pytest.approx(stats.mean(),rel=1E-12)
+            assert variances[row,col]==pytest.approx(stats.variance(),rel=1E-9)
+            assert element.variance()==pytest.approx(stats.variance(),rel=1E-9)
     
 test_RunningStats()
 test_ColorStats()
 test_MovingAverage()
+test_PushArrayAndMerge()
+test_RunningStatsArray()
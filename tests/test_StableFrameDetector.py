@@ -0,0 +1,68 @@
+#!/usr/bin/python3
+# part of https://github.com/WolfgangFahl/play-chess-with-a-webcam
+from pcwawc.StableFrameDetector import StableFrameDetector, StableFrameCalibration
+from timeit import default_timer as timer
+import numpy as np
+import cv2
+import pytest
+import tempfile
+
+
+def noisyFrame(square=None, width=1920, height=1080):
+    """ get a frame with camera like noise and optionally a moving square e.g. a hand over the board """
+    frame = np.full((height, width, 3), 128, np.uint8)
+    cv2.randn(frame, (128, 128, 128), (4, 4, 4))
+    if square is not None:
+        cv2.rectangle(frame, (square, 200), (square + 300, 500), (40, 60, 200), -1)
+    return frame
+
+
+def test_StableFrameDetector():
+    detector = StableFrameDetector(stableFrames=3)
+    threshold = detector.calibrate([noisyFrame() for i in range(10)])
+    print ("calibrated threshold %.3f" % threshold)
+    # a still scene gets stable after three frames
+    stable = [detector.push(noisyFrame()) for i in range(5)]
+    assert stable == [False, False, True, True, True]
+    # a moving hand makes the frames unstable immediately
+    for square in range(100, 1000, 150):
+        assert not detector.push(noisyFrame(square))
+    # the hand left the board - the ring still has the hand for a few frames
+    frames = [noisyFrame() for i in range(10)]
+    start = timer()
+    stable = [detector.push(frame) for frame in frames]
+    print ("%.4f s per frame" % ((timer() - start) / len(frames)))
+    firstStable = stable.index(True)
+    assert firstStable <= len(detector.ring) + detector.stableFrames
+    assert all(stable[firstStable:])
+
+
+def test_StableFrameCalibration():
+    path = tempfile.gettempdir() + "/pcwawc-calibration"
+    for device in ["0", "/tmp/chessVideo.mp4"]:
+        calibration = StableFrameCalibration(device, 1.25)
+        calibration.save(path)
+        loaded = StableFrameCalibration.load(path, device)
+        assert loaded.device == device
+        assert loaded.threshold == 1.25
+    assert StableFrameCalibration.load(path, "unknown") is None
+    # a threshold that is not finite is neither saved nor loaded
+    calibration = StableFrameCalibration("1", float("nan"))
+    with pytest.raises(Exception):
+        calibration.save(path)
+    calibration.writeYaml(StableFrameCalibration.fileName(path, "1"))
+    assert StableFrameCalibration.load(path, "1") is None
+
+
+def test_CalibrateTooFewFrames():
+    """ a calibration needs at least two frames to get a difference from """
+    detector = StableFrameDetector()
+    for frames in [[], [noisyFrame()]]:
+        with pytest.raises(Exception):
+            detector.calibrate(frames)
+        assert detector.threshold is None
+
+
+test_StableFrameDetector()
+test_StableFrameCalibration()
+test_CalibrateTooFewFrames()
@@ -3,6 +3,9 @@
 from pcwawc.StateDetector import StateDetector
 from pcwawc.StateDetector import  CannotBuildStateException
 from pcwawc.Environment4Test import Environment4Test
+from pcwawc.mathUtils import intersectHoughLines, intersectHoughLinesArray, uniquePoints, distance
+from timeit import default_timer as timer
+import numpy as np
 
 testEnv = Environment4Test()
 
@@ -18,5 +21,36 @@ def test_StateDetector():
             print(cbse)
             pass
 
+# test the vectorized line intersection against the pairwise one
+def test_IntersectHoughLines():
+    np.random.seed(42)
+    lines = np.random.randint(0, 640, size=(120, 1, 4)).astype(np.int32)
+    # add a parallel and an identical line
+    lines[1] = lines[0] + 10
+    lines[2] = lines[0]
+    expected = []
+    for lineIndex in range(len(lines)):
+        for crosslineIndex in range(lineIndex + 1, len(lines)):
+            intersect = intersectHoughLines(lines[lineIndex].astype(np.int64), lines[crosslineIndex].astype(np.int64))
+            if intersect is not None:
+                expected.append(intersect)
+    points = intersectHoughLinesArray(lines)
+    assert [tuple(point) for point in points.tolist()] == expected
+    threshold = 60
+    kept = []
+    for point in expected:
+        if all(distance(point, keptPoint) >= threshold for keptPoint in kept):
+            kept.append(point)
+    assert uniquePoints(points, threshold) == kept
+    # more lines than the former limit of 1000
+    lines = np.random.randint(0, 1920, size=(2000, 4)).astype(np.int32)
+    start = timer()
+    points = intersectHoughLinesArray(lines)
+    inside = (points[:, 0] > 0) & (points[:, 1] > 0) & (points[:, 0] < 1920) & (points[:, 1] < 1080)
+    intersects = uniquePoints(points[inside], threshold)
+    print ("%.3fs for %d intersects of %d lines" % (timer() - start, len(intersects), len(lines)))
+    assert len(intersects) > 0
 
+
+test_IntersectHoughLines()
 test_StateDetector()
@@ -1,6 +1,7 @@
 # part of https://github.com/WolfgangFahl/play-chess-with-a-webcam
-from pcwawc.Video import Video
+from pcwawc.Video import Video, VideoStream
 import sys
+import time
 
 
 # test reading an example video
@@ -82,8 +83,41 @@ def test_device():
     assert v0 == 0
 
 
+# test reading an example video with a capture thread
+def test_VideoStream():
+    for policy in [VideoStream.BLOCK, VideoStream.DROP_OLDEST]:
+        video = Video()
+        video.open('testMedia/emptyBoard001.avi')
+        stream = VideoStream(video, ringSize=3, policy=policy)
+        assert stream.readLatest() == (None, None)
+        stream.start()
+        frames = 0
+        previousTimestamp = 0
+        while True:
+            frame, timestamp = stream.read(timeout=5)
+            if frame is None:
+                break
+            height, width = frame.shape[:2]
+            assert (width, height) == (640, 480)
+            assert timestamp >= previousTimestamp
+            previousTimestamp = timestamp
+            frames = frames + 1
+            # simulate a consumer that is slower than the capture
+            time.sleep(0.02)
+        print ("%s: read %d frames dropped %d" % (policy, frames, stream.dropped))
+        assert video.frames == 52
+        assert frames + stream.dropped == 52
+        if policy == VideoStream.BLOCK:
+            assert stream.dropped == 0
+        # the latest frame is still available after the video ended
+        frame, timestamp = stream.readLatest()
+        assert frame is not None
+        assert timestamp == previousTimestamp or policy == VideoStream.DROP_OLDEST
+
+
 if len(sys.argv) >= 2:
     test_device()
+    test_VideoStream()
     test_ReadVideoWithPostProcess()
     test_ReadVideoWithPause()
     test_ReadJpg()
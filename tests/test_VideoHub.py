@@ -0,0 +1,73 @@
+#!/usr/bin/python3
+# part of https://github.com/WolfgangFahl/play-chess-with-a-webcam
+from pcwawc.Video import Video, VideoStream
+from pcwawc.VideoHub import VideoHub
+from threading import Thread
+import logging.handlers
+import numpy as np
+import time
+
+
+class Client(object):
+    """ a client of the video hub that needs the given time per part """
+
+    def __init__(self, hub, delay):
+        self.parts = []
+        self.thread = Thread(target=self.receive, args=(hub, delay))
+
+    def receive(self, hub, delay):
+        for part in hub.parts():
+            self.parts.append(part)
+            time.sleep(delay)
+
+
+def test_VideoHub():
+    video = Video()
+    video.open('testMedia/emptyBoard001.avi')
+    processed = []
+
+    def postProcess(frame):
+        processed.append(frame)
+        return frame
+
+    stream = VideoStream(video, policy=VideoStream.BLOCK).start()
+    hub = VideoHub(stream, postProcess=postProcess).start()
+    fastClient = Client(hub, 0)
+    slowClient = Client(hub, 0.05)
+    for client in [fastClient, slowClient]:
+        client.thread.start()
+    for client in [fastClient, slowClient]:
+        client.thread.join(timeout=30)
+    print ("processed %d frames - the clients received %d and %d parts" % (len(processed), len(fastClient.parts), len(slowClient.parts)))
+    assert video.frames == 52
+    # each frame is processed and encoded once for all clients
+    assert len(processed) == hub.index
+    assert len(fastClient.parts) <= hub.index
+    # the slow client skips to the newest frame
+    assert len(slowClient.parts) < len(fastClient.parts)
+    assert slowClient.parts[-1] is fastClient.parts[-1]
+    assert fastClient.parts[-1].startswith(b'--frame\r\n')
+    assert hub.subscribers == 0
+
+
+def test_VideoHubError():
+    """ a failing post processing is logged and the frame is published unprocessed """
+    video = Video()
+    video.open('testMedia/emptyBoard001.avi')
+    handler = logging.handlers.BufferingHandler(10)
+    logger = logging.getLogger("test_VideoHub")
+    logger.addHandler(handler)
+
+    def postProcess(frame):
+        raise Exception("postProcess failed")
+
+    hub = VideoHub(VideoStream(video), postProcess=postProcess, logger=logger)
+    frame = np.zeros((10, 10, 3), np.uint8)
+    assert hub.processFrame(frame) is frame
+    assert len(handler.buffer) == 1
+    assert str(handler.buffer[0].exc_info[1]) == "postProcess failed"
+    logger.removeHandler(handler)
+
+
+test_VideoHub()
+test_VideoHubError()
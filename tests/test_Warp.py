@@ -3,6 +3,10 @@
 from pcwawc.WebApp import Warp
 from pcwawc.YamlAbleMixin import YamlAbleMixin
 from pcwawc.JsonAbleMixin import JsonAbleMixin
+from pcwawc.Video import Video
+from imutils import perspective
+import cv2
+import numpy as np
 import tempfile
 
 debug = False
@@ -55,6 +59,39 @@ def test_Persistence():
     assert jwarp.pointList == warp.pointList
 
 
+def test_Transformation():
+    video = Video()
+    image = video.readImage("testMedia/chessBoard001.jpg")
+    height, width = image.shape[:2]
+    warp = Warp([])
+    for px, py in [(0.2, 0.1), (0.9, 0.15), (0.8, 0.95), (0.1, 0.8)]:
+        warp.addPoint(int(px * width), int(py * height))
+    for angle in [0, 90, 90, 90]:
+        warp.rotate(angle)
+        matrix, size = warp.transformation()
+        # the matrix is cached until the rotation changes
+        assert warp.transformation()[0] is matrix
+        fused = video.transform(image, matrix, size)
+        # warp, resize and rotate one after the other
+        warped = perspective.four_point_transform(image, warp.points)
+        side = min(warped.shape[:2])
+        expected = cv2.resize(warped, (side, side))
+        if warp.rotation > 0:
+            expected = video.rotate(expected, warp.rotation)
+        assert fused.shape == expected.shape
+        # compare inside a margin that might be cut differently by the rotation
+        margin = 2
+        diff = cv2.absdiff(fused, expected)[margin:-margin, margin:-margin]
+        print ("rotation %3d: mean difference %.2f" % (warp.rotation, np.mean(diff)))
+        assert np.mean(diff) < 3
+    # a new point invalidates the cached transformation
+    warp.addPoint(0, 0)
+    assert warp.transform is None
+    # the cached transformation is not persisted
+    assert "transform" not in warp.asJson()
+
+
 test_Rotation()
 test_WarpPoints()
 test_Persistence()
+test_Transformation()
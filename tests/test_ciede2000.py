@@ -0,0 +1,84 @@
+#!/usr/bin/python3
+# part of https://github.com/WolfgangFahl/play-chess-with-a-webcam
+from pcwawc import ciede2000
+import numpy as np
+import pytest
+
+# test data of Sharma, Wu and Dalal: The CIEDE2000 Color-Difference Formula - Implementation Notes, Supplementary Test Data, and Mathematical Observations
+# see http://www2.ece.rochester.edu/~gsharma/ciede2000/
+sharmaPairs=[
+    ((50.0000, 2.6772, -79.7751),(50.0000, 0.0000, -82.7485),2.0425),
+    ((50.0000, 3.1571, -77.2803),(50.0000, 0.0000, -82.7485),2.8615),
+    ((50.0000, 2.8361, -74.0200),(50.0000, 0.0000, -82.7485),3.4412),
+    ((50.0000, -1.3802, -84.2814),(50.0000, 0.0000, -82.7485),1.0000),
+    ((50.0000, -1.1848, -84.8006),(50.0000, 0.0000, -82.7485),1.0000),
+    ((50.0000, -0.9009, -85.5211),(50.0000, 0.0000, -82.7485),1.0000),
+    ((50.0000, 0.0000, 0.0000),(50.0000, -1.0000, 2.0000),2.3669),
+    ((50.0000, -1.0000, 2.0000),(50.0000, 0.0000, 0.0000),2.3669),
+    ((50.0000, 2.4900, -0.0010),(50.0000, -2.4900, 0.0009),7.1792),
+    ((50.0000, 2.4900, -0.0010),(50.0000, -2.4900, 0.0010),7.1792),
+    ((50.0000, 2.4900, -0.0010),(50.0000, -2.4900, 0.0011),7.2195),
+    ((50.0000, 2.4900, -0.0010),(50.0000, -2.4900, 0.0012),7.2195),
+    ((50.0000, -0.0010, 2.4900),(50.0000, 0.0009, -2.4900),4.8045),
+    ((50.0000, -0.0010, 2.4900),(50.0000, 0.0010, -2.4900),4.8045),
+    ((50.0000, -0.0010, 2.4900),(50.0000, 0.0011, -2.4900),4.7461),
+    ((50.0000, 2.5000, 0.0000),(50.0000, 0.0000, -2.5000),4.3065),
+    ((50.0000, 2.5000, 0.0000),(73.0000, 25.0000, -18.0000),27.1492),
+    ((50.0000, 2.5000, 0.0000),(61.0000, -5.0000, 29.0000),22.8977),
+    ((50.0000, 2.5000, 0.0000),(56.0000, -27.0000, -3.0000),31.9030),
+    ((50.0000, 2.5000, 0.0000),(58.0000, 24.0000, 15.0000),19.4535),
+    ((50.0000, 2.5000, 0.0000),(50.0000, 3.1736, 0.5854),1.0000),
+    ((50.0000, 2.5000, 0.0000),(50.0000, 3.2972, 0.0000),1.0000),
+    ((50.0000, 2.5000, 0.0000),(50.0000, 1.8634, 0.5757),1.0000),
+    ((50.0000, 2.5000, 0.0000),(50.0000, 3.2592, 0.3350),1.0000),
+    ((60.2574, -34.0099, 36.2677),(60.4626, -34.1751, 39.4387),1.2644),
+    ((63.0109, -31.0961, -5.8663),(62.8187, -29.7946, -4.0864),1.2630),
+    ((61.2901, 3.7196, -5.3901),(61.4292, 2.2480, -4.9620),1.8731),
+    ((35.0831, -44.1164, 3.7933),(35.0232, -40.0716, 1.5901),1.8645),
+    ((22.7233, 20.0904, -46.6940),(23.0331, 14.9730, -42.5619),2.0373),
+    ((36.4612, 47.8580, 18.3852),(36.2715, 50.5065, 21.2231),1.4146),
+    ((90.8027, -2.0831, 1.4410),(91.1528, -1.6435, 0.0447),1.4441),
+    ((90.9257, -0.5406, -0.9208),(88.6381, -0.8985, -0.7239),1.5381),
+    ((6.7747, -0.2908, -2.4247),(5.8714, -0.0985, -2.2286),0.6377),
+    ((2.0776, 0.0795, -1.1350),(0.9033, -0.0636, -0.5514),0.9082)
+]
+
+# LAB values of the original scalar implementation
+rgbLabs=[
+    ((255,0,0),(53.232882, 80.10931, 67.220068)),
+    ((0,255,0),(87.737033, -86.184636, 83.181165)),
+    ((0,0,255),(32.302587, 79.196662, -107.863681)),
+    ((128,128,128),(53.585013, 0.003156, -0.006244)),
+    ((200,150,50),(65.217627, 9.332403, 57.031594)),
+    ((12,34,56),(12.65719, 0.126098, -16.835913)),
+    ((127.5,64.25,3.75),(34.505929, 23.691982, 43.362561))
+]
+
+def test_ciede2000():
+    lab1s=np.array([pair[0] for pair in sharmaPairs])
+    lab2s=np.array([pair[1] for pair in sharmaPairs])
+    expected=np.array([pair[2] for pair in sharmaPairs])
+    deltas=ciede2000.ciede2000Array(lab1s,lab2s)
+    assert deltas==pytest.approx(expected,abs=1E-4)
+    # the difference is symmetric and zero for equal colors
+    assert ciede2000.ciede2000Array(lab2s,lab1s)==pytest.approx(expected,abs=1E-4)
+    assert ciede2000.ciede2000Array(lab1s,lab1s)==pytest.approx(np.zeros(len(sharmaPairs)),abs=1E-9)
+    for lab1,lab2,delta in sharmaPairs:
+        assert ciede2000.ciede2000(lab1,lab2)==pytest.approx(delta,abs=1E-4)
+
+def test_rgb2lab():
+    for rgb,lab in rgbLabs:
+        assert ciede2000.rgb2lab(rgb)==pytest.approx(lab,abs=1E-5)
+    # 8-bit values are linearized via the lookup table, others by the formula
+    rgbs=np.array([rgb for rgb,lab in rgbLabs[:-1]])
+    labs=np.array([lab for rgb,lab in rgbLabs[:-1]])
+    assert ciede2000.rgb2labArray(rgbs)==pytest.approx(labs,abs=1E-5)
+    assert ciede2000.rgb2labArray(rgbs.astype(np.float64))==pytest.approx(labs,abs=1E-5)
+    assert ciede2000.rgb2lab((255,255,255))==pytest.approx([100,0,0],abs=0.02)
+    assert ciede2000.rgb2lab((0,0,0))==pytest.approx([0,0,0],abs=1E-9)
+    # a single reference color is broadcast to all colors
+    deltas=ciede2000.ciede2000FromRGBArray(rgbs,(0,0,0))
+    assert deltas==pytest.approx([ciede2000.ciede2000(lab,(0,0,0)) for lab in labs],abs=1E-4)
+
+test_ciede2000()
+test_rgb2lab()
@@ -4,6 +4,9 @@ from pcwawc.BoardFinder import BoardFinder
 from pcwawc.Video import Video
 from pcwawc.Environment4Test import Environment4Test
 from pcwawc.mathUtils import getIndexRange
+from timeit import default_timer as timer
+import numpy as np
+import cv2
 
 testEnv = Environment4Test()
 
@@ -40,6 +43,111 @@ def test_houghTransform():
         video.showImage(image, "hough lines", True, 500)
 
 
+# test the hough transform on a downscaled image
+def test_houghPyramid():
+    video = Video()
+    for index in [0, 4, 6]:
+        image = testEnv.getImage(index + 1)
+        h, w = image.shape[:2]
+        fullLines = video.houghTransform(image).reshape(-1, 2)
+        for pyramidLevels in [1, 2]:
+            exactLines = {}
+            for refine in [False, True]:
+                start = timer()
+                lines = video.houghTransform(image, pyramidLevels, refine).reshape(-1, 2)
+                segments = video.houghTransformP(image, pyramidLevels, refine).reshape(-1, 4)
+                print ("%d lines and %d segments in %.4fs at pyramid level %d refined %r" % (len(lines), len(segments), timer() - start, pyramidLevels, refine))
+                # the number of lines stays comparable
+                assert len(fullLines) / 2 <= len(lines) <= len(fullLines) * 2
+                assert (segments[:, [0, 2]] <= w + 2).all() and (segments[:, [1, 3]] <= h + 2).all()
+                # count the lines that are found at full resolution with exactly the same rho
+                nearLines = 0
+                exactLines[refine] = 0
+                for rho, theta in lines:
+                    sameTheta = np.abs(fullLines[:, 1] - theta) < np.pi / 180 / 2
+                    rhoDiffs = np.abs(fullLines[sameTheta, 0] - rho)
+                    if (rhoDiffs <= 2 ** pyramidLevels).any():
+                        nearLines += 1
+                        if rhoDiffs.min() < 0.5:
+                            exactLines[refine] += 1
+            assert exactLines[True] >= nearLines * 0.85
+            assert exactLines[True] >= exactLines[False]
+
+
+# test the histogram orientation estimator against the Parzen window one
+def test_orientationEstimators():
+    video = Video()
+    for index in range(0, 9):
+        image = testEnv.getImage(index + 1)
+        finder = BoardFinder(image)
+        lines = video.houghTransform(image)
+        thetas = lines.reshape(-1, 2)[:, 1]
+        start = timer()
+        parzenAngles = finder.parzenOrientation(thetas)
+        parzenTime = timer() - start
+        start = timer()
+        histogramAngles = finder.histogramOrientation(thetas)
+        histogramTime = timer() - start
+        print ("orientation %s in %.4fs for %d lines - Parzen %.4fs" % (histogramAngles, histogramTime, len(thetas), parzenTime))
+        assert histogramAngles == parzenAngles
+
+
+# test the histogram orientation estimator for lines near the zero angle
+def test_orientationNearZero():
+    """ lines that are all (nearly) vertical must not break the histogram orientation estimate """
+    finder = BoardFinder(np.zeros((100, 100, 3), np.uint8))
+    for thetas in [np.zeros(10), np.radians(np.array([0., 2.] * 6)), np.radians(np.array([0., 1., 3.] * 4)), np.zeros(0)]:
+        thetas = thetas.astype(np.float32)
+        assert finder.histogramOrientation(thetas) == finder.parzenOrientation(thetas)
+    # near zero thetas together with a second dominant angle
+    thetas = np.radians(np.array([0.] * 8 + [1.] * 2 + [90.] * 10)).astype(np.float32)
+    assert finder.histogramOrientation(thetas) == finder.parzenOrientation(thetas)
+
+
+def markerBoardImage(markerOffsets=((0, 0),) * 4, width=800, height=600):
+    """ get a slightly rotated synthetic chessboard image with four corner markers moved by the given offsets"""
+    image = np.full((height, width, 3), 128, np.uint8)
+    for row in range(8):
+        for col in range(8):
+            color = 230 if (row + col) % 2 == 0 else 40
+            cv2.rectangle(image, (200 + col * 50, 100 + row * 50), (249 + col * 50, 149 + row * 50), (color, color, color), -1)
+    for (x, y), (dx, dy) in zip(((185, 85), (615, 85), (185, 515), (615, 515)), markerOffsets):
+        cv2.circle(image, (x + dx, y + dy), 10, (180, 200, 40), -1)
+    rotation = cv2.getRotationMatrix2D((width / 2, height / 2), -5, 1)
+    return cv2.warpAffine(image, rotation, (width, height), borderValue=(128, 128, 128))
+
+
+# test tracking the corner markers between full detections
+def test_tracking():
+    BoardFinder.debug = False
+    finder = BoardFinder(markerBoardImage())
+    finder.prepare()
+    assert finder.markerSize is not None
+    BoardFinder.tracking = True
+    try:
+        for offsets, tracked in [(((0, 0),) * 4, True),
+                                 (((3, 2),) * 4, True),
+                                 (((0, 0), (0, 0), (0, 0), (60, 0)), False),
+                                 (((0, 0),) * 4, True)]:
+            start = timer()
+            finder.updateImage(markerBoardImage(offsets))
+            print ("tracked %r in %.4fs: %s" % (finder.tracked, timer() - start, finder.trackingFallback))
+            assert finder.tracked == tracked
+            assert (finder.trackingFallback is None) == tracked
+            for x, y in finder.boardCoordinates:
+                assert 0 <= x < 800 and 0 <= y < 600
+        assert finder.trackingFallbacks == 1
+        # a lost marker falls back to a full detection
+        image = markerBoardImage()
+        x, y = [int(c) for c in finder.boardCoordinates[0]]
+        cv2.circle(image, (x, y), 20, (128, 128, 128), -1)
+        finder.updateImage(image)
+        assert not finder.tracked
+        assert "lost" in finder.trackingFallback
+    finally:
+        BoardFinder.tracking = False
+
+
 def test_Dot():
     video = Video()
     dotImage = video.readImage(testEnv.testMedia+"greendot.jpg")
@@ -57,6 +165,10 @@ def test_histRange():
 
 
 test_histRange()
+test_houghPyramid()
+test_orientationEstimators()
+test_orientationNearZero()
+test_tracking()
 test_Dot()
 test_findBoard()
 test_getBlackMaxSide()
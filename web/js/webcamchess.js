@@ -19,6 +19,28 @@ function handleQuery() {
 	if (gameid==null)
 		gameid=document.getElementById("gameid")
 	updateGame(gameid)
+	subscribeGameEvents()
+}
+
+// update the game state when the server pushes moves and positions
+function subscribeGameEvents() {
+	if (typeof (EventSource) === "undefined")
+		return
+	var events = new EventSource('/chess/events')
+	var onState = function(event) {
+		setChessGameState(JSON.parse(event.data))
+	}
+	events.addEventListener('move', onState)
+	events.addEventListener('takeback', onState)
+	events.addEventListener('fen', onState)
+	// highlight the squares the webcam saw a piece move on until the board gets invalid again e.g. by a hand over it
+	events.addEventListener('pieceMoved', function(event) {
+		greySquare(JSON.parse(event.data).square)
+	})
+	events.addEventListener('detectState', function(event) {
+		if (!JSON.parse(event.data).valid)
+			removeGreySquares()
+	})
 }
 
 function updateGame(gameid) {